@@ -0,0 +1,200 @@
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import discord
+
+CACHE_SIZE = 512 # parsed events kept, keyed by (message id, edit time)
+
+_timestamp = re.compile(r"<t:(\d+)")
+_mention = re.compile(r"<@!?(\d+)>")
+_emoji = re.compile(r"<a?:(\w+):\d+>")
+_label = re.compile(r"[^\s]+?\s+(.+?)\s*\(\d+\)") # "<:accepted:123> Accepted (5)" -> "Accepted"
+
+@dataclass(frozen=True, slots=True)
+class RosterField:
+    status: str # emoji name of the field ("accepted", "declined", "tentative", role emojis ...), lowercase
+    label: str # field name without the emoji and the count
+    members: frozenset[int]
+
+@dataclass(frozen=True, slots=True)
+class EventRoster:
+    """
+    Signups of one Apollo event: the event time (from the first field) and the members of every status field.
+    """
+    message_id: int
+    event_time: datetime | None
+    fields: tuple[RosterField, ...]
+    _by_status: dict[str, frozenset[int]] = field(init=False, repr=False, compare=False)
+    _all_members: frozenset[int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # built once, memoized rosters answer every lookup without touching the fields again
+        by_status: dict[str, frozenset[int]] = {}
+        for roster_field in self.fields:
+            by_status[roster_field.status] = by_status.get(roster_field.status, frozenset()) | roster_field.members
+        object.__setattr__(self, "_by_status", by_status)
+        object.__setattr__(self, "_all_members", frozenset().union(*by_status.values()))
+
+    def members(self, status: str) -> frozenset[int]:
+        return self._by_status.get(status, frozenset())
+
+    @property
+    def accepted(self) -> frozenset[int]:
+        return self.members("accepted")
+
+    @property
+    def tentative(self) -> frozenset[int]:
+        return self.members("tentative")
+
+    @property
+    def declined(self) -> frozenset[int]:
+        return self.members("declined")
+
+    @property
+    def all_members(self) -> frozenset[int]:
+        """
+        Everyone who signed up with any status.
+        """
+        return self._all_members
+
+    def labels_of(self, member_id: int) -> list[str]:
+        return [roster_field.label for roster_field in self.fields if member_id in roster_field.members]
+
+def parse_embed(embed: discord.Embed, message_id: int) -> EventRoster:
+    """
+    Parses an Apollo event embed without the cache.
+    """
+    fields = embed.fields
+    event_time = None
+    if fields:
+        match = _timestamp.search(fields[0].value or "")
+        if match:
+            event_time = datetime.fromtimestamp(int(match.group(1)), tz=timezone.utc)
+    roster = []
+    for embed_field in fields:
+        name = embed_field.name or ""
+        if name.startswith("<t:"): # time field
+            continue
+        emoji = _emoji.search(name)
+        members = frozenset(int(member_id) for member_id in _mention.findall(embed_field.value or ""))
+        if emoji is None and not members: # description fields (time, links, ...)
+            continue
+        label_match = _label.search(name)
+        roster.append(RosterField(
+            status=emoji.group(1).lower() if emoji else name.strip().lower(),
+            label=label_match.group(1) if label_match else name.strip(),
+            members=members
+        ))
+    return EventRoster(message_id=message_id, event_time=event_time, fields=tuple(roster))
+
+def roster_rows(roster: EventRoster) -> set[tuple[int, str, str]]:
+    """
+    (member_id, status, label) of every signup, the ledger row shape.
+    """
+    return {(member_id, roster_field.status, roster_field.label) for roster_field in roster.fields for member_id in roster_field.members}
+
+def diff_rosters(previous: EventRoster | None, current: EventRoster) -> tuple[list[tuple[int, str, str]], list[tuple[int, str]]]:
+    """
+    Signups added (or relabeled) and removed between two versions of an event, as (member_id, status, label)
+    and (member_id, status).
+    """
+    current_rows = roster_rows(current)
+    previous_rows = roster_rows(previous) if previous else set()
+    current_keys = {(member_id, status) for member_id, status, _ in current_rows}
+    added = sorted(current_rows - previous_rows)
+    removed = sorted({(member_id, status) for member_id, status, _ in previous_rows} - current_keys)
+    return added, removed
+
+def roster_from_rows(message_id: int, event_time: datetime | None, rows: list[dict]) -> EventRoster:
+    """
+    EventRoster rebuilt from ledger rows (member_id, status, label).
+    """
+    grouped: dict[tuple[str, str], set[int]] = {}
+    for row in rows:
+        grouped.setdefault((row["status"], row["label"]), set()).add(row["member_id"])
+    if event_time is not None and event_time.tzinfo is None:
+        event_time = event_time.replace(tzinfo=timezone.utc) # stored as naive utc
+    return EventRoster(
+        message_id=message_id,
+        event_time=event_time,
+        fields=tuple(RosterField(status=status, label=label, members=frozenset(members)) for (status, label), members in grouped.items())
+    )
+
+_cache: OrderedDict[tuple[int, datetime | None], EventRoster] = OrderedDict()
+_hits = 0
+_misses = 0
+
+def parse_event(message: discord.Message) -> EventRoster | None:
+    """
+    EventRoster of an Apollo message, None if it has no embed. Memoized by (message id, edit time),
+    so the same event is parsed again only after Apollo edited it.
+    """
+    global _hits, _misses
+    if not message.embeds:
+        return None
+    key = (message.id, message.edited_at)
+    roster = _cache.get(key)
+    if roster is not None:
+        _cache.move_to_end(key)
+        _hits += 1
+        return roster
+    _misses += 1
+    roster = parse_embed(message.embeds[0], message.id)
+    _cache[key] = roster
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return roster
+
+def cache_info() -> dict:
+    return {"hits": _hits, "misses": _misses, "size": len(_cache), "max_size": CACHE_SIZE}
+
+def clear_cache():
+    global _hits, _misses
+    _cache.clear()
+    _hits = _misses = 0
+
+class RosterStore:
+    """
+    Newest known EventRoster per event message id, bounded LRU. Apollo edits replace the entry from the raw edit event,
+    so a lookup needs no REST call while the event stays unchanged.
+    """
+    def __init__(self, max_size: int = CACHE_SIZE, on_evict=None):
+        self.max_size = max_size
+        self.on_evict = on_evict # callable(message id) for entries dropped to stay within max_size
+        self._rosters: OrderedDict[int, tuple[datetime | None, EventRoster]] = OrderedDict() # message id -> (edited at, roster)
+
+    def __len__(self):
+        return len(self._rosters)
+
+    def __contains__(self, message_id: int):
+        return message_id in self._rosters
+
+    def get(self, message_id: int) -> EventRoster | None:
+        entry = self._rosters.get(message_id)
+        if entry is None:
+            return None
+        self._rosters.move_to_end(message_id)
+        return entry[1]
+
+    def update(self, message: discord.Message) -> tuple[EventRoster | None, EventRoster | None]:
+        """
+        Stores the roster of `message` unless a newer edit is stored already. Returns (previous roster, current roster).
+        """
+        previous = self._rosters.get(message.id)
+        if previous is not None and previous[0] and message.edited_at and message.edited_at < previous[0]:
+            return previous[1], previous[1] # late event of an older edit
+        roster = parse_event(message)
+        if roster is None:
+            self._rosters.pop(message.id, None)
+        else:
+            self._rosters[message.id] = (message.edited_at, roster)
+            self._rosters.move_to_end(message.id)
+            while len(self._rosters) > self.max_size:
+                evicted, _ = self._rosters.popitem(last=False)
+                if self.on_evict is not None:
+                    self.on_evict(evicted)
+        return (previous[1] if previous else None), roster
+
+    def forget(self, message_id: int):
+        self._rosters.pop(message_id, None)
@@ -0,0 +1,79 @@
+"""
+Benchmark of apollo_parser against the per-command string slicing it replaced.
+Usage: python benchmarks/apollo_parser_bench.py [fixture.json ...] (defaults to every json in benchmarks/fixtures)
+Fixtures are Apollo embeds as discord sends them (embed dicts).
+"""
+import glob
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import discord
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import apollo_parser # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, "benchmarks", "fixtures")
+NUMBER = 2000
+
+def legacy_parse(message) -> dict:
+    # what missing_mentions, ping_tentative, server_info, missing_voice_handler and count_attendance did, each on every call
+    fields = message.embeds[0].fields
+    all_members = []
+    accepted = []
+    tentative = []
+    for field in fields:
+        if field.value[:6] != '>>> <@':
+            continue
+        mentions = field.value[4:].replace('<@', '').replace('>', '')
+        all_members.extend([int(m) for m in mentions.split('\n') if m])
+    for field in fields:
+        if field.name[:10] == '<:accepted' and field.value[:6] == '>>> <@':
+            mentions = field.value[4:].replace('<@', '').replace('>', '')
+            accepted.extend([int(m) for m in mentions.split('\n') if m])
+    for field in fields:
+        if field.name[:11] == '<:tentative' and field.value[:6] == '>>> <@':
+            mentions = field.value[4:].replace('<@', '').replace('>', '')
+            tentative.extend([int(m) for m in mentions.split('\n') if m])
+    return {"all": all_members, "accepted": accepted, "tentative": tentative}
+
+def load_message(path: str, message_id: int):
+    with open(path, "r", encoding="utf-8") as f:
+        embed = discord.Embed.from_dict(json.load(f))
+    return SimpleNamespace(id=message_id, edited_at=datetime.now(timezone.utc), embeds=[embed])
+
+def run(path: str, message_id: int):
+    message = load_message(path, message_id)
+    roster = apollo_parser.parse_event(message)
+    legacy = legacy_parse(message)
+    assert set(legacy["all"]) == roster.all_members, "all members differ from the legacy parser"
+    assert set(legacy["accepted"]) == roster.accepted, "accepted differ from the legacy parser"
+    assert set(legacy["tentative"]) == roster.tentative, "tentative differ from the legacy parser"
+
+    def uncached():
+        apollo_parser.parse_embed(message.embeds[0], message.id)
+
+    def cached():
+        roster = apollo_parser.parse_event(message)
+        roster.all_members, roster.accepted, roster.tentative
+
+    results = {
+        "legacy (3 passes)": timeit.timeit(lambda: legacy_parse(message), number=NUMBER),
+        "parse_embed": timeit.timeit(uncached, number=NUMBER),
+        "parse_event (memoized)": timeit.timeit(cached, number=NUMBER),
+    }
+    print(f"{os.path.basename(path)}: {len(roster.fields)} status fields, {len(roster.all_members)} members, event at {roster.event_time}")
+    for name, seconds in results.items():
+        print(f"  {name:<24} {seconds / NUMBER * 1_000_000:8.2f} us/call")
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json")))
+    for message_id, path in enumerate(paths, start=1):
+        run(path, message_id)
+    print(f"cache: {apollo_parser.cache_info()}")
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,14 @@ MySQL = {
     "port": 0000, #port
     "user": "", #db username
     "password": "", #db password
-    "database": "" #db name
+    "database": "", #db name
+    # optional connection pool settings
+    "pool_max_size": 10, # max open connections per database
+    "pool_acquire_timeout": 5, # seconds to wait for a free connection
+    "pool_max_idle": 300, # seconds after which an idle connection is closed
+    "pool_ping_interval": 30, # seconds after which an idle connection is pinged before reuse
+    "query_timeout": 15, # seconds a db call may take before the command gives up
+    "slow_query_ms": 500 # statements slower than this are written to logs/slow_queries.log
 }
 Grafana = {
     "url": "https://grafana.url.link/",
@@ -34,6 +41,31 @@ GeminiModel = 'gemini-3.1-flash-lite'
 GeminiAPIInstruction = {
     "1": ["You are a cat named Neko."]
 }
+GeminiOptions = { # optional, every key has a default
+    "context_token_budget": 8000, # estimated tokens of persistent context and past conversations sent with every request
+    "context_max_exchanges": 500, # past conversations per channel (or thread) kept in memory for retrieval
+    "context_max_partitions": 50, # channels with their conversations loaded in memory at once, least recently used are dropped
+    "context_max_total_exchanges": 5000, # past conversations in memory over all channels
+    "context_partition_idle": 21600, # seconds without a mention before a channel's conversations are dropped from memory
+    "context_relevant_exchanges": 8, # past conversations most relevant to the message sent with it
+    "context_recent_exchanges": 4, # newest conversations always sent
+    "compaction_keep_raw": 300, # newest conversations stored as they are, older ones are folded into summaries
+    "compaction_batch_size": 50, # conversations folded into one summary
+    "summary_limit": 8, # newest summaries of the channel sent with every request
+    "image_max_dimension": 1024, # image attachments are downscaled to this longest side before they are sent
+    "reply_chain_depth": 5, # replied-to messages followed up the reply chain and sent as context
+    "reply_chain_token_budget": 1500, # estimated tokens of the reply chain sent as context
+    "stream_responses": True, # edit the reply while it is generated instead of waiting for the full response
+    "max_concurrent_requests": 2, # gemini requests in flight, others wait in a queue fair between channels and users
+    "fallback_models": ['gemini-2.5-flash-lite'], # used in order when GeminiModel is out of quota
+    "model_limits": { # requests per minute/day of the api key tier, requests over them are not sent
+        'gemini-3.1-flash-lite': {"rpm": 15, "rpd": 500},
+        'gemini-2.5-flash-lite': {"rpm": 15, "rpd": 1000}
+    },
+    "context_cache": True, # cache persistent_context as gemini cached content instead of sending it with every request
+    "context_cache_ttl": 3600, # seconds, extended while in use
+    "context_cache_min_tokens": 1024 # smaller persistent context is sent inline, gemini does not cache small prefixes
+}
 TempVoiceChannels = [   # Voice channels which act as a hub for temporary voices
     1234567890
 ]
@@ -0,0 +1,28 @@
+import csv
+import io
+
+DELIMITERS = ",;\t" # accepted between columns, spreadsheet exports use either depending on the locale
+
+def read_rows(text: str, columns: int, delimiters: str = DELIMITERS) -> list[list[str]]:
+    """
+    Rows of a CSV file whose lines should have `columns` fields.
+    The sniffed delimiter is tried first, then the other candidates: a semicolon file with commas inside the values
+    sniffs as comma separated, but only the semicolon gives every line the expected columns.
+    Falls back to the delimiter that fits the most lines, the ones that still do not fit are rejected by the caller.
+    Raises csv.Error if the text is not CSV at all.
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text[:1024], delimiters=delimiters)
+    except csv.Error:
+        dialect = csv.excel # a single column or an ambiguous sample, the candidates decide
+    candidates = [dialect.delimiter, *(delimiter for delimiter in delimiters if delimiter != dialect.delimiter)]
+    best_rows, best_fitting = None, -1
+    for delimiter in candidates:
+        rows = list(csv.reader(io.StringIO(text), dialect, delimiter=delimiter))
+        filled = [row for row in rows if any(cell.strip() for cell in row)]
+        fitting = sum(len(row) == columns for row in filled)
+        if fitting == len(filled):
+            return rows
+        if fitting > best_fitting:
+            best_rows, best_fitting = rows, fitting
+    return best_rows
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import os
+import discord
+
+EVENT_SCAN_LIMIT = 100 # first messages of a channel searched for its Apollo event, one history request
+
+class EventIndex:
+    """
+    channel id -> ids of its Apollo event message and of its roster message (the first message starting with one of
+    roster_prefixes), persisted as JSON.
+    Kept current from new, edited and deleted messages. Channels that were never seen are backfilled from their history
+    on the first lookup; "scanned" is the newest message id read by a backfill, so the next one continues after it.
+    The event is only searched for among the first EVENT_SCAN_LIMIT messages, the roster in the whole history.
+    """
+    def __init__(self, path: str, apollo_id: int, roster_prefixes: tuple[str, ...], logger: logging.Logger):
+        self.path = path
+        self.apollo_id = apollo_id
+        self.roster_prefixes = roster_prefixes
+        self.logger = logger
+        self._channels: dict[int, dict] = {} # channel id -> {"event": id | None, "roster": id | None, "scanned": id | None}
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    def __len__(self):
+        return len(self._channels)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._channels = {int(channel_id): entry for channel_id, entry in json.load(f).items()}
+        except FileNotFoundError:
+            self._channels = {}
+        except Exception as e:
+            self.logger.warning(f"Error reading event index {self.path}, starting empty: {e}")
+            self._channels = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({str(channel_id): entry for channel_id, entry in self._channels.items()}, f)
+        os.replace(temp_path, self.path) # a crash mid-write leaves the previous index
+
+    def _entry(self, channel_id: int) -> dict:
+        return self._channels.setdefault(channel_id, {"event": None, "roster": None, "scanned": None})
+
+    def is_roster(self, content: str) -> bool:
+        return content.startswith(self.roster_prefixes)
+
+    def _match(self, entry: dict, message_id: int, author_id: int | None, content: str | None) -> bool:
+        # the earliest matching message of a channel wins, same as scanning the history oldest first
+        changed = False
+        if author_id == self.apollo_id and (entry["event"] is None or message_id < entry["event"]):
+            entry["event"] = message_id
+            changed = True
+        if content is not None and self.is_roster(content) and (entry["roster"] is None or message_id < entry["roster"]):
+            entry["roster"] = message_id
+            changed = True
+        return changed
+
+    def observe(self, message: discord.Message):
+        """
+        New message in any channel. Only channels that are already indexed are updated, the rest are backfilled on lookup.
+        """
+        entry = self._channels.get(message.channel.id)
+        if entry is not None and self._match(entry, message.id, message.author.id, message.content):
+            self.save()
+
+    def observe_edit(self, payload: discord.RawMessageUpdateEvent):
+        entry = self._channels.get(payload.channel_id)
+        content = payload.data.get("content")
+        if entry is None or content is None: # embed-only updates (Apollo edits) do not change the index
+            return
+        if entry["roster"] == payload.message_id and not self.is_roster(content):
+            self._forget(entry, "roster", payload.message_id)
+            self.save()
+        elif self._match(entry, payload.message_id, None, content):
+            self.save()
+
+    def _forget(self, entry: dict, key: str, message_id: int):
+        entry[key] = None
+        if entry["scanned"] is not None:
+            entry["scanned"] = min(entry["scanned"], message_id) # the next backfill looks for a later match from here
+
+    def observe_delete(self, channel_id: int, message_ids: set[int]) -> int | None:
+        """
+        Returns the id of the channel's event message if it was among the deleted ones.
+        """
+        entry = self._channels.get(channel_id)
+        if entry is None:
+            return None
+        deleted_event = entry["event"] if entry["event"] in message_ids else None
+        changed = False
+        for key in ("event", "roster"):
+            if entry[key] in message_ids:
+                self._forget(entry, key, entry[key])
+                changed = True
+        if changed:
+            self.save()
+        return deleted_event
+
+    def drop_channel(self, channel_id: int) -> int | None:
+        """
+        Returns the id of the channel's event message if it was indexed.
+        """
+        entry = self._channels.pop(channel_id, None)
+        if entry is not None:
+            self.save()
+        self._locks.pop(channel_id, None)
+        return entry["event"] if entry is not None else None
+
+    async def _backfill(self, channel: discord.abc.Messageable, key: str) -> int | None:
+        async with self._locks.setdefault(channel.id, asyncio.Lock()):
+            entry = self._entry(channel.id)
+            if entry[key] is not None: # found by a concurrent backfill
+                return entry[key]
+            if key == "event": # bounded, an event without an Apollo message costs one request per lookup
+                limit, after = EVENT_SCAN_LIMIT, None
+            else:
+                limit, after = None, discord.Object(entry["scanned"]) if entry["scanned"] is not None else None
+            read = 0
+            try:
+                async for message in channel.history(limit=limit, after=after, oldest_first=True):
+                    read += 1
+                    self._match(entry, message.id, message.author.id, message.content)
+                    if entry["scanned"] is None or message.id > entry["scanned"]:
+                        entry["scanned"] = message.id
+                    if entry[key] is not None:
+                        break
+            finally:
+                self.save()
+            self.logger.info(f"Event index backfill of channel {channel.id} read {read} message(s), {key}: {entry[key]}")
+            return entry[key]
+
+    async def event_message_id(self, channel: discord.abc.Messageable) -> int | None:
+        """
+        Id of the channel's Apollo event message, reading the history only if it is not indexed yet.
+        """
+        entry = self._channels.get(channel.id)
+        if entry is not None and entry["event"] is not None:
+            return entry["event"]
+        return await self._backfill(channel, "event")
+
+    async def roster_message_id(self, channel: discord.abc.Messageable) -> int | None:
+        entry = self._channels.get(channel.id)
+        if entry is not None and entry["roster"] is not None:
+            return entry["roster"]
+        return await self._backfill(channel, "roster")
@@ -0,0 +1,69 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+_word = re.compile(r"\w+")
+
+def tokenize(text: str) -> list[str]:
+    return [word for word in _word.findall(text.casefold()) if len(word) > 1]
+
+class BM25Index:
+    """
+    Incremental Okapi BM25 over short documents (one per stored conversation exchange).
+    Documents can be added and removed at any time, scores use the statistics of the current set.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict) # term -> {doc id: term frequency}
+        self._lengths: dict[int, int] = {}
+        self._terms: dict[int, tuple[str, ...]] = {} # doc id -> distinct terms, for removal
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: int):
+        return doc_id in self._lengths
+
+    def add(self, doc_id: int, text: str):
+        if doc_id in self._lengths:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self._postings[term][doc_id] = frequency
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._terms[doc_id] = tuple(counts)
+        self._total_length += length
+
+    def remove(self, doc_id: int):
+        if doc_id not in self._lengths:
+            return
+        for term in self._terms.pop(doc_id):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+
+    def search(self, query: str, limit: int, exclude: set[int] | frozenset[int] = frozenset()) -> list[tuple[int, float]]:
+        """
+        Returns up to `limit` (doc id, score) pairs with a positive score, best first.
+        """
+        if not self._lengths or limit <= 0:
+            return []
+        count = len(self._lengths)
+        average_length = self._total_length / count or 1
+        scores: dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                if doc_id in exclude:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from google import genai
+from google.genai import types
+from google.genai.errors import ClientError
+
+def is_stale_cache_error(e: Exception, cached_content: str | None) -> bool:
+    # only a missing or forbidden cache is worth retrying inline, other 400s are bad requests that would fail again
+    if not cached_content or not isinstance(e, ClientError):
+        return False
+    return e.code in (403, 404) or (e.code == 400 and re.search(r"cached.?content", str(e), re.IGNORECASE) is not None)
+
+@dataclass(frozen=True)
+class CachedPrefix:
+    name: str
+    expires_at: float # time.monotonic() based
+
+class ContentCacheBackend(ABC):
+    """
+    Storage for cached system instruction prefixes, GenaiCacheBackend in production, LocalCacheBackend for local runs and tests.
+    """
+    @abstractmethod
+    async def create(self, model: str, system_instruction: list[str], ttl: int) -> CachedPrefix:
+        ...
+
+    @abstractmethod
+    async def refresh(self, name: str, ttl: int) -> CachedPrefix:
+        ...
+
+    @abstractmethod
+    async def delete(self, name: str):
+        ...
+
+class GenaiCacheBackend(ContentCacheBackend):
+    def __init__(self, client: genai.Client.aio):
+        self.client = client
+
+    async def create(self, model: str, system_instruction: list[str], ttl: int) -> CachedPrefix:
+        cached = await self.client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name="persistent_context",
+                system_instruction=[types.Part(text=entry) for entry in system_instruction],
+                ttl=f"{ttl}s"
+            )
+        )
+        return CachedPrefix(cached.name, time.monotonic() + ttl)
+
+    async def refresh(self, name: str, ttl: int) -> CachedPrefix:
+        await self.client.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"))
+        return CachedPrefix(name, time.monotonic() + ttl)
+
+    async def delete(self, name: str):
+        await self.client.caches.delete(name=name)
+
+class LocalCacheBackend(ContentCacheBackend):
+    """
+    In-memory fake of the gemini cache api, keeps what would be cached in `entries`.
+    """
+    def __init__(self):
+        self.entries: dict[str, tuple[str, list[str]]] = {} # name -> (model, system_instruction)
+        self.calls: list[tuple[str, str]] = [] # (operation, name)
+        self._counter = 0
+
+    async def create(self, model: str, system_instruction: list[str], ttl: int) -> CachedPrefix:
+        self._counter += 1
+        name = f"cachedContents/local-{self._counter}"
+        self.entries[name] = (model, list(system_instruction))
+        self.calls.append(("create", name))
+        return CachedPrefix(name, time.monotonic() + ttl)
+
+    async def refresh(self, name: str, ttl: int) -> CachedPrefix:
+        if name not in self.entries:
+            raise KeyError(name)
+        self.calls.append(("refresh", name))
+        return CachedPrefix(name, time.monotonic() + ttl)
+
+    async def delete(self, name: str):
+        self.entries.pop(name, None)
+        self.calls.append(("delete", name))
+
+class PrefixCache:
+    """
+    Keeps one cached copy of the static system instruction prefix (persistent_context) per model.
+    The ttl is extended shortly before expiry, a changed prefix replaces the cached one.
+    When caching fails the caller gets None and sends the prefix inline, creation is retried after retry_interval.
+    """
+    def __init__(
+        self,
+        backend: ContentCacheBackend,
+        logger: logging.Logger,
+        *,
+        ttl: int = 3600,
+        refresh_margin: int = 300,
+        retry_interval: int = 600,
+        min_tokens: int = 0
+    ):
+        self.backend = backend
+        self.logger = logger
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.min_tokens = min_tokens
+        self._cached: dict[str, tuple[str, CachedPrefix]] = {} # model -> (prefix hash, cached prefix)
+        self._retry_after: dict[tuple[str, str], float] = {} # (model, prefix hash) -> monotonic time
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def prefix_hash(system_instruction: list[str]) -> str:
+        digest = hashlib.sha256()
+        for entry in system_instruction:
+            digest.update(entry.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def get(self, model: str, system_instruction: list[str], tokens: int) -> str | None:
+        """
+        Returns the cached content name to use for this prefix, or None to send it inline.
+        """
+        if not system_instruction or tokens < self.min_tokens: # gemini rejects caches under a per-model minimum size
+            return None
+        prefix_hash = self.prefix_hash(system_instruction)
+        async with self._lock:
+            now = time.monotonic()
+            current = self._cached.get(model)
+            if current and current[0] == prefix_hash:
+                cached = current[1]
+                if cached.expires_at - now > self.refresh_margin:
+                    return cached.name
+                if cached.expires_at > now:
+                    try:
+                        cached = await self.backend.refresh(cached.name, self.ttl)
+                        self._cached[model] = (prefix_hash, cached)
+                        return cached.name
+                    except Exception as e:
+                        self.logger.warning(f"Failed to extend cached prefix {cached.name}, creating a new one: {e}")
+            if current:
+                await self._delete(model, current[1].name)
+            if self._retry_after.get((model, prefix_hash), 0) > now:
+                return None
+            try:
+                cached = await self.backend.create(model, system_instruction, self.ttl)
+            except Exception as e:
+                self._retry_after[(model, prefix_hash)] = now + self.retry_interval
+                self.logger.warning(f"Failed to cache the persistent prefix for {model}, sending it inline: {e}")
+                return None
+            self._retry_after.pop((model, prefix_hash), None)
+            self._cached[model] = (prefix_hash, cached)
+            self.logger.info(f"Cached the persistent prefix for {model} as {cached.name}, ttl {self.ttl}s")
+            return cached.name
+
+    async def run(self, cached_content: str | None, request):
+        """
+        Awaits request(cached_content). When the api rejects the cached prefix as stale it is dropped and the request
+        is sent once more with None, the prefix inline.
+        """
+        try:
+            return await request(cached_content)
+        except Exception as e:
+            if not is_stale_cache_error(e, cached_content):
+                raise
+            self.logger.warning(f"Request with cached prefix {cached_content} failed, retrying inline: {e}")
+            await self.invalidate(cached_content)
+            return await request(None)
+
+    async def invalidate(self, name: str):
+        """
+        Drops a cached prefix the api no longer knows about (expired or deleted elsewhere).
+        """
+        async with self._lock:
+            for model, (_, cached) in list(self._cached.items()):
+                if cached.name == name:
+                    del self._cached[model]
+
+    async def _delete(self, model: str, name: str):
+        self._cached.pop(model, None)
+        try:
+            await self.backend.delete(name)
+        except Exception as e:
+            self.logger.warning(f"Failed to delete cached prefix {name}: {e}")
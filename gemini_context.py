@@ -0,0 +1,270 @@
+import time
+from collections import Counter, OrderedDict
+from google.genai import types
+from exchange_index import BM25Index
+
+def estimate_tokens(text: str) -> int:
+    # rough estimate for gemini tokenizers (~4 characters per token), good enough for budgeting without a count_tokens call
+    return len(text) // 4 + 1
+
+class ContextWindow:
+    """
+    System instruction for gemini: persistent entries, summaries of compacted conversations, a header and the past exchanges
+    picked for the current message.
+    Up to max_exchanges exchanges are kept and indexed with BM25. Every request gets the recent_count newest ones plus
+    the relevant_count best matches for the message, as far as they fit into token_budget together with the fixed entries.
+    """
+    def __init__(
+        self,
+        token_budget: int,
+        persistent: list[str] | None = None,
+        header: list[str] | None = None,
+        *,
+        max_exchanges: int = 500,
+        relevant_count: int = 8,
+        recent_count: int = 4
+    ):
+        self.token_budget = token_budget
+        self.max_exchanges = max_exchanges
+        self.relevant_count = relevant_count
+        self.recent_count = recent_count
+        self._persistent_texts: list[str] = []
+        self._persistent: list[types.Part] = []
+        self._persistent_tokens = 0
+        self._header: list[types.Part] = []
+        self._header_tokens = 0
+        self._summaries: list[types.Part] = []
+        self._summary_tokens = 0
+        self._exchanges: OrderedDict[int, tuple[types.Part, int]] = OrderedDict() # id -> (part, tokens), oldest first
+        self._index = BM25Index()
+        self._next_id = 0
+        self.evicted = 0
+        self.last_selected = 0
+        self.last_selected_tokens = 0
+        self.set_persistent(persistent or [], header or [])
+
+    def __len__(self):
+        return len(self._persistent) + len(self._summaries) + len(self._header) + len(self._exchanges)
+
+    def set_persistent(self, persistent: list[str], header: list[str]):
+        self._persistent_texts = list(persistent)
+        self._persistent = [types.Part(text=entry) for entry in persistent]
+        self._header = [types.Part(text=entry) for entry in header]
+        self._persistent_tokens = sum(estimate_tokens(entry) for entry in persistent)
+        self._header_tokens = sum(estimate_tokens(entry) for entry in header)
+
+    def set_summaries(self, summaries: list[str], summary_header: str):
+        """
+        summaries: oldest first, sent as they are (no budget check), keep their amount small.
+        """
+        entries = [summary_header, *summaries] if summaries else []
+        self._summaries = [types.Part(text=entry) for entry in entries]
+        self._summary_tokens = sum(estimate_tokens(entry) for entry in entries)
+
+    @property
+    def _fixed_tokens(self) -> int:
+        return self._persistent_tokens + self._summary_tokens + self._header_tokens
+
+    def add_exchange(self, text: str):
+        exchange_id = self._next_id
+        self._next_id += 1
+        self._exchanges[exchange_id] = (types.Part(text=text), estimate_tokens(text))
+        self._index.add(exchange_id, text)
+        while len(self._exchanges) > self.max_exchanges:
+            oldest, _ = self._exchanges.popitem(last=False)
+            self._index.remove(oldest)
+            self.evicted += 1
+
+    def remove_exchanges(self, texts: list[str]) -> int:
+        """
+        Drops the oldest stored exchange with each of `texts`, the ones just folded into a summary. Returns how many were found.
+        """
+        remaining = Counter(texts)
+        removed = 0
+        for exchange_id, (part, _) in list(self._exchanges.items()):
+            if remaining[part.text] <= 0:
+                continue
+            remaining[part.text] -= 1
+            del self._exchanges[exchange_id]
+            self._index.remove(exchange_id)
+            removed += 1
+        return removed
+
+    def select(self, query: str) -> list[int]:
+        """
+        Ids of the exchanges to send with `query`, oldest first.
+        Recent exchanges are picked first, then the relevant ones by score, each only if it still fits the budget.
+        """
+        recent = list(self._exchanges)[-self.recent_count:] if self.recent_count > 0 else []
+        relevant = [exchange_id for exchange_id, _ in self._index.search(query, self.relevant_count, exclude=set(recent))]
+        available = self.token_budget - self._fixed_tokens
+        selected = []
+        for exchange_id in [*reversed(recent), *relevant]:
+            tokens = self._exchanges[exchange_id][1]
+            if tokens <= available:
+                selected.append(exchange_id)
+                available -= tokens
+        selected.sort()
+        self.last_selected = len(selected)
+        self.last_selected_tokens = sum(self._exchanges[exchange_id][1] for exchange_id in selected)
+        return selected
+
+    @property
+    def tokens(self) -> int:
+        """
+        Estimated size of the last built instruction.
+        """
+        return self._fixed_tokens + self.last_selected_tokens
+
+    @property
+    def exchange_count(self) -> int:
+        return len(self._exchanges)
+
+    @property
+    def persistent_texts(self) -> list[str]:
+        return self._persistent_texts
+
+    @property
+    def persistent_tokens(self) -> int:
+        return self._persistent_tokens
+
+    def parts(self, query: str) -> list[types.Part]:
+        return [*self._persistent, *self.tail_parts(query)]
+
+    def tail_parts(self, query: str) -> list[types.Part]:
+        """
+        Everything after the persistent entries, sent with the request when the persistent prefix is cached.
+        """
+        return [*self._summaries, *self._header, *(self._exchanges[exchange_id][0] for exchange_id in self.select(query))]
+
+    def stats(self) -> dict:
+        return {
+            "summaries": max(len(self._summaries) - 1, 0),
+            "stored_exchanges": self.exchange_count,
+            "selected_exchanges": self.last_selected,
+            "tokens": self.tokens,
+            "token_budget": self.token_budget,
+            "evicted": self.evicted
+        }
+
+class ContextPartitions:
+    """
+    One ContextWindow per conversation partition (channel, or thread when one is used), sharing the persistent entries.
+    Partitions are kept in LRU order and evicted when they were idle for longer than idle_seconds, or when there are more
+    than max_partitions of them or more than max_total_exchanges exchanges in memory altogether.
+    Evicted partitions are loaded again from the db on their next message.
+    """
+    def __init__(
+        self,
+        token_budget: int,
+        *,
+        max_partitions: int = 50,
+        max_total_exchanges: int = 5000,
+        idle_seconds: float = 6 * 3600,
+        max_exchanges: int = 500,
+        relevant_count: int = 8,
+        recent_count: int = 4
+    ):
+        self.token_budget = token_budget
+        self.max_partitions = max_partitions
+        self.max_total_exchanges = max_total_exchanges
+        self.idle_seconds = idle_seconds
+        self.max_exchanges = max_exchanges
+        self.relevant_count = relevant_count
+        self.recent_count = recent_count
+        self._persistent: list[str] = []
+        self._header: list[str] = []
+        self._persistent_tokens = 0
+        self._partitions: OrderedDict[int, tuple[ContextWindow, float]] = OrderedDict() # key -> (window, last used), least recent first
+        self.loads = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._partitions)
+
+    def __contains__(self, key: int):
+        return key in self._partitions
+
+    def set_persistent(self, persistent: list[str], header: list[str]):
+        self._persistent = list(persistent)
+        self._header = list(header)
+        self._persistent_tokens = sum(estimate_tokens(entry) for entry in persistent)
+        for window, _ in self._partitions.values():
+            window.set_persistent(self._persistent, self._header)
+
+    @property
+    def persistent_texts(self) -> list[str]:
+        return self._persistent
+
+    @property
+    def persistent_tokens(self) -> int:
+        return self._persistent_tokens
+
+    @property
+    def exchange_count(self) -> int:
+        return sum(window.exchange_count for window, _ in self._partitions.values())
+
+    def get(self, key: int) -> ContextWindow | None:
+        """
+        Loaded partition of `key`, marked as most recently used, None if it is not in memory.
+        """
+        entry = self._partitions.get(key)
+        if entry is None:
+            return None
+        self._partitions[key] = (entry[0], time.monotonic())
+        self._partitions.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key: int) -> ContextWindow | None:
+        entry = self._partitions.get(key)
+        return entry[0] if entry else None
+
+    def create(self, key: int, exchanges: list[str], summaries: list[str], summary_header: str) -> ContextWindow:
+        """
+        Adds the partition of `key` loaded from the db (exchanges oldest first) and evicts others if the limits require it.
+        """
+        window = ContextWindow(
+            self.token_budget,
+            self._persistent,
+            self._header,
+            max_exchanges=self.max_exchanges,
+            relevant_count=self.relevant_count,
+            recent_count=self.recent_count
+        )
+        window.set_summaries(summaries, summary_header)
+        for text in exchanges:
+            window.add_exchange(text)
+        self._partitions[key] = (window, time.monotonic())
+        self._partitions.move_to_end(key)
+        self.loads += 1
+        self.evict()
+        return window
+
+    def evict(self) -> int:
+        """
+        Drops least recently used partitions while over the limits or idle, the most recent one is always kept.
+        Returns the amount dropped.
+        """
+        now = time.monotonic()
+        total = self.exchange_count
+        dropped = 0
+        while len(self._partitions) > 1:
+            key, (window, last_used) = next(iter(self._partitions.items()))
+            if len(self._partitions) <= self.max_partitions and total <= self.max_total_exchanges and now - last_used <= self.idle_seconds:
+                break
+            del self._partitions[key]
+            total -= window.exchange_count
+            dropped += 1
+        self.evicted += dropped
+        return dropped
+
+    def stats(self) -> dict:
+        return {
+            "partitions": len(self._partitions),
+            "max_partitions": self.max_partitions,
+            "exchanges": self.exchange_count,
+            "max_total_exchanges": self.max_total_exchanges,
+            "persistent_tokens": self._persistent_tokens,
+            "loads": self.loads,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,151 @@
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+import pytz
+from google.genai.errors import ClientError
+
+QUOTA_TIMEZONE = pytz.timezone("US/Pacific") # daily gemini quotas reset at midnight pacific time
+
+class QuotaExhaustedError(Exception):
+    """
+    No configured model has quota left. retry_at is the earliest time one of them is expected to accept requests again.
+    """
+    def __init__(self, retry_at: datetime):
+        super().__init__(f"Gemini quota exhausted for all models until {retry_at.isoformat()}")
+        self.retry_at = retry_at
+
+def next_quota_reset(now: datetime | None = None) -> datetime:
+    now = now or datetime.now(QUOTA_TIMEZONE)
+    midnight = now.astimezone(QUOTA_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    return QUOTA_TIMEZONE.normalize(midnight + timedelta(days=1))
+
+def parse_duration(value: str) -> timedelta | None:
+    """
+    Protobuf duration ("23s", "1.5s") or the "1h2m3s" form.
+    """
+    parts = re.findall(r"(\d+(?:\.\d+)?)([hms])", value or "")
+    if not parts:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1}
+    return timedelta(seconds=sum(float(amount) * units[unit] for amount, unit in parts))
+
+def read_quota_error(error: ClientError) -> tuple[timedelta | None, bool]:
+    """
+    Returns (retry delay from RetryInfo, whether a per day quota was violated) of a 429 error.
+    """
+    details = error.details.get("error", {}).get("details", []) if isinstance(error.details, dict) else []
+    retry_delay = None
+    daily = False
+    for detail in details:
+        detail_type = detail.get("@type", "")
+        if detail_type.endswith("RetryInfo"):
+            retry_delay = parse_duration(detail.get("retryDelay"))
+        elif detail_type.endswith("QuotaFailure"):
+            daily = daily or any("PerDay" in violation.get("quotaId", "") for violation in detail.get("violations", []))
+    return retry_delay, daily
+
+class TokenBucket:
+    """
+    capacity requests per period, refilled continuously.
+    """
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available_in(self) -> float:
+        """
+        Seconds until a request can be taken, 0 if one is available now.
+        """
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+class ModelQuota:
+    """
+    Client side view of one model's quota: requests per minute (token bucket), requests per day (counter reset at midnight
+    pacific time) and a block set from the retry info of the last 429.
+    """
+    def __init__(self, model: str, rpm: int | None, rpd: int | None):
+        self.model = model
+        self.minute = TokenBucket(rpm, 60) if rpm else None
+        self.rpd = rpd
+        self.day_count = 0
+        self.day_reset = next_quota_reset()
+        self.blocked_until: datetime | None = None
+
+    def available_at(self, now: datetime) -> datetime:
+        if now >= self.day_reset:
+            self.day_count = 0
+            self.day_reset = next_quota_reset(now)
+        candidates = [now]
+        if self.blocked_until and self.blocked_until > now:
+            candidates.append(self.blocked_until)
+        if self.rpd and self.day_count >= self.rpd:
+            candidates.append(self.day_reset)
+        if self.minute:
+            candidates.append(now + timedelta(seconds=self.minute.available_in()))
+        return max(candidates)
+
+    def take(self):
+        self.day_count += 1
+        if self.minute:
+            self.minute.take()
+
+class QuotaManager:
+    """
+    Picks the first model of the fallback chain with quota left, before the request is sent.
+    A 429 blocks the model for the delay from its RetryInfo (until the daily reset for per day quotas) and the call moves on
+    to the next model of the chain.
+    """
+    def __init__(self, models: list[str], limits: dict[str, dict], logger: logging.Logger):
+        self.logger = logger
+        self.quotas = [
+            ModelQuota(model, limits.get(model, {}).get("rpm"), limits.get(model, {}).get("rpd"))
+            for model in dict.fromkeys(models) # keeps order, drops duplicates
+        ]
+
+    def acquire(self) -> str:
+        now = datetime.now(QUOTA_TIMEZONE)
+        earliest = None
+        for quota in self.quotas:
+            available_at = quota.available_at(now)
+            if available_at <= now:
+                quota.take()
+                return quota.model
+            earliest = available_at if earliest is None else min(earliest, available_at)
+        raise QuotaExhaustedError(earliest)
+
+    def report_exhausted(self, model: str, error: ClientError):
+        retry_delay, daily = read_quota_error(error)
+        now = datetime.now(QUOTA_TIMEZONE)
+        blocked_until = now + retry_delay if retry_delay and not daily else next_quota_reset(now)
+        for quota in self.quotas:
+            if quota.model == model:
+                quota.blocked_until = blocked_until
+        self.logger.warning(f"Gemini quota exceeded for {model}{' (daily)' if daily else ''}, blocked until {blocked_until.isoformat()}")
+
+    async def call(self, request: Callable[[str], Awaitable]):
+        """
+        Awaits request(model) with the first model that has quota, falling back along the chain on 429 errors.
+        Raises QuotaExhaustedError when no model is left.
+        """
+        for _ in range(len(self.quotas)):
+            model = self.acquire()
+            try:
+                return await request(model)
+            except ClientError as e:
+                if e.code != 429:
+                    raise
+                self.report_exhausted(model, e)
+        raise QuotaExhaustedError(min(quota.available_at(datetime.now(QUOTA_TIMEZONE)) for quota in self.quotas))
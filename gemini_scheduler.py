@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+class SupersededError(Exception):
+    """
+    Raised to a queued request when the same user sent a newer one before it started.
+    """
+
+class _Job:
+    def __init__(self, channel_id: int, user_id: int, on_position: Callable[[int], Awaitable[None]] | None):
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.on_position = on_position
+        self.position = None
+        self.ready = asyncio.get_running_loop().create_future()
+
+class FairScheduler:
+    """
+    Limits concurrent gemini requests to max_concurrency and queues the rest.
+    Queued requests are started round-robin over channels and, inside a channel, in order of the users' first waiting request,
+    so one busy channel or one user can not starve everyone else. A user has at most one queued request,
+    a newer one takes the place of the older, which fails with SupersededError.
+    """
+    def __init__(self, max_concurrency: int, logger: logging.Logger):
+        self.max_concurrency = max_concurrency
+        self.logger = logger
+        self._active = 0
+        self._channels: OrderedDict[int, OrderedDict[int, _Job]] = OrderedDict() # channel -> user -> job, in round-robin order
+        self._by_user: dict[int, _Job] = {}
+        self._position_tasks = set()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._by_user)
+
+    async def run(
+        self,
+        channel_id: int,
+        user_id: int,
+        request: Callable[[], Awaitable],
+        on_position: Callable[[int], Awaitable[None]] | None = None
+    ):
+        """
+        Awaits a free slot, then awaits request(). on_position(position) is called (1-based) while the request waits in the queue.
+        """
+        if self._active < self.max_concurrency and not self._by_user:
+            self._active += 1
+        else:
+            await self._wait(channel_id, user_id, on_position)
+        try:
+            return await request()
+        finally:
+            self._active -= 1
+            self._dispatch()
+
+    async def _wait(self, channel_id: int, user_id: int, on_position):
+        job = _Job(channel_id, user_id, on_position)
+        previous = self._by_user.get(user_id)
+        if previous is not None:
+            self._remove(previous)
+            previous.ready.set_exception(SupersededError())
+            self.logger.info(f"Queued gemini request of user {user_id} superseded by a newer one")
+        self._channels.setdefault(channel_id, OrderedDict())[user_id] = job
+        self._by_user[user_id] = job
+        self._update_positions()
+        try:
+            await job.ready
+        except asyncio.CancelledError:
+            if job.ready.done() and not job.ready.cancelled() and job.ready.exception() is None:
+                self._active -= 1 # slot was granted right before the cancel
+                self._dispatch()
+            elif self._by_user.get(user_id) is job:
+                self._remove(job)
+                self._update_positions()
+            raise
+
+    def _remove(self, job: _Job):
+        users = self._channels.get(job.channel_id)
+        if users is not None and users.get(job.user_id) is job:
+            del users[job.user_id]
+            if not users:
+                del self._channels[job.channel_id]
+        if self._by_user.get(job.user_id) is job:
+            del self._by_user[job.user_id]
+
+    def _dispatch(self):
+        started = False
+        while self._active < self.max_concurrency and self._channels:
+            channel_id, users = self._channels.popitem(last=False)
+            _, job = users.popitem(last=False)
+            if users:
+                self._channels[channel_id] = users # back to the end of the rotation
+            del self._by_user[job.user_id]
+            self._active += 1
+            job.ready.set_result(None)
+            started = True
+        if started:
+            self._update_positions()
+
+    def _order(self) -> list[_Job]:
+        """
+        Queued jobs in the order _dispatch() would start them.
+        """
+        queues = [list(users.values()) for users in self._channels.values()]
+        order = []
+        for depth in range(max((len(queue) for queue in queues), default=0)):
+            order.extend(queue[depth] for queue in queues if depth < len(queue))
+        return order
+
+    def _update_positions(self):
+        for position, job in enumerate(self._order(), start=1):
+            if job.position == position or job.on_position is None:
+                continue
+            job.position = position
+            task = asyncio.create_task(self._notify(job, position))
+            self._position_tasks.add(task)
+            task.add_done_callback(self._position_tasks.discard)
+
+    async def _notify(self, job: _Job, position: int):
+        if job.ready.done(): # started or superseded meanwhile
+            return
+        try:
+            await job.on_position(position)
+        except Exception as e:
+            self.logger.warning(f"Failed to report queue position {position} to user {job.user_id}: {e}")
@@ -1,37 +1,217 @@
 from google import genai
 from google.genai import types
 from configs.tokens import GeminiAPI, GeminiModel
+try:
+    from configs.tokens import GeminiOptions
+except ImportError: # configs from before the optional gemini settings
+    GeminiOptions = {}
 import logging
-import traceback
-from mysql_helper import GeminiMySqlConnectionManager
+from mysql_helper import GeminiMySqlConnectionManager, WriteBehindBuffer, run_db
+from gemini_context import ContextPartitions, ContextWindow
+from gemini_cache import GenaiCacheBackend, PrefixCache
+from gemini_scheduler import FairScheduler
+from gemini_quota import QuotaManager
 import re
+import asyncio
+import time
+from datetime import datetime
+from typing import AsyncIterator
 
 logger = logging.getLogger("gemini")
 logger.setLevel(logging.INFO)
-INSTRUCTION = []
+CONTEXT_TOKEN_BUDGET = GeminiOptions.get("context_token_budget", 8000) # estimated tokens of the system instruction per request
+CONTEXT_MAX_EXCHANGES = GeminiOptions.get("context_max_exchanges", 500) # exchanges per channel kept in memory for retrieval, same as the db row limit
+CONTEXT_MAX_PARTITIONS = GeminiOptions.get("context_max_partitions", 50) # channels with their conversation memory loaded at once
+CONTEXT_MAX_TOTAL_EXCHANGES = GeminiOptions.get("context_max_total_exchanges", 5000) # exchanges in memory over all channels
+CONTEXT_PARTITION_IDLE = GeminiOptions.get("context_partition_idle", 6 * 3600) # seconds without a message before a channel's memory is dropped
+CONTEXT_RELEVANT_EXCHANGES = GeminiOptions.get("context_relevant_exchanges", 8) # best matching past exchanges sent with a message
+CONTEXT_RECENT_EXCHANGES = GeminiOptions.get("context_recent_exchanges", 4) # newest exchanges always sent with a message
 TMP_CONTEXT_FORMAT = '-|{author}| wrote: |{message}|\n you responded: |{response}|'
-mysqlconn = None
+CONTEXT_HEADER = [
+    f'USE THE NEXT BLOCK ONLY FOR CONTEXT, NEW RESPONSE SHOULD BE AS USUAL (GENERATE ORIGINAL RESPONSE WITHOUT REUSING THE SAME ONE), WITHOUT ANY FORMATTING FROM THE NEXT BLOCK',
+    f'[CONTEXT OF PREVIOUS CONVERSATIONS IN FORMAT: "{TMP_CONTEXT_FORMAT}"]'
+]
+CONTEXT_CACHE_ENABLED = GeminiOptions.get("context_cache", True)
+CONTEXT_CACHE_TTL = GeminiOptions.get("context_cache_ttl", 3600) # seconds, extended shortly before expiry while in use
+CONTEXT_CACHE_MIN_TOKENS = GeminiOptions.get("context_cache_min_tokens", 1024) # smaller prefixes are sent inline, the api refuses to cache them
+IMAGE_MAX_DIMENSION = GeminiOptions.get("image_max_dimension", 1024) # longest side of images sent to gemini
+REPLY_CHAIN_DEPTH = GeminiOptions.get("reply_chain_depth", 5) # replied-to messages followed up the chain for the prompt context
+REPLY_CHAIN_TOKEN_BUDGET = GeminiOptions.get("reply_chain_token_budget", 1500) # estimated tokens of the reply chain in the prompt
+STREAM_RESPONSES = GeminiOptions.get("stream_responses", True) # replies are shown while they are generated
+MAX_CONCURRENT_REQUESTS = GeminiOptions.get("max_concurrent_requests", 2) # gemini calls in flight, the rest wait in a fair queue
+scheduler = FairScheduler(MAX_CONCURRENT_REQUESTS, logger)
+FALLBACK_MODELS = GeminiOptions.get("fallback_models", []) # tried in order once GeminiModel is out of quota
+MODEL_LIMITS = GeminiOptions.get("model_limits", {}) # model -> {"rpm": ..., "rpd": ...}, checked before sending a request
+quota = QuotaManager([GeminiModel, *FALLBACK_MODELS], MODEL_LIMITS, logger)
+COMPACTION_KEEP_RAW = GeminiOptions.get("compaction_keep_raw", 300) # newest exchanges kept as they are, older ones are summarized
+COMPACTION_BATCH_SIZE = GeminiOptions.get("compaction_batch_size", 50) # exchanges folded into one summary
+SUMMARY_LIMIT = GeminiOptions.get("summary_limit", 8) # newest summaries of the channel sent with every request
+SUMMARY_MAX_OUTPUT_TOKENS = 300
+SUMMARY_HEADER = '[SUMMARIES OF OLDER CONVERSATIONS, OLDEST FIRST]'
+SUMMARY_INSTRUCTION = (
+    'Summarize the following conversations between Discord users and FRS Bot in a few short sentences. '
+    'Keep user names, facts, decisions, preferences and running jokes worth remembering, drop greetings and small talk. '
+    'Answer with the summary only.'
+)
+context_partitions = ContextPartitions(
+    CONTEXT_TOKEN_BUDGET,
+    max_partitions=CONTEXT_MAX_PARTITIONS,
+    max_total_exchanges=CONTEXT_MAX_TOTAL_EXCHANGES,
+    idle_seconds=CONTEXT_PARTITION_IDLE,
+    max_exchanges=CONTEXT_MAX_EXCHANGES,
+    relevant_count=CONTEXT_RELEVANT_EXCHANGES,
+    recent_count=CONTEXT_RECENT_EXCHANGES
+)
+prefix_cache: PrefixCache | None = None
+_background_tasks = set()
+_loading_partitions: dict[int, asyncio.Task] = {}
 
-try:
-    mysqlconn = GeminiMySqlConnectionManager(logger)
+mysqlconn = GeminiMySqlConnectionManager(logger)
+temp_context_buffer = WriteBehindBuffer("temporary_message_context", mysqlconn.insert_temporary_context, logger=logger)
+call_metrics_buffer = WriteBehindBuffer("call_metrics", mysqlconn.insert_call_metrics, logger=logger)
+context_ready = False
+
+async def init_context():
+    """
+    Applies pending gemini_db migrations and loads the persistent context, channels are loaded on their first message.
+    Runs after login, until it succeeds the bot does not answer mentions.
+    """
+    global context_ready
+    await run_db(mysqlconn.migrate)
     #[types.Part(text=entry) for entry in GeminiAPIInstruction]
-    mysqlconn.init_db()
-    mysqlconn.init_tables()
-    rows = mysqlconn.get_persistent_context()
-    rows.append(f'USE THE NEXT BLOCK ONLY FOR CONTEXT, NEW RESPONSE SHOULD BE AS USUAL (GENERATE ORIGINAL RESPONSE WITHOUT REUSING THE SAME ONE), WITHOUT ANY FORMATTING FROM THE NEXT BLOCK')
-    rows.append(f'[CONTEXT OF PREVIOUS CONVERSATIONS IN FORMAT: "{TMP_CONTEXT_FORMAT}"]')
-    rows.extend([TMP_CONTEXT_FORMAT.format(author=author, message=message, response=response) for author, message, response in mysqlconn.get_temporary_context()])
-    
-    if rows:
-        INSTRUCTION = [types.Part(text=entry) for entry in rows]
-except:
-    logger.exception(f"Failed to init MySQL db and get the persistent instructions")
-    raise
+    persistent = await run_db(mysqlconn.get_persistent_context)
+    context_partitions.set_persistent(persistent, CONTEXT_HEADER)
+    context_ready = True
+    logger.info(f"Gemini context loaded: {context_partitions.stats()}")
+
+def is_context_ready() -> bool:
+    return context_ready
+
+async def reload_persistent_context():
+    """
+    Picks up edits of persistent_context, a changed prefix also replaces the cached one on the next request.
+    """
+    persistent = await run_db(mysqlconn.get_persistent_context)
+    if persistent != context_partitions.persistent_texts:
+        context_partitions.set_persistent(persistent, CONTEXT_HEADER)
+        logger.info(f"Persistent context changed, reloaded: {context_partitions.stats()}")
+
+async def load_partition(channel_id: int) -> ContextWindow:
+    # exchanges of the channel still waiting in the write buffer are not in the db yet
+    temporary, pending = await run_db(temp_context_buffer.read_with_pending, mysqlconn.get_temporary_context, channel_id, CONTEXT_MAX_EXCHANGES)
+    summaries = await run_db(mysqlconn.get_summaries, channel_id, SUMMARY_LIMIT)
+    exchanges = [TMP_CONTEXT_FORMAT.format(author=author, message=message, response=response) for author, message, response in temporary]
+    exchanges.extend(
+        TMP_CONTEXT_FORMAT.format(author=author, message=message, response=response)
+        for _, row_channel_id, author, message, response in pending
+        if row_channel_id == channel_id
+    )
+    window = context_partitions.create(channel_id, exchanges, summaries, SUMMARY_HEADER)
+    logger.info(f"Loaded gemini context of channel {channel_id}: {window.stats()}; {context_partitions.stats()}")
+    return window
+
+async def get_context(channel_id: int) -> ContextWindow:
+    """
+    Conversation memory of a channel (or thread), loaded from the db if it is not in memory. Concurrent callers share one load.
+    """
+    window = context_partitions.get(channel_id)
+    if window is not None:
+        return window
+    task = _loading_partitions.get(channel_id)
+    if task is None:
+        task = asyncio.create_task(load_partition(channel_id))
+        _loading_partitions[channel_id] = task
+        task.add_done_callback(lambda _: _loading_partitions.pop(channel_id, None))
+    return await asyncio.shield(task)
+
+async def get_cached_prefix(client: genai.Client.aio, model: str) -> str | None:
+    global prefix_cache
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    if prefix_cache is None:
+        prefix_cache = PrefixCache(GenaiCacheBackend(client), logger, ttl=CONTEXT_CACHE_TTL, min_tokens=CONTEXT_CACHE_MIN_TOKENS)
+    return await prefix_cache.get(model, context_partitions.persistent_texts, context_partitions.persistent_tokens)
+
+async def save_temp_instruction(channel_id, author, message, response):
+    # queued only, the db write happens in flush_temp_instructions() off the reply path
+    if temp_context_buffer.append((datetime.now(), channel_id, author, message, response)):
+        task = asyncio.create_task(flush_temp_instructions())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    logger.info(f"Queued new temporary instruction")
+
+async def flush_temp_instructions():
+    try:
+        count = await run_db(temp_context_buffer.flush)
+        if count:
+            logger.info(f"Flushed {count} temporary instruction(s)")
+    except Exception:
+        logger.exception(f"Failed to flush temporary instructions, {len(temp_context_buffer)} kept for retry")
+
+async def flush_call_metrics():
+    try:
+        count = await run_db(call_metrics_buffer.flush)
+        if count:
+            logger.info(f"Flushed {count} call metric(s)")
+    except Exception:
+        logger.exception(f"Failed to flush call metrics, {len(call_metrics_buffer)} kept for retry")
+
+async def get_call_stats(days: int) -> dict:
+    """
+    Daily token spend and p50/p95 latency per model of the last `days` days, rows still in call_metrics_buffer are not included.
+    """
+    daily, latencies = await run_db(mysqlconn.get_call_metrics, days)
+    by_model = {}
+    for row in latencies:
+        by_model.setdefault(row["model"], []).append(row["latency_ms"])
+    latency = {}
+    for model, values in by_model.items():
+        values.sort()
+        latency[model] = {
+            "calls": len(values),
+            "p50_ms": values[(len(values) - 1) // 2],
+            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))]
+        }
+    return {"daily": daily, "latency": latency}
 
-def save_temp_instruction(author, message, response):
-    global mysqlconn
-    mysqlconn.insert_temporary_context(author, message, response)
-    logger.info(f"Appended new temporary instruction")
+async def summarize(client: genai.Client.aio, model: str, text: str) -> str:
+    started = time.perf_counter()
+    try:
+        response = await client.models.generate_content(
+            model=model,
+            contents=[types.Part.from_text(text=text)],
+            config=types.GenerateContentConfig(
+                temperature=0.2,
+                max_output_tokens=SUMMARY_MAX_OUTPUT_TOKENS,
+                system_instruction=SUMMARY_INSTRUCTION,
+            ),
+        )
+    except Exception as e:
+        record_call(model, started, streamed=False, error=e)
+        raise
+    record_call(model, started, response, streamed=False)
+    if not response.text:
+        raise ValueError(f"Empty summary, finish reason: {response.candidates[0].finish_reason if response.candidates else None}")
+    return response.text.strip()
+
+async def compact_context(client: genai.Client.aio) -> int:
+    """
+    Folds the oldest batch of exchanges beyond COMPACTION_KEEP_RAW of the channel with the most of them into one summary,
+    returns the amount of exchanges folded.
+    """
+    batch = await run_db(mysqlconn.get_compaction_batch, COMPACTION_KEEP_RAW, COMPACTION_BATCH_SIZE)
+    if not batch:
+        return 0
+    exchanges = [TMP_CONTEXT_FORMAT.format(author=row["author"], message=row["message"], response=row["response"]) for row in batch]
+    summary = await quota.call(lambda model: summarize(client, model, "\n".join(exchanges)))
+    channel_id = batch[0]["channel_id"]
+    await run_db(mysqlconn.save_summary, batch, summary)
+    window = context_partitions.peek(channel_id)
+    if window is not None: # the summary replaces the raw exchanges, the loaded window must not send both
+        window.remove_exchanges(exchanges)
+        window.set_summaries(await run_db(mysqlconn.get_summaries, channel_id, SUMMARY_LIMIT), SUMMARY_HEADER)
+    logger.info(f"Compacted exchanges {batch[0]['id']}-{batch[-1]['id']} of channel {channel_id} into a summary of ~{len(summary) // 4} tokens")
+    return len(batch)
 
 async def get_client(
         api_version: str | None = None
@@ -49,14 +229,131 @@ async def get_client(
     except Exception:
         raise
 
+def build_prompt(context_text: str, user_info: str, user_input: str, images: list[tuple[bytes, str]] | None = None) -> list[types.Part]:
+    prompt = f'''
+    {{
+        "Context": {context_text},
+        "User info": {user_info},
+        "User message": "{user_input}"
+    }}
+    '''
+    return [types.Part.from_text(text=prompt), *(types.Part.from_bytes(data=data, mime_type=mime_type) for data, mime_type in images or [])]
+
+def build_config(
+    context: ContextWindow,
+    user_input: str,
+    cached_content: str | None,
+    *,
+    max_output_tokens: int,
+    temperature: float,
+    top_p: float
+) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        temperature=temperature,
+        top_p=top_p,
+        max_output_tokens=max_output_tokens,
+        system_instruction=None if cached_content else context.parts(user_input),
+        cached_content=cached_content,
+    )
+
+def normalize_response(text: str) -> str:
+    response_text = text.removeprefix('FRS Bot: ')
+    return re.sub(r"\n\s*\n+", "\n", response_text.strip())
+
+async def start_stream(stream) -> AsyncIterator[types.GenerateContentResponse]:
+    """
+    Pulls the first chunk of a generate_content_stream response, the request itself is only sent on the first iteration.
+    """
+    iterator = aiter(stream)
+    first = await anext(iterator, None)
+    async def chunks():
+        if first is None:
+            return
+        yield first
+        async for chunk in iterator:
+            yield chunk
+    return chunks()
+
+async def send_request(
+    call,
+    client: genai.Client.aio,
+    model: str,
+    context: ContextWindow,
+    user_input: str,
+    contents: list[types.Part],
+    generation: dict,
+    *,
+    stream: bool = False
+):
+    """
+    Calls client.models.generate_content(_stream) with the persistent prefix from the cache when possible, inline otherwise.
+    stream: the first chunk is pulled here, so a stale cache is retried inline for streams as well.
+    """
+    async def request(cached_content: str | None):
+        response = await call(
+            model=model,
+            contents=[*context.tail_parts(user_input), *contents] if cached_content else contents,
+            config=build_config(context, user_input, cached_content, **generation),
+        )
+        return await start_stream(response) if stream else response
+
+    cached_content = await get_cached_prefix(client, model)
+    if cached_content is None:
+        return await request(None)
+    return await prefix_cache.run(cached_content, request)
+
+def record_call(
+    model: str,
+    started: float,
+    response: types.GenerateContentResponse | None = None,
+    *,
+    streamed: bool,
+    instruction_tokens: int | None = None,
+    error: Exception | None = None
+):
+    """
+    Queues the usage of one gemini call for the call_metrics table.
+    """
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    usage = getattr(response, "usage_metadata", None)
+    if error is not None:
+        finish_reason = f"ERROR {getattr(error, 'code', None) or type(error).__name__}"
+    else:
+        candidates = getattr(response, "candidates", None) or []
+        finish_reason = candidates[0].finish_reason if candidates else None
+        finish_reason = getattr(finish_reason, "name", finish_reason)
+    row = (
+        datetime.now(),
+        model,
+        latency_ms,
+        getattr(usage, "prompt_token_count", None),
+        getattr(usage, "cached_content_token_count", None),
+        getattr(usage, "candidates_token_count", None),
+        getattr(usage, "total_token_count", None),
+        instruction_tokens,
+        finish_reason,
+        streamed
+    )
+    logger.info(f"Gemini call: model {model}, {latency_ms} ms, usage {usage}, finish {finish_reason}, instruction ~{instruction_tokens} tokens")
+    if call_metrics_buffer.append(row):
+        task = asyncio.create_task(flush_call_metrics())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+async def remember_exchange(channel_id: int, context: ContextWindow, user_info: str, user_input: str, response_text: str):
+    await save_temp_instruction(channel_id=channel_id, author=user_info, message=user_input, response=response_text)
+    logger.info(f'Context window of the request in channel {channel_id}: {context.stats()}')
+    context.add_exchange(TMP_CONTEXT_FORMAT.format(author=user_info, message=user_input, response=response_text))
+    context_partitions.evict()
+
 async def generate_response(
     client: genai.Client.aio,
     context_text: str,
     user_info: str,
     user_input: str,
     *,
-    image_urls: list[str] | None = None,
-    image_bytes: list[bytes] | None = None,
+    channel_id: int,
+    images: list[tuple[bytes, str]] | None = None,
     model: str = GeminiModel,
     max_output_tokens: int = 512,
     temperature: float = 0.6,
@@ -64,52 +361,23 @@ async def generate_response(
 ) -> str:
     """
     Send a prompt to the AI and return generated content (text).
+    channel_id: channel (or thread) whose conversation memory is used and extended.
+    images: (bytes, mime type) pairs, already downscaled (see image_pipeline.prepare_image).
     """
-    prompt = f'''
-    {{
-        "Context": {context_text},
-        "User info": {user_info},
-        "User message": "{user_input}"
-    }}
-    '''
-    contents = [types.Part.from_text(text=prompt)]
-    
-    if image_urls:
-        raise NotImplementedError("Images are not supported yet")
-        for url in image_urls:
-            try:
-                contents.append(types.Part.from_image(url))
-            except Exception as e:
-                # Log invalid image URLs but continue
-                logger.warning(f"Could not add image {url} to prompt: {e}")
-    
-    if image_bytes:
-        raise NotImplementedError("Images are not supported yet")
-        for img_bytes in image_bytes:
-            try:
-                contents.append(types.Part.from_image(img_bytes))
-            except Exception as e:
-                logger.warning(f"Could not add image bytes: {e}\n{traceback.format_exc()}")
+    context = await get_context(channel_id)
+    contents = build_prompt(context_text, user_info, user_input, images)
 
+    generation = {"max_output_tokens": max_output_tokens, "temperature": temperature, "top_p": top_p}
+    started = time.perf_counter()
     try:
-        response = await client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                temperature=temperature,
-                top_p=top_p,
-                max_output_tokens=max_output_tokens,
-                system_instruction=INSTRUCTION,
-            ),
-        )
-        response_text = response.text.removeprefix('FRS Bot: ')
-        response_text_normalized = re.sub(r"\n\s*\n+", "\n", response_text.strip())
-        save_temp_instruction(author=user_info, message=user_input, response=response_text_normalized)
-        INSTRUCTION.append(types.Part(text=TMP_CONTEXT_FORMAT.format(author=user_info, message=user_input, response=response_text_normalized)))
-        logger.info(f'Current instruction length: {len(INSTRUCTION)}')
-        return response_text_normalized
-    except Exception:
+        response = await send_request(client.models.generate_content, client, model, context, user_input, contents, generation)
+    except Exception as e:
+        record_call(model, started, streamed=False, instruction_tokens=context.tokens, error=e)
         raise
+    record_call(model, started, response, streamed=False, instruction_tokens=context.tokens)
+    response_text_normalized = normalize_response(response.text)
+    await remember_exchange(channel_id, context, user_info, user_input, response_text_normalized)
+    return response_text_normalized
 
 async def generate_response_stream(
     client: genai.Client.aio,
@@ -117,50 +385,35 @@ async def generate_response_stream(
     user_info: str,
     user_input: str,
     *,
-    image_urls: list[str] | None = None,
-    model: str = "gemini-2.5-flash",
-    max_output_tokens: int = 256,
+    channel_id: int,
+    images: list[tuple[bytes, str]] | None = None,
+    model: str = GeminiModel,
+    max_output_tokens: int = 512,
     temperature: float = 0.6,
     top_p: float = 0.9,
 ):
     """
     Stream AI response with partial updates.
-    Yields partial text as it is generated.
+    Yields the text generated so far after every chunk, the last value is the normalized full response, which is also saved to the context.
     """
-    raise NotImplementedError("Not working with streaming")
-    global INSTRUCTION
-    prompt = f'''
-    {{
-        "Context": {context_text},
-        "User info": {user_info},
-        "User message": "{user_input}"
-    }}
-    '''
-    contents = [types.Part.from_text(text=prompt)]
-
-    if image_urls:
-        for url in image_urls:
-            try:
-                contents.append(types.Part.from_image(url))
-            except Exception as e:
-                logger.warning(f"Could not add image {url}: {e}")
-
+    context = await get_context(channel_id)
+    contents = build_prompt(context_text, user_info, user_input, images)
+    generation = {"max_output_tokens": max_output_tokens, "temperature": temperature, "top_p": top_p}
+    started = time.perf_counter()
     response_text = ""
-
+    last_chunk = None
     try:
-        async for event in client.models.stream_content(
-            model=model,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                temperature=temperature,
-                top_p=top_p,
-                max_output_tokens=max_output_tokens,
-                system_instruction=instruction,
-            ),
-        ):
-            # Only handle partial text deltas
-            if event.type == "response.output_text.delta":
-                response_text += event.delta
-                yield response_text
+        stream = await send_request(client.models.generate_content_stream, client, model, context, user_input, contents, generation, stream=True)
+        async for last_chunk in stream:
+            if last_chunk.text:
+                response_text += last_chunk.text
+                yield response_text.removeprefix('FRS Bot: ')
     except Exception as e:
-        raise RuntimeError(f"Failed during streaming: {e}") from e
\ No newline at end of file
+        record_call(model, started, last_chunk, streamed=True, instruction_tokens=context.tokens, error=e)
+        raise
+    record_call(model, started, last_chunk, streamed=True, instruction_tokens=context.tokens) # usage metadata of a stream comes with the last chunk
+    if not response_text:
+        raise ValueError(f"Empty streamed response, last chunk: {last_chunk}")
+    response_text_normalized = normalize_response(response_text)
+    await remember_exchange(channel_id, context, user_info, user_input, response_text_normalized)
+    yield response_text_normalized
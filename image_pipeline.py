@@ -0,0 +1,70 @@
+import asyncio
+import io
+import logging
+import discord
+from PIL import Image, ImageOps
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")
+MAX_ATTACHMENT_BYTES = 10 * 1024 * 1024 # attachments above this are not downloaded at all
+MAX_IMAGES = 3 # images per message sent to gemini
+MAX_DIMENSION = 1024 # longest side after downscaling, gemini does not read finer detail than this from a single image
+MAX_PIXELS = 40_000_000 # refuse to decode anything bigger (decompression bombs)
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+class ImageRejectedError(ValueError):
+    pass
+
+def is_image_attachment(attachment: discord.Attachment) -> bool:
+    if attachment.content_type:
+        return attachment.content_type.startswith("image/")
+    return attachment.filename.lower().endswith(IMAGE_EXTENSIONS)
+
+def prepare_image(data: bytes, max_dimension: int = MAX_DIMENSION) -> tuple[bytes, str]:
+    """
+    Decodes an image, downscales it to max_dimension on the longest side and re-encodes it:
+    JPEG for opaque images, WEBP when there is transparency. Animated images keep their first frame.
+    Returns (bytes, mime type). Blocking, run it in a thread.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width * image.height > MAX_PIXELS:
+            raise ImageRejectedError(f"Image is too large: {image.width}x{image.height}")
+        image.seek(0)
+        image = ImageOps.exif_transpose(image) # phone photos store the rotation in exif only
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        output = io.BytesIO()
+        if has_alpha:
+            image.convert("RGBA").save(output, format="WEBP", quality=WEBP_QUALITY, method=4)
+            return output.getvalue(), "image/webp"
+        image.convert("RGB").save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return output.getvalue(), "image/jpeg"
+
+async def read_message_images(
+    message: discord.Message,
+    logger: logging.Logger,
+    *,
+    max_images: int = MAX_IMAGES,
+    max_bytes: int = MAX_ATTACHMENT_BYTES,
+    max_dimension: int = MAX_DIMENSION
+) -> list[tuple[bytes, str]]:
+    """
+    Reads and downscales up to max_images image attachments of a message. Attachments that are too big or fail to decode are skipped.
+    """
+    attachments = [attachment for attachment in message.attachments if is_image_attachment(attachment)][:max_images]
+
+    async def read(attachment: discord.Attachment) -> tuple[bytes, str] | None:
+        if attachment.size > max_bytes:
+            logger.warning(f"Skipped attachment {attachment.filename}: {attachment.size} bytes is over the {max_bytes} bytes limit")
+            return None
+        try:
+            data = await attachment.read()
+            prepared, mime_type = await asyncio.to_thread(prepare_image, data, max_dimension)
+        except Exception as e:
+            logger.warning(f"Failed to prepare attachment {attachment.filename}: {e}")
+            return None
+        logger.info(f"Prepared attachment {attachment.filename}: {len(data)} -> {len(prepared)} bytes ({mime_type})")
+        return prepared, mime_type
+
+    images = await asyncio.gather(*(read(attachment) for attachment in attachments))
+    return [image for image in images if image is not None]
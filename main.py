@@ -7,11 +7,11 @@ import difflib
 import traceback
 import pymysql
 import re
-import requests
-import ast
+import aiohttp
 from discord.ext import commands, tasks
 from logging.handlers import TimedRotatingFileHandler
 from collections import defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime, time, timedelta, timezone
 from configs.tokens import DiscordToken, Grafana, Servers, TempVoiceChannels, ApolloID as apollo_id, AutoBanChannels, AutoBanRoleBlacklist, zugzwang, discord_status
 from configs.seeding_messages_config import autopost_conf
@@ -21,30 +21,53 @@ from configs.timestamp_generator_lookup import get_timezones, get_formats, get_f
 from translations.ua import *
 import csv
 import io
-from gemini_wrapper import get_client, generate_response
-from mysql_helper import get_db_connection, GeminiMySqlConnectionManager
-from google.genai.errors import ClientError
-import pytz
+from gemini_wrapper import get_client, generate_response, generate_response_stream, STREAM_RESPONSES, IMAGE_MAX_DIMENSION, REPLY_CHAIN_DEPTH, REPLY_CHAIN_TOKEN_BUDGET, scheduler as gemini_scheduler, quota as gemini_quota, flush_temp_instructions, flush_call_metrics, get_call_stats, temp_context_buffer, call_metrics_buffer, init_context, is_context_ready, reload_persistent_context, compact_context
+from mysql_helper import close_pools, run_db, GrafanaMySqlRepository, EventLedgerRepository, PlayersNotFoundError, query_stats
+from query_metrics import slow_query_logger
+from player_directory import PlayerDirectory
+from gemini_scheduler import SupersededError
+from gemini_quota import QuotaExhaustedError
+from image_pipeline import read_message_images
+from reply_chain import MessageLRU, build_reply_chain, resolve_reference
+from event_index import EventIndex
+from apollo_parser import EventRoster, RosterStore, diff_rosters, parse_event, roster_from_rows
 import json
 from configs.amp_api_helper import get_amp_servers, send_reboot_server, send_set_zomboid_mods
 from typing import Optional
 from urllib.parse import urlparse
+from csv_import import read_rows
 
 DISCORD_MAX_MESSAGE_LEN = 2000
+GRAFANA_HTTP_TIMEOUT = 10 # seconds
+MATCH_HISTORY_COLUMNS = 9 # date;layer;opponent;mercs;tickets r1;tickets r2;event url;vods;tactics, one match_history_add record
+CHANNEL_FETCH_CONCURRENCY = 5 # parallel fetch_channel calls for channels missing from the cache
+ATTENDANCE_SCAN_CONCURRENCY = 5 # event channels read in parallel by count_attendance
+LEDGER_FINAL_AFTER = timedelta(days=1) # ledger rows of events this long in the past are trusted without reading the embed again
+COMPACTION_BATCHES_PER_RUN = 4 # summaries generated per compact_gemini_context run at most
+STREAM_EDIT_INTERVAL = 1.2 # seconds between edits of a streamed reply, discord allows about 5 edits per 5 seconds per channel.
+# Concurrent streams of one channel share it, each one edits every STREAM_EDIT_INTERVAL * active streams
 LOG_DIR = "logs"
 PERSIST_DIR = 'persist'
 LOGS_FILENAME = 'botlogger.log'
+SLOW_QUERY_LOGS_FILENAME = 'slow_queries.log'
 TEMP_CHANNELS_PERSIST = 'temp_channels.json'
-GEMINI_CONTEXT_CLEANER_WATERMARK = 'clean_temp_instructions_wtm.json'
+EVENT_INDEX_PERSIST = 'apollo_events.json'
 
 LOGS_FILEPATH = os.path.join(LOG_DIR, LOGS_FILENAME)
+SLOW_QUERY_LOGS_FILEPATH = os.path.join(LOG_DIR, SLOW_QUERY_LOGS_FILENAME)
 TEMP_CHANNELS_FILEPATH = os.path.join(PERSIST_DIR, TEMP_CHANNELS_PERSIST)
-GEMINI_CONTEXT_CLEANER_WATERMARK_FILEPATH = os.path.join(PERSIST_DIR, GEMINI_CONTEXT_CLEANER_WATERMARK)
+EVENT_INDEX_FILEPATH = os.path.join(PERSIST_DIR, EVENT_INDEX_PERSIST)
 
 logger = logging.getLogger("discord")
 logger.setLevel(logging.INFO)
 
-gemini_cleaner_mysql = GeminiMySqlConnectionManager(logger)
+grafana_mysql = GrafanaMySqlRepository(logger)
+player_directory = PlayerDirectory(grafana_mysql, logger)
+event_index = EventIndex(EVENT_INDEX_FILEPATH, apollo_id, ("~", f'{GENERATE_ROSTER_SUCCESS}:'), logger)
+event_rosters = RosterStore() # newest parsed roster per Apollo event message, replaced on every edit
+event_ledger = EventLedgerRepository(logger)
+ledger_states: dict[int, "LedgerState"] = {} # event message id -> LedgerState, dropped together with the event's roster in event_rosters
+started_at = datetime.now(timezone.utc).replace(tzinfo=None) # ledger rows synced before this may have missed edits while offline
 
 os.makedirs(LOG_DIR, exist_ok=True)
 os.makedirs(PERSIST_DIR, exist_ok=True)
@@ -59,6 +82,17 @@ handler = TimedRotatingFileHandler(
     utc=True
 )
 
+slow_query_handler = TimedRotatingFileHandler(
+    filename=SLOW_QUERY_LOGS_FILEPATH,
+    when="midnight",
+    interval=1,
+    backupCount=10,
+    encoding='utf-8',
+    utc=True
+)
+slow_query_handler.setFormatter(logging.Formatter('[{asctime}] [{levelname:<8}] {name}: {message}', '%Y-%m-%d %H:%M:%S', style='{'))
+slow_query_logger.addHandler(slow_query_handler)
+
 intents = discord.Intents.default()
 intents.messages = True
 intents.message_content = True
@@ -73,8 +107,8 @@ message_pool = []
 bot = commands.Bot(command_prefix="/", intents=intents, reconnect=True)
 
 gemini = None
-
-daily_quota_timestamp = None
+player_directory_refresh = None # background refresh of the player directory, at most one at a time
+fetched_messages = MessageLRU() # replied-to messages fetched over REST, reused by the next reply chains
 
 hub_channel_ids = set(TempVoiceChannels)
 temp_channels = {}
@@ -137,6 +171,76 @@ async def send_with_fallback(interaction: discord.Interaction, *args, **kwargs):
     except Exception as e:
         logger.error(f"Failed to respond to interaction: {str(e)}")
 
+class ThrottledMessageEditor:
+    """
+    Edits a message with streamed text at most once per interval, updates in between are coalesced into the next edit.
+    The edit rate limit is per channel, so the interval grows with the editors open in the message's channel.
+    """
+    _active: dict[int, int] = {} # channel id -> editors not closed yet
+
+    def __init__(self, message: discord.Message, interval: float = STREAM_EDIT_INTERVAL, suffix: str = ""):
+        self.message = message
+        self.interval = interval
+        self.suffix = suffix
+        self._pending = None
+        self._shown = None
+        self._last_edit = 0.0
+        self._timer = None
+        self._lock = asyncio.Lock()
+        self._channel_id = message.channel.id
+        self._closed = False
+        self._active[self._channel_id] = self._active.get(self._channel_id, 0) + 1
+
+    @property
+    def channel_interval(self) -> float:
+        return self.interval * max(1, self._active.get(self._channel_id, 0))
+
+    async def update(self, content: str):
+        self._pending = content
+        wait = self._last_edit + self.channel_interval - asyncio.get_running_loop().time()
+        if wait <= 0:
+            await self._edit(self.suffix)
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._edit_later(wait))
+
+    async def finish(self, content: str):
+        self.close()
+        self._pending = content
+        await self._edit("")
+
+    def close(self):
+        """
+        Cancels the pending coalesced edit, a failed or abandoned stream must not edit the message after it,
+        and releases the editor's share of the channel's edit rate.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._closed:
+            self._closed = True
+            remaining = self._active.get(self._channel_id, 1) - 1
+            if remaining > 0:
+                self._active[self._channel_id] = remaining
+            else:
+                self._active.pop(self._channel_id, None)
+
+    async def _edit_later(self, wait: float):
+        await asyncio.sleep(wait)
+        self._timer = None
+        await self._edit(self.suffix)
+
+    async def _edit(self, suffix: str):
+        async with self._lock:
+            content = self._pending
+            if len(content) + len(suffix) > DISCORD_MAX_MESSAGE_LEN:
+                content = f"{content[:DISCORD_MAX_MESSAGE_LEN - len(suffix) - 3]}..."
+            content += suffix
+            if content == self._shown:
+                return
+            await self.message.edit(content=content)
+            self._shown = content
+            self._last_edit = asyncio.get_running_loop().time()
+
 async def guild_chunk_with_timeout(guild: discord.guild, timeout=2):
     try:
         await asyncio.wait_for(guild.chunk(), timeout=timeout)
@@ -197,14 +301,8 @@ async def missing_voice_handler(ctx: discord.Interaction, channel_name: str, mes
             return
         mentioned_ids = [mention.id for mention in message.mentions]
         if not mentioned_ids:
-            mentioned_ids = []
-            try:
-                for field in message.embeds[0].fields:
-                    if field.name[:10] == '<:accepted' and field.value[:6] == '>>> <@':
-                        mentions = field.value[4:].replace('<@', '').replace('>', '')
-                        mentioned_ids.extend([int(m) for m in mentions.split('\n') if m])
-            except Exception:
-                return
+            roster = parse_event(message)
+            mentioned_ids = list(roster.accepted) if roster else []
         if not mentioned_ids:
             await ctx.followup.send(f"{MISSING_VOICE_ERROR_NO_MEMBERS}: {message_link}", ephemeral=True)
             return
@@ -262,6 +360,198 @@ async def fetch_message_from_url(ctx: discord.Interaction, message_link):
         logger.error(f"{ERROR_GENERIC}: {e}; traceback: {traceback.format_exc()}")
         return None
 
+async def resolve_event_link(channel: discord.abc.GuildChannel, roster: bool = False) -> str | None:
+    """
+    Link to the Apollo event message (or the roster message) of a channel, from the event index.
+    """
+    message_id = await (event_index.roster_message_id(channel) if roster else event_index.event_message_id(channel))
+    if message_id is None:
+        return None
+    return f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{message_id}"
+
+class LedgerState:
+    """
+    Ledger writes of one event. They run one at a time under lock, in the order of the event's edits.
+    synced: the roster last committed to the ledger, None when it is not known (the next write replaces every signup).
+    """
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.synced: EventRoster | None = None
+        self.channel_id: int | None = None
+        self.users = 0 # writes and deletes holding or waiting for the lock
+        self.deleted = False # the event is gone, writes still queued for it are skipped
+
+def release_ledger_state(event_message_id: int):
+    # called when event_rosters evicts the event, a state in use is dropped by its last user instead
+    state = ledger_states.get(event_message_id)
+    if state is not None and state.users == 0:
+        del ledger_states[event_message_id]
+
+event_rosters.on_evict = release_ledger_state
+
+@asynccontextmanager
+async def locked_ledger_state(event_message_id: int):
+    state = ledger_states.setdefault(event_message_id, LedgerState())
+    state.users += 1
+    try:
+        async with state.lock:
+            yield state
+    finally:
+        state.users -= 1
+        if state.users == 0 and (state.deleted or event_message_id not in event_rosters) and ledger_states.get(event_message_id) is state:
+            del ledger_states[event_message_id]
+
+async def record_event_roster(channel_id: int, roster: EventRoster):
+    """
+    Writes the signup changes of an event since its last committed roster to the ledger, all of its signups
+    when that is not known or the last write failed.
+    """
+    async with locked_ledger_state(roster.message_id) as state:
+        if state.deleted:
+            return
+        state.channel_id = channel_id
+        previous = state.synced
+        added, removed = diff_rosters(previous, roster)
+        if previous is not None and not added and not removed and previous.event_time == roster.event_time:
+            return
+        event_time = roster.event_time.replace(tzinfo=None) if roster.event_time else None
+        try:
+            await run_db(event_ledger.record_event, roster.message_id, channel_id, event_time, added, removed, replace=previous is None)
+            state.synced = roster
+        except Exception as e:
+            logger.warning(f"Failed to record signups of event {roster.message_id}, dropping it from the ledger until the next edit: {e}")
+            state.synced = None
+            try:
+                await run_db(event_ledger.delete_event, roster.message_id) # a partial ledger must not answer lookups
+            except Exception as e:
+                logger.warning(f"Failed to drop stale event {roster.message_id} from the ledger: {e}")
+
+async def delete_ledger_events(event_message_ids: set[int], channel_id: int | None = None):
+    """
+    Drops deleted events from memory and the ledger, every event of the channel as well when channel_id is given.
+    Each event is deleted under its write lock, after the write in flight and instead of the queued ones.
+    """
+    if channel_id is not None:
+        event_message_ids = event_message_ids | {message_id for message_id, state in ledger_states.items() if state.channel_id == channel_id}
+    for message_id in event_message_ids:
+        event_rosters.forget(message_id)
+        ledger_states.setdefault(message_id, LedgerState()).deleted = True
+    for message_id in event_message_ids:
+        async with locked_ledger_state(message_id):
+            try:
+                await run_db(event_ledger.delete_event, message_id)
+            except Exception as e:
+                logger.warning(f"Failed to delete event {message_id} from the ledger: {e}")
+    if channel_id is not None:
+        try:
+            await run_db(event_ledger.delete_channel_events, channel_id)
+        except Exception as e:
+            logger.warning(f"Failed to delete the events of channel {channel_id} from the ledger: {e}")
+
+def ledger_is_current(event: dict) -> bool:
+    """
+    Whether a signup_events row can answer without reading the embed: its signups were synced long enough after the event
+    that they no longer change, or while the bot was receiving edits.
+    """
+    if event["event_time"] is not None and event["synced_at"] >= event["event_time"] + LEDGER_FINAL_AFTER:
+        return True
+    return event["synced_at"] >= started_at
+
+async def get_link_roster(ctx: discord.Interaction, message_link: str) -> EventRoster | None:
+    """
+    Roster of the Apollo event behind a message link: from memory, then the ledger, and only then from the message itself.
+    Reports failures to the user, None then.
+    """
+    parts = message_link.split('/')
+    if len(parts) >= 7 and parts[6].isdigit():
+        message_id = int(parts[6])
+        roster = event_rosters.get(message_id)
+        if roster is not None:
+            return roster
+        try:
+            stored = await run_db(event_ledger.get_event, message_id)
+        except Exception as e:
+            logger.warning(f"Failed to read event {message_id} from the ledger: {e}")
+            stored = None
+        if stored is not None and ledger_is_current(stored[0]):
+            return roster_from_rows(message_id, stored[0]["event_time"], stored[1])
+    message = await fetch_message_from_url(ctx, message_link)
+    if not message:
+        logger.error(f"Message not returned from link: {message_link}")
+        return None
+    if message.author.id != apollo_id:
+        await send_with_fallback(ctx, f"{ERROR_NOT_APPOLO}: {message_link}", ephemeral=True)
+        return None
+    _, roster = event_rosters.update(message)
+    if roster is not None:
+        await record_event_roster(message.channel.id, roster)
+    return roster
+
+async def get_event_roster(channel: discord.TextChannel) -> EventRoster | None:
+    """
+    Parsed Apollo event of a channel. The message is fetched only when its roster is not known yet,
+    later edits reach event_rosters through on_raw_message_edit.
+    """
+    message_id = await event_index.event_message_id(channel)
+    if message_id is None:
+        return None
+    roster = event_rosters.get(message_id)
+    if roster is not None:
+        return roster
+    try:
+        message = await channel.fetch_message(message_id)
+    except discord.NotFound:
+        event_index.observe_delete(channel.id, {message_id})
+        return None
+    _, roster = event_rosters.update(message)
+    if roster is not None:
+        await record_event_roster(channel.id, roster)
+    return roster
+
+async def collect_member_signups(channels: list[discord.TextChannel], member_id: int) -> list[tuple[discord.TextChannel, datetime, list[str]]]:
+    """
+    (channel, event time, labels the member signed up with) of every channel with an Apollo event.
+    Answered from the ledger where it is current, the remaining channels are read concurrently and recorded.
+    """
+    scan_limit = asyncio.Semaphore(ATTENDANCE_SCAN_CONCURRENCY)
+
+    async def find_event(channel: discord.TextChannel) -> int | None:
+        async with scan_limit:
+            return await event_index.event_message_id(channel)
+
+    async def scan(channel: discord.TextChannel) -> EventRoster | None:
+        async with scan_limit:
+            return await get_event_roster(channel)
+
+    event_ids = dict(zip((channel.id for channel in channels), await asyncio.gather(*(find_event(channel) for channel in channels))))
+    try:
+        events = {
+            event["event_message_id"]: event
+            for event in await run_db(event_ledger.get_events, [event_id for event_id in event_ids.values() if event_id is not None])
+            if ledger_is_current(event)
+        }
+        signup_rows = await run_db(event_ledger.get_member_signups, member_id, list(events))
+    except Exception as e:
+        logger.warning(f"Event ledger unavailable, reading every event: {e}")
+        events, signup_rows = {}, []
+    labels = {}
+    for row in signup_rows:
+        labels.setdefault(row["event_message_id"], []).append(row["label"])
+
+    unknown = [channel for channel in channels if event_ids[channel.id] is not None and event_ids[channel.id] not in events]
+    rosters = dict(zip((channel.id for channel in unknown), await asyncio.gather(*(scan(channel) for channel in unknown))))
+    signups = []
+    for channel in channels:
+        if event_ids[channel.id] in events:
+            event = events[event_ids[channel.id]]
+            if event["event_time"] is None:
+                continue
+            signups.append((channel, event["event_time"].replace(tzinfo=timezone.utc), labels.get(event["event_message_id"], [])))
+        elif rosters.get(channel.id) and rosters[channel.id].event_time:
+            roster = rosters[channel.id]
+            signups.append((channel, roster.event_time, roster.labels_of(member_id)))
+    return signups
+
 @bot.event
 async def on_disconnect():
     logger.warning("Bot disconnected from Discord websocket!")
@@ -313,16 +603,34 @@ async def on_ready():
         logger.info(f"Initialized gemini client successfully")
     except Exception as e:
         logger.error(f"Failed to get a client for gemini: {e}; traceback: {traceback.format_exc()}")
-    try:
-        logger.info(f"Initializing gemini autoclear instructions")
-        if not clean_temp_instructions.is_running():
-            logger.info(f"Currently not running, starting")
-            clean_temp_instructions.start()
-    except:
-        logger.exception(f'Failed to initialize auto instruction clear')
+    if not flush_gemini_context.is_running():
+        flush_gemini_context.start()
+    if not is_context_ready() and not bootstrap_gemini_context.is_running():
+        bootstrap_gemini_context.start()
+    if not reload_gemini_persistent_context.is_running():
+        reload_gemini_persistent_context.start()
+    if not compact_gemini_context.is_running():
+        compact_gemini_context.start()
 
     load_temp_channels()
     logger.info(f"Loaded temp_channels: {temp_channels}")
+    # the full directory load waits on the db, local state above must not wait for it
+    refresh_player_directory()
+
+def refresh_player_directory():
+    """
+    Starts a background refresh of the player directory if it is stale and none is running yet.
+    """
+    global player_directory_refresh
+    if not player_directory.is_stale() or (player_directory_refresh is not None and not player_directory_refresh.done()):
+        return
+    player_directory_refresh = asyncio.create_task(load_player_directory())
+
+async def load_player_directory():
+    try:
+        await player_directory.ensure_fresh()
+    except Exception as e:
+        logger.error(f"Failed to load player directory: {e}; traceback: {traceback.format_exc()}")
 
 # Temp Voice Channels
 @bot.event
@@ -499,6 +807,37 @@ async def on_voice_state_update(member, before, after):
 #     # Ensure commands still get processed
 #     await bot.process_commands(message)
 
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    event_index.observe_edit(payload)
+    fetched_messages.refresh(payload.message) # reply chains must not keep sending the text from before the edit
+    if payload.message.author.id == apollo_id:
+        previous, roster = event_rosters.update(payload.message)
+        if roster is not None and roster is not previous:
+            await record_event_roster(payload.channel_id, roster)
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    deleted_event = event_index.observe_delete(payload.channel_id, {payload.message_id})
+    event_rosters.forget(payload.message_id)
+    fetched_messages.discard(payload.message_id)
+    if deleted_event is not None:
+        await delete_ledger_events({deleted_event})
+
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    deleted_event = event_index.observe_delete(payload.channel_id, payload.message_ids)
+    for message_id in payload.message_ids:
+        event_rosters.forget(message_id)
+        fetched_messages.discard(message_id)
+    if deleted_event is not None:
+        await delete_ledger_events({deleted_event})
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    deleted_event = event_index.drop_channel(channel.id)
+    await delete_ledger_events({deleted_event} if deleted_event is not None else set(), channel.id)
+
 @bot.event
 async def on_message_edit(before: discord.Message, after: discord.Message):
     if message.author == bot.user: # skip checking own messages entirely
@@ -523,6 +862,7 @@ async def on_message_edit(before: discord.Message, after: discord.Message):
     
 @bot.event
 async def on_message(message: discord.Message):
+    event_index.observe(message) # before the own message check, generated rosters are posted by the bot
     if message.author == bot.user: # skip checking own messages entirely
         await bot.process_commands(message)
         return
@@ -538,10 +878,9 @@ async def on_message(message: discord.Message):
         return
 
     global gemini
-    global daily_quota_timestamp
 
-    # Ignore messages from the bot itself
-    if not gemini:
+    # Ignore messages until gemini and its context are ready
+    if not gemini or not is_context_ready():
         await bot.process_commands(message)
         return
 
@@ -564,122 +903,102 @@ async def on_message(message: discord.Message):
     replied_msg = None
 
     if message.reference:
-        try:
-            replied_msg = await message.channel.fetch_message(message.reference.message_id)
-            if replied_msg.author == bot.user:
-                should_respond = True
-        except Exception as e:
-            logger.warning(f"Could not fetch replied message: {e}")
+        replied_msg = await resolve_reference(message, fetched_messages, logger)
+        if replied_msg and replied_msg.author == bot.user:
+            should_respond = True
 
     if not should_respond:
         await zugzwang_clown(message)
         await bot.process_commands(message)
         return
 
-    # Include context if replying to a message
+    # Include context if replying to a message, the whole reply chain oldest first
     context_text = ""
     if replied_msg:
         #if replied_msg.author == bot.user:
         #    context_text = f"In reply to FRS bot: {replied_msg.content}\n"
         #else:
         #    context_text = f"In reply to message by {replied_msg.author.name} ({replied_msg.author.display_name}) ({replied_msg.author.id}): {replied_msg.content}\n"
-        context_text = f'{{"Context author": "{{"Username": "{replied_msg.author.name}", "Nickname": "{replied_msg.author.display_name}", "User ID": "{replied_msg.author.id}"}}", "Context message": "{replied_msg.content}"}}'
-
-    # Detect image URLs in message content and attachments
-    # image_urls = [
-    #     url for url in re.findall(r"(https?://\S+\.(?:png|jpg|jpeg|gif|webp))", message.content, re.IGNORECASE)
-    # ]
-    # image_bytes_list = []
-    # for attachment in message.attachments:
-    #     if attachment.filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".webp")):
-    #         #image_urls.append(attachment.url)
-    #         try:
-    #             image_bytes = await attachment.read()  # <-- gets bytes
-    #             image_bytes_list.append(image_bytes)
-    #         except Exception as e:
-    #             logger.warning(f"Failed to read attachment {attachment.filename}: {e}")
+        chain = await build_reply_chain(
+            message,
+            fetched_messages,
+            logger,
+            max_depth=REPLY_CHAIN_DEPTH,
+            token_budget=REPLY_CHAIN_TOKEN_BUDGET,
+            first=replied_msg
+        )
+        context_entries = [
+            f'{{"Context author": "{{"Username": "{msg.author.name}", "Nickname": "{msg.author.display_name}", "User ID": "{msg.author.id}"}}", "Context message": "{msg.content}"}}'
+            for msg in chain
+        ]
+        context_text = context_entries[0] if len(context_entries) == 1 else f'[{", ".join(context_entries)}]'
+
+    # Image attachments, downscaled before they are sent
+    images = await read_message_images(message, logger, max_dimension=IMAGE_MAX_DIMENSION)
 
     # Build prompt for AI
     # prompt = f"[CONTEXT INFO]\n{context_text}\n[USER INFO] {user_info}]\n[USER MESSAGE] {user_input}"
 
     if user_input == "FRS Bot":
-        if context_text or not context_text == "":
+        if images:
+            user_input = "Reply to the attached image."
+        elif context_text or not context_text == "":
             user_input = "Reply to the message from the context block." # tries to fix the @FRS_bot message in reply to other user's message
         else:
             user_input = "Hi!"
 
     # Send initial "thinking" message
+    loading = discord.utils.get(bot.emojis, name='loading') or '...'
     try:
-        thinking_msg = await message.reply(f"FRS Bot думає{discord.utils.get(bot.emojis, name='loading') or '...'}", mention_author=False)
+        thinking_msg = await message.reply(f"FRS Bot думає{loading}", mention_author=False)
     except Exception as e:
         logger.error(f"Failed to send thinking message: {e}")
         await bot.process_commands(message)
         return
 
+    async def show_queue_position(position: int):
+        await thinking_msg.edit(content=f"FRS Bot думає (черга: {position}){loading}")
+
+    async def stream_reply(model: str) -> str:
+        editor = ThrottledMessageEditor(thinking_msg, suffix=f" {loading}")
+        text = ""
+        try:
+            async for text in generate_response_stream(gemini, context_text, user_info, user_input, channel_id=message.channel.id, images=images, model=model):
+                await editor.update(text)
+            await editor.finish(text) # last value is the normalized full response
+        finally:
+            editor.close() # before the quota fallback retries with the next model
+        return text
+
     # Stream response from Gemini
     try:
-        pst = pytz.timezone("US/Pacific")
-        now_pst = datetime.now(pst)
-        if (not daily_quota_timestamp or daily_quota_timestamp < now_pst):
-            response = await generate_response(gemini, context_text, user_info, user_input) #, image_urls=image_urls, image_bytes=image_bytes_list)
-            await thinking_msg.edit(content=response)
-        else:
-            logger.warning(f"Quota exceeded for the current day, skipping sending the request.")
-            await thinking_msg.edit(content=f"❌Помилка генерації відповіді. Квота перевищена, спробуйте <t:{int(daily_quota_timestamp.timestamp())}:R>.")
-    except ClientError as e:
-        logger.error(f"Error generating response. Quota exceeded.")
-        if "429" in str(e):
-            try:
-                pst = pytz.timezone("US/Pacific")
-                now_pst = datetime.now(pst)
-                if "retryDelay" in str(e) and "You exceeded your current quota" not in str(e):
-                    match = re.search(r"(\{.*\})", str(e), re.DOTALL)
-                    response_dict = ast.literal_eval(match.group(1))
-                    retry_delay_td = None
-                    for detail in response_dict.get("error", {}).get("details", []):
-                        if detail.get("@type", "").endswith("RetryInfo") and "retryDelay" in detail:
-                            retry_delay_str = detail["retryDelay"]
-                            pattern = r"(\d+)([hms])"
-                            kwargs = {"hours": 0, "minutes": 0, "seconds": 0}
-                            for amount, unit in re.findall(pattern, retry_delay_str):
-                                amount = int(amount)
-                                if unit == "h":
-                                    kwargs["hours"] += amount
-                                elif unit == "m":
-                                    kwargs["minutes"] += amount
-                                elif unit == "s":
-                                    kwargs["seconds"] += amount
-                            retry_delay_td = timedelta(**kwargs)
-                    if retry_delay_td:
-                        retry_time = now_pst + retry_delay_td
-                    else:
-                        logger.warning(f"Failed to parse error dict: {str(response_dict)}")
-                        midnight_today = now_pst.replace(hour=0, minute=0, second=0, microsecond=0)
-                        retry_time = midnight_today + timedelta(days=1)
-                    unix_ts = int(retry_time.timestamp())
-                    timestamp_try_again = f"<t:{unix_ts}:R>"
-                    await thinking_msg.edit(content=f"❌Помилка генерації відповіді. Квота перевищена, спробуйте {timestamp_try_again}.")
-                else:
-                    logger.warning(f"Quota exceeded for the current day.")
-                    midnight_today = now_pst.replace(hour=0, minute=0, second=0, microsecond=0)
-                    next_midnight = midnight_today + timedelta(days=1)
-                    unix_ts = int(next_midnight.timestamp())
-                    daily_quota_timestamp = next_midnight
-                    timestamp_try_again = f"<t:{unix_ts}:R>"
-                    await thinking_msg.edit(content=f"❌Помилка генерації відповіді. Квота перевищена, спробуйте {timestamp_try_again}.")
-            except (ValueError, SyntaxError, TypeError) as e:
-                logger.exception(f"Error decoding the ast. {e}")
-                try:
-                    await thinking_msg.delete()
-                except Exception as e:
-                    logger.exception(f"Error deleting the message. {e}")
-            except Exception as e:
-                try:
-                    await thinking_msg.delete()
-                except Exception as e:
-                    logger.exception(f"Error deleting the message. {e}")
+        if STREAM_RESPONSES:
+            await gemini_scheduler.run(
+                message.channel.id,
+                message.author.id,
+                lambda: gemini_quota.call(stream_reply),
+                on_position=show_queue_position
+            )
         else:
-            raise e
+            response = await gemini_scheduler.run(
+                message.channel.id,
+                message.author.id,
+                lambda: gemini_quota.call(lambda model: generate_response(gemini, context_text, user_info, user_input, channel_id=message.channel.id, images=images, model=model)),
+                on_position=show_queue_position
+            )
+            await thinking_msg.edit(content=response)
+    except SupersededError:
+        logger.info(f"Dropped queued gemini request of {message.author.name}, a newer message replaced it")
+        try:
+            await thinking_msg.delete()
+        except Exception as e:
+            logger.exception(f"Error deleting the message. {e}")
+    except QuotaExhaustedError as e:
+        logger.warning(f"Quota exceeded for all gemini models, retry at {e.retry_at.isoformat()}")
+        try:
+            await thinking_msg.edit(content=f"❌Помилка генерації відповіді. Квота перевищена, спробуйте <t:{int(e.retry_at.timestamp())}:R>.")
+        except Exception as e:
+            logger.exception(f"Error editing the message. {e}")
     except Exception as e:
         logger.error(f"Error during response from Gemini: {e}")
         try:
@@ -734,26 +1053,43 @@ async def before_daily_autopost():
     except Exception as e:
         logger.error(f"[daily_autopost():before_daily_autopost()] {ERROR_GENERIC}: {e}; traceback: {traceback.format_exc()}")
 
-@tasks.loop(minutes=10)
-async def clean_temp_instructions():
-    global gemini_cleaner_mysql
-    now = datetime.now(timezone.utc)
-    if now.hour != 23:
-        return
-    last_run = load_watermark(GEMINI_CONTEXT_CLEANER_WATERMARK_FILEPATH)
-    if last_run and last_run.date() == now.date():
-        return
+@tasks.loop(seconds=30)
+async def flush_gemini_context():
+    await flush_temp_instructions()
+    await flush_call_metrics()
+
+@tasks.loop(seconds=30)
+async def bootstrap_gemini_context():
+    # retried until MySQL is reachable, the bot keeps running without gemini replies meanwhile
     try:
-        gemini_cleaner_mysql.clean_temporary_context()
-        write_watermark(GEMINI_CONTEXT_CLEANER_WATERMARK_FILEPATH, now)
-        logger.info(f"Cleared gemini old context")
-    except:
-        logger.exception(f"Failed to clear temp context in gemini mysql")
+        await init_context()
+        bootstrap_gemini_context.stop()
+    except Exception as e:
+        logger.error(f"Failed to init gemini context, retrying in 30 seconds: {e}; traceback: {traceback.format_exc()}")
+
+@tasks.loop(minutes=30)
+async def compact_gemini_context():
+    # off-peak only: skipped while anyone waits for a reply, and stops as soon as someone does
+    for _ in range(COMPACTION_BATCHES_PER_RUN):
+        if not gemini or not is_context_ready() or gemini_scheduler.active or gemini_scheduler.queued:
+            return
+        try:
+            if not await compact_context(gemini):
+                return
+        except QuotaExhaustedError:
+            return
+        except Exception as e:
+            logger.error(f"Failed to compact gemini context: {e}; traceback: {traceback.format_exc()}")
+            return
 
-@clean_temp_instructions.before_loop
-async def before_clean_temp_instructions():
-    await bot.wait_until_ready()
-    logger.info("clean_temp_instructions loop is ready")
+@tasks.loop(minutes=5)
+async def reload_gemini_persistent_context():
+    if not is_context_ready():
+        return
+    try:
+        await reload_persistent_context()
+    except Exception as e:
+        logger.error(f"Failed to reload persistent gemini context: {e}; traceback: {traceback.format_exc()}")
 
 async def autoban_func(message: discord.Message, reason: str):
     user = message.author
@@ -956,23 +1292,16 @@ async def missing_mentions(ctx: discord.Interaction, role: discord.Role, message
     logger.info(f"Received missing_mentions: {message_link}, {[role.name, role2.name if role2 else None, role3.name if role3 else None]}, from user: {ctx.user.name} <@{ctx.user.id}>")
     try:
         if not message_link:
-            async for message in ctx.channel.history(limit=None, oldest_first=True):
-                if message.author.id == apollo_id:
-                    message_link = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{message.id}"
-                    logger.info(f"Found message: {message_link}")
-                    break
-            if not message_link:
+            message_link = await resolve_event_link(ctx.channel)
+            if message_link:
+                logger.info(f"Found message: {message_link}")
+            else:
                 logger.info(f"Message link not resolved")
                 await send_with_fallback(ctx, f"{ERROR_MESSAGE_LINK_CANNOT_BE_RESOLVED} {MISSING_MENTIONS_CANNOT_FIND_APOLLO_MESSAGE}.", ephemeral=True)
                 return
-        message = await fetch_message_from_url(ctx, message_link)
-        if not message:
-            logger.error(f"Message not returned from link: {message_link}")
+        roster = await get_link_roster(ctx, message_link)
+        if not roster:
             return
-        if message.author.id != apollo_id:
-            await send_with_fallback(ctx, f"{ERROR_NOT_APPOLO}: {message_link}", ephemeral=True)
-            return
-        event_mentions = []
         # await ctx.guild.chunk()
         await guild_chunk_with_timeout(ctx.guild)
         role_members = set(member.id for member in role.members)
@@ -983,12 +1312,8 @@ async def missing_mentions(ctx: discord.Interaction, role: discord.Role, message
         if not role_members:
             await send_with_fallback(ctx, f"{MISSING_MENTIONS_ERROR_NO_MEMBERS}: **{role.name}**.", ephemeral=True)
             return
-        for field in message.embeds[0].fields:
-            if field.value[:6] != '>>> <@':
-                continue
-            mentions = field.value[4:].replace('<@', '').replace('>', '')
-            event_mentions.extend([int(m) for m in mentions.split('\n') if m])
-        missing_reactions_list = set(role_members) - set(event_mentions)
+        event_mentions = roster.all_members
+        missing_reactions_list = role_members - event_mentions
         if not missing_reactions_list:
             await send_with_fallback(ctx, f"{MISSING_MENTIONS_MEMBERS_ALL_REACTED} {message_link}.", ephemeral=True)
             return
@@ -1017,15 +1342,7 @@ async def missing_voice(ctx: discord.Interaction,  voice_name: str, message_link
     logger.info(f"Received missing_voice: {voice_name}, {message_link}, from user: {ctx.user.name} <@{ctx.user.id}>")
     try:
         if not message_link:
-            async for message in ctx.channel.history(limit=None, oldest_first=True):
-                if message.content.startswith("~") or message.content.startswith(f'{GENERATE_ROSTER_SUCCESS}:'):
-                    message_link = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{message.id}"
-                    break
-            if not message_link:
-                async for message in ctx.channel.history(limit=1, oldest_first=True):
-                    if message.author.id == apollo_id:
-                        message_link = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{message.id}"
-                        break
+            message_link = await resolve_event_link(ctx.channel, roster=True) or await resolve_event_link(ctx.channel)
             if not message_link:
                 await send_with_fallback(ctx, f"{ERROR_MESSAGE_LINK_CANNOT_BE_RESOLVED} {MISSING_VOICE_CANNOT_FIND_MESSAGE}.", ephemeral=True)
                 return
@@ -1191,24 +1508,14 @@ async def ping_tentative(ctx: discord.Interaction, message_link: str = None):
     logger.info(f"Received ping_tentative: {message_link}, from user: {ctx.user.name} <@{ctx.user.id}>")
     try:
         if not message_link:
-            async for message in ctx.channel.history(limit=None, oldest_first=True):
-                if message.author.id == apollo_id:
-                    message_link = f"https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{message.id}"
-                    break
+            message_link = await resolve_event_link(ctx.channel)
             if not message_link:
                 await send_with_fallback(ctx, f"{ERROR_MESSAGE_LINK_CANNOT_BE_RESOLVED} {MISSING_MENTIONS_CANNOT_FIND_APOLLO_MESSAGE}.", ephemeral=True)
                 return
-        message = await fetch_message_from_url(ctx, message_link)
-        if not message:
+        roster = await get_link_roster(ctx, message_link)
+        if not roster:
             return
-        if message.author.id != apollo_id:
-            await send_with_fallback(ctx, f"{ERROR_NOT_APPOLO}: {message_link}", ephemeral=True)
-            return
-        event_mentions = []
-        for field in message.embeds[0].fields:
-            if field.name[:11] == '<:tentative' and field.value[:6] == '>>> <@':
-                mentions = field.value[4:].replace('<@', '').replace('>', '')
-                event_mentions.extend([int(m) for m in mentions.split('\n') if m])
+        event_mentions = roster.tentative
         if not event_mentions:
             await send_with_fallback(ctx, f"{PING_TENTATIVE_MENTIONS_MEMBERS_ALL_REACTED} {message_link}.", ephemeral=True)
             return
@@ -1218,6 +1525,16 @@ async def ping_tentative(ctx: discord.Interaction, message_link: str = None):
         await send_with_fallback(ctx, f"{ERROR_GENERIC}: {e}", ephemeral=True)
         logger.error(f"{ERROR_GENERIC}: {e}; args: {message_link}; traceback: {traceback.format_exc()}")
 
+async def player_name_autocomplete(interaction: discord.Interaction, value: str):
+    if len(value) < 2:
+        return []
+    refresh_player_directory() # discord drops autocomplete answers after 3s, suggest from what is loaded already
+    return [
+        discord.app_commands.Choice(name=f"{player['lastName']} ({player['steamID']})"[:100], value=player['lastName'][:100])
+        for player in player_directory.search(value, limit=25)
+        if player['lastName']
+    ]
+
 @bot.tree.command(name="grafana_ignore", description=f"{GRAFANA_IGNORE_COMMAND_DESCRIPTION}.")
 @discord.app_commands.describe(
     ignore=f"{GRAFANA_IGNORE_IGNORE_VARIABLE}.",
@@ -1231,94 +1548,90 @@ async def ping_tentative(ctx: discord.Interaction, message_link: str = None):
         discord.app_commands.Choice(name=f"{GRAFANA_IGNORE_VALUE_UNIGNORE}", value=0)
     ]
 )
+@discord.app_commands.autocomplete(
+    name=player_name_autocomplete
+)
 @strict_has_any_role(*unpack_conf())
 @commands.guild_only()
 async def grafana_ignore(interaction: discord.Interaction, ignore: int, player_id: int = None, name:str = None, steam_id: str = None):
     logger.info(f"Received grafana_ignore: {[ignore, player_id, name, steam_id]}, from user: {interaction.user.name} <@{interaction.user.id}>")
     try:
-        conn = get_db_connection()
-    except Exception as e:
-        await send_with_fallback(interaction,f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-        logger.error(f"Connection failed to db; Exception: {e}; traceback: {traceback.format_exc()}")
-        return
-    try:
-        with conn.cursor() as cursor:
-            if player_id is None:
-                if not (name or steam_id):
-                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NEED_ID_OR_NAME}.", ephemeral=True)
+        if player_id is None:
+            if not (name or steam_id):
+                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NEED_ID_OR_NAME}.", ephemeral=True)
+                return
+            elif name and not steam_id:
+                if re.search(r"([`'\";]|--{2,})", name):
+                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {name}", ephemeral=True)
+                    logger.warning(f"Catched SQL inject attempt: {name}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
                     return
-                elif name and not steam_id:
-                    if re.search(r"([`'\";]|--{2,})", name):
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {name}", ephemeral=True)
-                        logger.warning(f"Catched SQL inject attempt: {name}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
-                        return
-                    try:
-                        cursor.execute("SELECT id, lastName, steamID FROM dblog_players WHERE lastName LIKE %s", ('%' + name + '%',))
-                        results = cursor.fetchall()
-                    except Exception as e:
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                        logger.error(f"Select query failed for name: {name}; Exception: {e}; traceback: {traceback.format_exc()}")
-                        return
-                    if not results:
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NAME_SEARCH_NO_RESULTS}: {name}", ephemeral=True)
-                        return
-                    elif len(results) == 1:
-                        player_id = results[0]['id']
-                    else:
-                        message = f"{GRAFANA_IGNORE_MULTIPLE_IDS_FROM_NAME}:"
-                        for r in results:
-                            message += f"\n### {GRAFANA_IGNORE_NAME_STR}: `{r['lastName']}`:\n- {GRAFANA_INGORE_ID_STR}: `{r['id']}`\n- {GRAFANA_IGNORE_STEAMID_STR}: `{r['steamID']}`"
-                        if len(message) > DISCORD_MAX_MESSAGE_LEN:
-                            message = f"{message[:DISCORD_MAX_MESSAGE_LEN-3]}..."
-                        await send_with_fallback(interaction, message, ephemeral=True)
-                        return
+                try:
+                    await player_directory.ensure_fresh()
+                except Exception as e:
+                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+                    logger.error(f"Player directory refresh failed for name: {name}; Exception: {e}; traceback: {traceback.format_exc()}")
+                    return
+                results = player_directory.search(name)
+                exact_results = [r for r in results if (r['lastName'] or '').casefold() == name.casefold()]
+                if len(exact_results) == 1: # e.g. picked from autocomplete, do not make the user disambiguate against longer names
+                    results = exact_results
+                if not results:
+                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NAME_SEARCH_NO_RESULTS}: {name}", ephemeral=True)
+                    return
+                elif len(results) == 1:
+                    player_id = results[0]['id']
                 else:
-                    try:
-                        cursor.execute("SELECT id, lastName, steamID FROM dblog_players WHERE steamID = %s", (steam_id,))
-                        results = cursor.fetchall()
-                    except Exception as e:
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                        logger.error(f"Select query failed for steamID: {steam_id}; Exception: {e}; traceback: {traceback.format_exc()}")
-                        return
-                    if not results:
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_STEAMID_SEARCH_NO_RESULTS}: {steam_id}", ephemeral=True)
-                        return
-                    elif len(results) == 1:
-                        player_id = results[0]['id']
-                    else:
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                        logger.warning(f"Select query for steamID: {steam_id} returned multiple results")
-                        return
-            try:
-                cursor.execute("SELECT id FROM dblog_players WHERE id = %s", (player_id,))
-                existing = cursor.fetchone()
-            except Exception as e:
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                logger.error(f"Select query failed for id: {player_id}; Exception: {e}; traceback: {traceback.format_exc()}")
-                return
-            if not existing:
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NO_ID_FOUND}: {player_id}", ephemeral=True)
-                return
-            ignore_value = ignore #1 if ignore else 0
-            try:
-                cursor.execute("UPDATE dblog_players SET `ignore` = %s WHERE id = %s", (ignore_value, player_id))
-                conn.commit()
-                cursor.execute("SELECT id, lastName, steamID, `ignore` FROM dblog_players WHERE id = %s", (player_id,))
-                updated = cursor.fetchone()
-                updated_ignore = GRAFANA_IGNORE_IGNORED if updated['ignore'] == 1 else GRAFANA_IGNORE_UNIGNORED
-            except Exception as e:
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                logger.error(f"Select query failed for id: {player_id}; Exception: {e}; traceback: {traceback.format_exc()}")
-                return
-            await send_with_fallback(interaction, 
-                    f"### {GRAFANA_IGNORE_SUCCESS}:\n- {GRAFANA_INGORE_ID_STR}: `{updated['id']}`,\n- {GRAFANA_IGNORE_NAME_STR}: `{updated['lastName']}`,\n- {GRAFANA_IGNORE_STEAMID_STR}: `{updated['steamID']}`,\n- {GRAFANA_IGNORE_STATUS_STR}: `{updated_ignore}`.",
-                    ephemeral=False
-                )
+                    message = f"{GRAFANA_IGNORE_MULTIPLE_IDS_FROM_NAME}:"
+                    for r in results:
+                        message += f"\n### {GRAFANA_IGNORE_NAME_STR}: `{r['lastName']}`:\n- {GRAFANA_INGORE_ID_STR}: `{r['id']}`\n- {GRAFANA_IGNORE_STEAMID_STR}: `{r['steamID']}`"
+                    if len(message) > DISCORD_MAX_MESSAGE_LEN:
+                        message = f"{message[:DISCORD_MAX_MESSAGE_LEN-3]}..."
+                    await send_with_fallback(interaction, message, ephemeral=True)
+                    return
+            else:
+                try:
+                    await player_directory.ensure_fresh()
+                except Exception as e:
+                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+                    logger.error(f"Player directory refresh failed for steamID: {steam_id}; Exception: {e}; traceback: {traceback.format_exc()}")
+                    return
+                results = player_directory.by_steam_id(steam_id)
+                if not results:
+                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_STEAMID_SEARCH_NO_RESULTS}: {steam_id}", ephemeral=True)
+                    return
+                elif len(results) == 1:
+                    player_id = results[0]['id']
+                else:
+                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+                    logger.warning(f"Select query for steamID: {steam_id} returned multiple results")
+                    return
+        try:
+            existing = player_directory.get(player_id)
+            if not existing: # might be newer than the last refresh
+                await player_directory.ensure_fresh(force=True)
+                existing = player_directory.get(player_id)
+        except Exception as e:
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+            logger.error(f"Select query failed for id: {player_id}; Exception: {e}; traceback: {traceback.format_exc()}")
+            return
+        if not existing:
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NO_ID_FOUND}: {player_id}", ephemeral=True)
+            return
+        ignore_value = ignore #1 if ignore else 0
+        try:
+            updated = await run_db(grafana_mysql.set_player_ignore, player_id, ignore_value)
+            updated_ignore = GRAFANA_IGNORE_IGNORED if updated['ignore'] == 1 else GRAFANA_IGNORE_UNIGNORED
+        except Exception as e:
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+            logger.error(f"Select query failed for id: {player_id}; Exception: {e}; traceback: {traceback.format_exc()}")
+            return
+        await send_with_fallback(interaction, 
+                f"### {GRAFANA_IGNORE_SUCCESS}:\n- {GRAFANA_INGORE_ID_STR}: `{updated['id']}`,\n- {GRAFANA_IGNORE_NAME_STR}: `{updated['lastName']}`,\n- {GRAFANA_IGNORE_STEAMID_STR}: `{updated['steamID']}`,\n- {GRAFANA_IGNORE_STATUS_STR}: `{updated_ignore}`.",
+                ephemeral=False
+            )
     except Exception as e:
         await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
         logger.error(f"{ERROR_GENERIC}: {e}; args: {ignore}, {player_id}, {name}, {steam_id}; traceback: {traceback.format_exc()}")
-    finally:
-        conn.close()
 
 @bot.tree.command(name="grafana_invite", description=f"{GRAFANA_INVITE_COMMAND_DESCRIPTION}.")
 @discord.app_commands.describe(
@@ -1369,71 +1682,75 @@ async def grafana_invite(interaction: discord.Interaction, name:str, email:str =
         "role": "Editor" if caster == 1 else "Viewer",
         "sendEmail": True if email else False,
     }
+    async def invites_request(session: aiohttp.ClientSession, method: str, **kwargs) -> tuple[int, object]:
+        async with session.request(method, invites_endpoint, headers=header, **kwargs) as response:
+            if response.status == 200:
+                return response.status, await response.json()
+            return response.status, await response.text()
+
     try:
-        try:
-            response_get_noduplicates = requests.get(invites_endpoint, headers=header)
-        except Exception as e:
-                await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
-                logger.error(f"HTTP request failed on invite url retrieval; Exception: {e}; traceback: {traceback.format_exc()}")
-                return
-        if response_get_noduplicates.status_code == 200:
-            exists, url = check_invites(response_get_noduplicates.json(), name)
-        else:
-            await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
-            logger.error(f"Did not receive proper response for get invites for duplicates. Status: {response_get.status_code}, Text: {response_get.text}")
-            return
-        if exists:
-            await send_with_fallback(interaction, f"{GRAFANA_INVITE_SUCCESS}: ```{url}```", ephemeral=True)
-            logger.info(f"Retrieved existing invite for user: {name}, url: {url}")
-            return
-        else:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=GRAFANA_HTTP_TIMEOUT)) as session:
             try:
-                response_post = requests.post(invites_endpoint, json=data, headers=header)
+                status_get_noduplicates, body_get_noduplicates = await invites_request(session, "GET")
             except Exception as e:
+                    await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
+                    logger.error(f"HTTP request failed on invite url retrieval; Exception: {e}; traceback: {traceback.format_exc()}")
+                    return
+            if status_get_noduplicates == 200:
+                exists, url = check_invites(body_get_noduplicates, name)
+            else:
                 await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
-                logger.error(f"HTTP request failed on invite creation; Exception: {e}; traceback: {traceback.format_exc()}")
+                logger.error(f"Did not receive proper response for get invites for duplicates. Status: {status_get_noduplicates}, Text: {body_get_noduplicates}")
+                return
+            if exists:
+                await send_with_fallback(interaction, f"{GRAFANA_INVITE_SUCCESS}: ```{url}```", ephemeral=True)
+                logger.info(f"Retrieved existing invite for user: {name}, url: {url}")
                 return
-            if response_post.status_code == 200:
+            else:
                 try:
-                    response_get = requests.get(invites_endpoint, headers=header)
+                    status_post, body_post = await invites_request(session, "POST", json=data)
                 except Exception as e:
                     await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
-                    logger.error(f"HTTP request failed on invite url retrieval; Exception: {e}; traceback: {traceback.format_exc()}")
+                    logger.error(f"HTTP request failed on invite creation; Exception: {e}; traceback: {traceback.format_exc()}")
                     return
-                if response_get.status_code == 200:
-                    exists, url = check_invites(response_get.json(), name)
-                    if not url:
+                if status_post == 200:
+                    try:
+                        status_get, body_get = await invites_request(session, "GET")
+                    except Exception as e:
                         await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
-                        logger.error(f"Did not get an URL for created user: {name}")
+                        logger.error(f"HTTP request failed on invite url retrieval; Exception: {e}; traceback: {traceback.format_exc()}")
+                        return
+                    if status_get == 200:
+                        exists, url = check_invites(body_get, name)
+                        if not url:
+                            await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
+                            logger.error(f"Did not get an URL for created user: {name}")
+                            return
+                        await send_with_fallback(interaction, f"{GRAFANA_INVITE_SUCCESS}: ```{url}```", ephemeral=True)
+                        logger.info(f"Generated invite for user: {name}, url: {url}")
                         return
-                    await send_with_fallback(interaction, f"{GRAFANA_INVITE_SUCCESS}: ```{url}```", ephemeral=True)
-                    logger.info(f"Generated invite for user: {name}, url: {url}")
+                    else:
+                        await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
+                        logger.error(f"Did not receive proper response for list of invites. Status: {status_get}, Text: {body_get}")
+                        return
+                elif status_post == 412:
+                    await send_with_fallback(interaction, f"{GRAFANA_INVITE_USER_ALREADY_EXISTS}: `{name}`", ephemeral=True)
+                    logger.warning(f"Tried to create an invite for already existing user: {name}")
                     return
                 else:
                     await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
-                    logger.error(f"Did not receive proper response for list of invites. Status: {response_get.status_code}, Text: {response_get.text}")
+                    logger.error(f"Did not receive proper response for create invite. Status: {status_post}, Text: {body_post}")
                     return
-            elif response_post.status_code == 412:
-                await send_with_fallback(interaction, f"{GRAFANA_INVITE_USER_ALREADY_EXISTS}: `{name}`", ephemeral=True)
-                logger.warning(f"Tried to create an invite for already existing user: {name}")
-                return
-            else:
-                await send_with_fallback(interaction, f"{GRAFANA_INVITE_GENERIC_HTTP_FAIL}", ephemeral=True)
-                logger.error(f"Did not receive proper response for create invite. Status: {response_get.status_code}, Text: {response_get.text}")
-                return
     except Exception as e:
         await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
         logger.error(f"{ERROR_GENERIC}: {e}; args: {name}; traceback: {traceback.format_exc()}")
 
-@bot.tree.command(name="match_history_add", description=f"{MATCH_HISTORY_ADD_DESCRIPTION}.")
-@discord.app_commands.describe(
-    data=f"{MATCH_HISTORY_ADD_PARAMETER_DESCRIPTION}"
-)
-@strict_has_any_role(*unpack_matching_conf()) # only for sectorial | глава
-@commands.guild_only()
-async def match_history_add(interaction: discord.Interaction, data:str): # data: mm.dd.yyyy;csl_yehv1;SLS;-;100/0;120/23;discord.gg/channel/1231313;youtube;tactics
-    logger.info(f"Received match_history_add: {data}, from user: {interaction.user.name} <@{interaction.user.id}>")
-    parse_data = data.split(';')
+def parse_match_history_row(parse_data: list[str]) -> tuple[dict, int | None, list]:
+    """
+    Parses the fields of one match_history_add record. event_name is filled later from the channel id, see resolve_channel_name().
+    Returns (parsed_data_dict, channel_id, errors).
+    """
+    parse_data = [field.strip() for field in parse_data]
     parsed_data_dict = {
         "date": None,
         "opponent": None,
@@ -1452,6 +1769,7 @@ async def match_history_add(interaction: discord.Interaction, data:str): # data:
         "ignore": 0,
         "event_name": None
     }
+    channel_id = None
     errors = []
     try:
         parsed_data_dict["date"] = datetime.strptime(parse_data[0], "%d.%m.%Y").date()
@@ -1461,8 +1779,6 @@ async def match_history_add(interaction: discord.Interaction, data:str): # data:
         parsed_data_dict["event_url"] = parse_data[6]
         match = re.match(r"https?://discord\.com/channels/\d+/(\d+)", parsed_data_dict["event_url"])
         channel_id = int(match.group(1))
-        channel = await bot.fetch_channel(channel_id)
-        parsed_data_dict["event_name"] = channel.name
     except Exception as e:
         errors.append(e)
     try:
@@ -1484,6 +1800,34 @@ async def match_history_add(interaction: discord.Interaction, data:str): # data:
         parsed_data_dict["tactics"] = parse_data[8]
     except Exception as e:
         errors.append(e)
+    return parsed_data_dict, channel_id, errors
+
+def find_sql_inject(parsed_data_dict: dict) -> str | None:
+    for value in parsed_data_dict.values():
+        if isinstance(value, str) and re.search(r"([`'\";]|--{2,})", value):
+            return value
+    return None
+
+async def resolve_channel_name(channel_id: int) -> str:
+    channel = bot.get_channel(channel_id) # cached channels cost no REST call
+    if channel is None:
+        channel = await bot.fetch_channel(channel_id)
+    return channel.name
+
+@bot.tree.command(name="match_history_add", description=f"{MATCH_HISTORY_ADD_DESCRIPTION}.")
+@discord.app_commands.describe(
+    data=f"{MATCH_HISTORY_ADD_PARAMETER_DESCRIPTION}"
+)
+@strict_has_any_role(*unpack_matching_conf()) # only for sectorial | глава
+@commands.guild_only()
+async def match_history_add(interaction: discord.Interaction, data:str): # data: mm.dd.yyyy;csl_yehv1;SLS;-;100/0;120/23;discord.gg/channel/1231313;youtube;tactics
+    logger.info(f"Received match_history_add: {data}, from user: {interaction.user.name} <@{interaction.user.id}>")
+    parsed_data_dict, channel_id, errors = parse_match_history_row(data.split(';'))
+    if channel_id is not None:
+        try:
+            parsed_data_dict["event_name"] = await resolve_channel_name(channel_id)
+        except Exception as e:
+            errors.append(e)
     if errors:
         msg = f"{MATCH_HISTORY_ADD_DATA_PARSE_ERROR}: {errors}"
         if len(msg) > DISCORD_MAX_MESSAGE_LEN:
@@ -1493,65 +1837,120 @@ async def match_history_add(interaction: discord.Interaction, data:str): # data:
         logger.error(f"Parsing data failed for match_history_add. Input: {data}, Errors: {errors}")
         return
     try:
-        conn = get_db_connection()
-    except Exception as e:
-        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-        logger.error(f"Connection failed to db; Exception: {e}; traceback: {traceback.format_exc()}")
-        return
-    try:
-        with conn.cursor() as cursor:
-            for value in parsed_data_dict.values():
-                if isinstance(value, str):
-                    if re.search(r"([`'\";]|--{2,})", value):
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {value}", ephemeral=True)
-                        logger.warning(f"Catched SQL inject attempt: {value}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
-                        return
-            try:
-                query = """
-                INSERT INTO `match_history` (
-                    `date`, opponent, mercs, layer, match_status,
-                    ticket_us_r1, ticket_op_r1, ticket_diff_r1,
-                    ticket_us_r2, ticket_op_r2, ticket_diff_r2,
-                    event_url, vods, tactics, `ignore`, event_name
-                ) VALUES (
-                    %(date)s, %(opponent)s, %(mercs)s, %(layer)s, %(match_status)s,
-                    %(ticket_us_r1)s, %(ticket_op_r1)s, %(ticket_diff_r1)s,
-                    %(ticket_us_r2)s, %(ticket_op_r2)s, %(ticket_diff_r2)s,
-                    %(event_url)s, %(vods)s, %(tactics)s, %(ignore)s, %(event_name)s
-                )
-                """
-                cursor.execute(query, parsed_data_dict)
-                new_row_id = cursor.lastrowid
-                conn.commit()
-            except pymysql.IntegrityError as e:
-                if e.args[0] == 1062:
-                    await send_with_fallback(interaction, f"{MATCH_HISTORY_ADD_DUPLICATE_RECORD_ERROR}: {parsed_data_dict.get("event_name")}", ephemeral=True)
-                    logger.error(f"Insert for match_history_add failed - match already exists: {parsed_data_dict.get("event_name")}; Exception: {e}")
-                    return
-                else:
-                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                    logger.error(f"Insert for match_history_add failed: {parsed_data_dict}; Exception: {e}; traceback: {traceback.format_exc()}")
-                    return
-            except Exception as e:
+        inject_value = find_sql_inject(parsed_data_dict)
+        if inject_value is not None:
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {inject_value}", ephemeral=True)
+            logger.warning(f"Catched SQL inject attempt: {inject_value}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
+            return
+        try:
+            existing = await run_db(grafana_mysql.add_match_history, parsed_data_dict)
+        except pymysql.IntegrityError as e:
+            if e.args[0] == 1062:
+                await send_with_fallback(interaction, f"{MATCH_HISTORY_ADD_DUPLICATE_RECORD_ERROR}: {parsed_data_dict.get("event_name")}", ephemeral=True)
+                logger.error(f"Insert for match_history_add failed - match already exists: {parsed_data_dict.get("event_name")}; Exception: {e}")
+                return
+            else:
                 await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
                 logger.error(f"Insert for match_history_add failed: {parsed_data_dict}; Exception: {e}; traceback: {traceback.format_exc()}")
                 return
+        except Exception as e:
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+            logger.error(f"Insert for match_history_add failed: {parsed_data_dict}; Exception: {e}; traceback: {traceback.format_exc()}")
+            return
+        await send_with_fallback(interaction, 
+            f"### {MATCH_HISTORY_ADD_SUCCESS_TEXT}:\n- {MATCH_HISTORY_ADD_SUCCESS_EVENT_NAME}: {existing['event_name']},\n- {MATCH_HISTORY_ADD_SUCCESS_DATE}: {existing['date']},\n- {MATCH_HISTORY_ADD_SUCCESS_LAYER}: `{existing['layer']}`,\n- {MATCH_HISTORY_ADD_SUCCESS_OPPONENT}: {existing['opponent']}.",
+            ephemeral=False
+        )
+    except Exception as e:
+        await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
+        logger.error(f"{ERROR_GENERIC}: {e}; args: {data}; traceback: {traceback.format_exc()}")
+
+@bot.tree.command(name="match_history_add_bulk", description=f"{MATCH_HISTORY_ADD_BULK_DESCRIPTION}.")
+@discord.app_commands.describe(
+    data=f"{MATCH_HISTORY_ADD_BULK_DATA_DESCRIPTION}."
+)
+@strict_has_any_role(*unpack_matching_conf()) # only for sectorial | глава
+@commands.guild_only()
+async def match_history_add_bulk(interaction: discord.Interaction, data: discord.Attachment):
+    await send_with_fallback(interaction, f"{discord.utils.get(bot.emojis, name='loading') or '...'}", ephemeral=False)
+    initial_message = await interaction.original_response()
+    logger.info(f"Received match_history_add_bulk: {data.filename}, from user: {interaction.user.name} <@{interaction.user.id}>")
+    if not data.filename.lower().endswith(".csv"):
+        await initial_message.delete()
+        await interaction.followup.send(f"{MATCH_HISTORY_ADD_BULK_ERROR_NOT_CSV}", ephemeral=False)
+        logger.error(f"Got a file not in csv format: {data.filename}")
+        return
+    try:
+        decoded = (await data.read()).decode('utf-8-sig')
+        csv_data = read_rows(decoded, MATCH_HISTORY_COLUMNS)
+    except Exception as e:
+        await initial_message.delete()
+        await interaction.followup.send(f"{MATCH_HISTORY_ADD_BULK_ERROR_PARSING_CSV}", ephemeral=False)
+        logger.error(f"Failed to parse csv: {e}; traceback: {traceback.format_exc()}")
+        return
+    rejects = [] # (line number, reason)
+    parsed_rows = [] # (line number, parsed_data_dict, channel_id)
+    for line_number, line in enumerate(csv_data, start=1):
+        if not any(cell.strip() for cell in line):
+            continue # skip blank lines
+        parsed_data_dict, channel_id, errors = parse_match_history_row(line)
+        if errors:
+            rejects.append((line_number, f"{MATCH_HISTORY_ADD_DATA_PARSE_ERROR}: {errors}"))
+            continue
+        parsed_rows.append((line_number, parsed_data_dict, channel_id))
+    if not parsed_rows and not rejects:
+        await initial_message.delete()
+        await interaction.followup.send(f"{MATCH_HISTORY_ADD_BULK_ERROR_EMPTY_CSV}", ephemeral=False)
+        logger.warning(f"Empty csv file.")
+        return
+    try:
+        semaphore = asyncio.Semaphore(CHANNEL_FETCH_CONCURRENCY)
+        async def resolve(channel_id: int):
+            async with semaphore:
+                return await resolve_channel_name(channel_id)
+        channel_ids = list({channel_id for _, _, channel_id in parsed_rows})
+        resolved = await asyncio.gather(*(resolve(channel_id) for channel_id in channel_ids), return_exceptions=True)
+        channel_names = dict(zip(channel_ids, resolved))
+        insert_rows = []
+        for line_number, parsed_data_dict, channel_id in parsed_rows:
+            channel_name = channel_names[channel_id]
+            if isinstance(channel_name, Exception):
+                rejects.append((line_number, f"{MATCH_HISTORY_ADD_DATA_PARSE_ERROR}: {[channel_name]}"))
+                continue
+            parsed_data_dict["event_name"] = channel_name
+            inject_value = find_sql_inject(parsed_data_dict)
+            if inject_value is not None:
+                rejects.append((line_number, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {inject_value}"))
+                logger.warning(f"Catched SQL inject attempt: {inject_value}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
+                continue
+            insert_rows.append((line_number, parsed_data_dict))
+        inserted = []
+        if insert_rows:
             try:
-                cursor.execute("SELECT event_name, `date`, layer, opponent FROM match_history WHERE id = %s", (new_row_id,))
-                existing = cursor.fetchone()
+                inserted, duplicates = await run_db(grafana_mysql.add_match_history_bulk, insert_rows)
             except Exception as e:
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                logger.error(f"Select inserted row for match_history_add failed, rowID: {new_row_id}; Exception: {e}; traceback: {traceback.format_exc()}")
+                await initial_message.delete()
+                await interaction.followup.send(f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=False)
+                logger.error(f"Bulk insert for match_history_add_bulk failed and was rolled back: {insert_rows}; Exception: {e}; traceback: {traceback.format_exc()}")
                 return
-            await send_with_fallback(interaction, 
-                f"### {MATCH_HISTORY_ADD_SUCCESS_TEXT}:\n- {MATCH_HISTORY_ADD_SUCCESS_EVENT_NAME}: {existing['event_name']},\n- {MATCH_HISTORY_ADD_SUCCESS_DATE}: {existing['date']},\n- {MATCH_HISTORY_ADD_SUCCESS_LAYER}: `{existing['layer']}`,\n- {MATCH_HISTORY_ADD_SUCCESS_OPPONENT}: {existing['opponent']}.",
-                ephemeral=False
-            )
+            rejects.extend((line_number, f"{MATCH_HISTORY_ADD_DUPLICATE_RECORD_ERROR}: {reason}") for line_number, reason in duplicates)
+        rejects.sort()
+        event_names = {line_number: parsed_data_dict["event_name"] for line_number, parsed_data_dict in insert_rows}
+        msg = f"### {MATCH_HISTORY_ADD_BULK_SUCCESS_TEXT}: {len(inserted)}"
+        if inserted:
+            msg += "\n" + "\n".join(f"- {MATCH_HISTORY_ADD_BULK_LINE} {line_number}: {event_names[line_number]}" for line_number in inserted)
+        if rejects:
+            msg += f"\n### {MATCH_HISTORY_ADD_BULK_REJECTED}: {len(rejects)}\n" + "\n".join(f"- {MATCH_HISTORY_ADD_BULK_LINE} {line_number}: {reason}" for line_number, reason in rejects)
+        logger.info(f"match_history_add_bulk inserted {len(inserted)} row(s), rejected {len(rejects)}: {rejects}")
+        await initial_message.delete()
+        await send_with_fallback(interaction, msg, ephemeral=False)
     except Exception as e:
-        await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
-        logger.error(f"{ERROR_GENERIC}: {e}; args: {data}; traceback: {traceback.format_exc()}")
-    finally:
-        conn.close()
+        try:
+            await initial_message.delete()
+            await interaction.followup.send(f"{ERROR_GENERIC}: {e}", ephemeral=False)
+        except Exception as ee:
+            await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
+        logger.error(f"{ERROR_GENERIC}: {e}; args: {data.filename}; traceback: {traceback.format_exc()}")
 
 @bot.tree.command(name="autopost_enable", description=f"{AUTOPOST_ENABLE_DESCRIPTION}.")
 @discord.app_commands.describe(
@@ -1616,22 +2015,17 @@ async def server_info(interaction: discord.Interaction, server:str, ping:int = 0
         response = f"# {SERVER_INFO_SERVER_STR}: ```{server_details.get("name", name)}``` \n # {SERVER_INFO_PASS_STR}: ```{server_details.get("pass", password)}``` \n"
         if ping == 1:
             try:
-                async for message in interaction.channel.history(limit=None, oldest_first=True):
-                    if message.author.id == apollo_id:
-                        message_link = f"https://discord.com/channels/{interaction.guild.id}/{interaction.channel.id}/{message.id}"
-                        break
-                    if not message_link:
-                        response += f" || {SERVER_INFO_ERROR_FAILED_TO_GET_PINGS} - {SERVER_INFO_APOLLO_NOT_FOUND}|| "
-                message = await fetch_message_from_url(interaction, message_link)
-                if not message:
-                    return
-                mentioned_ids = []
-                for field in message.embeds[0].fields:
-                    if field.name[:10] == '<:accepted' and field.value[:6] == '>>> <@':
-                        mentions = field.value[4:].replace('<@', '').replace('>', '')
-                        mentioned_ids.extend([int(m) for m in mentions.split('\n') if m])
-                ping_str = " ".join(f"<@{member}>" for member in mentioned_ids)
-                response += f" || {ping_str} || "
+                message_link = await resolve_event_link(interaction.channel)
+                if not message_link:
+                    response += f" || {SERVER_INFO_ERROR_FAILED_TO_GET_PINGS} - {SERVER_INFO_APOLLO_NOT_FOUND}|| "
+                else:
+                    message = await fetch_message_from_url(interaction, message_link)
+                    if not message:
+                        return
+                    roster = parse_event(message)
+                    mentioned_ids = roster.accepted if roster else frozenset()
+                    ping_str = " ".join(f"<@{member}>" for member in mentioned_ids)
+                    response += f" || {ping_str} || "
             except Exception as e:
                 logger.warning(f"server_info failed to add pings: {e}; traceback: {traceback.format_exc()}")
                 response += f" || {SERVER_INFO_ERROR_FAILED_TO_GET_PINGS} || "
@@ -1657,58 +2051,28 @@ async def server_info(interaction: discord.Interaction, server:str, ping:int = 0
 async def grafana_update_match(interaction: discord.Interaction, ignore: int, match_id: int, name:str = None):
     logger.info(f"Received grafana_update_match: {[ignore, match_id, name]}, from user: {interaction.user.name} <@{interaction.user.id}>")
     try:
-        conn = get_db_connection()
-    except Exception as e:
-        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-        logger.error(f"Connection failed to db; Exception: {e}; traceback: {traceback.format_exc()}")
-        return
-    try:
-        with conn.cursor() as cursor:
-            if name:
-                if re.search(r"([`'\";]|--{2,})", name):
-                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {name}", ephemeral=True)
-                    logger.warning(f"Catched SQL inject attempt: {name}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
-                    return
-                try:
-                    cursor.execute("UPDATE dblog_matches SET `ignore` = %s, `winner` = %s, `displayName` = %s WHERE id = %s", (ignore, 'UFF' if ignore == 0 else None, name, match_id))
-                    conn.commit()
-                    cursor.execute("SELECT id, `displayName`, `layerClassname`, `ignore` FROM dblog_matches WHERE id = %s", (match_id))
-                    updated = cursor.fetchone()
-                    if not updated:
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NO_ID_FOUND}: {match_id}", ephemeral=True)
-                        return
-                    updated_ignore = GRAFANA_IGNORE_IGNORED if updated['ignore'] == 1 else GRAFANA_IGNORE_UNIGNORED
-                    await send_with_fallback(interaction, 
-                    f"### {GRAFANA_UPDATE_MATCH_SUCCESS}:\n- {GRAFANA_INGORE_ID_STR}: `{updated['id']}`,\n- {GRAFANA_UPDATE_MATCH_NAME_STR}: `{updated['displayName']}`,\n- {GRAFANA_UPDATE_MATCH_MAP_STR}: `{updated['layerClassname']}`,\n- {GRAFANA_IGNORE_STATUS_STR}: `{updated_ignore}`.",
-                    ephemeral=False
-                    )
-                except Exception as e:
-                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                    logger.error(f"Select and update query failed for id: {match_id}; Exception: {e}; traceback: {traceback.format_exc()}")
-                    return
-            else:
-                try:
-                    cursor.execute("UPDATE dblog_matches SET `ignore` = %s, `winner` = %s WHERE id = %s", (ignore, 'UFF' if ignore == 0 else None, match_id))
-                    conn.commit()
-                    cursor.execute("SELECT id, `displayName`, `layerClassname`, `ignore` FROM dblog_matches WHERE id = %s", (match_id))
-                    updated = cursor.fetchone()
-                    if not updated:
-                        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NO_ID_FOUND}: {match_id}", ephemeral=True)
-                        return
-                    updated_ignore = GRAFANA_IGNORE_IGNORED if updated['ignore'] == 1 else GRAFANA_IGNORE_UNIGNORED
-                    await send_with_fallback(interaction, 
-                    f"### {GRAFANA_UPDATE_MATCH_SUCCESS}:\n- {GRAFANA_INGORE_ID_STR}: `{updated['id']}`,\n- {GRAFANA_UPDATE_MATCH_NAME_STR}: `{updated['displayName']}`,\n- {GRAFANA_UPDATE_MATCH_MAP_STR}: `{updated['layerClassname']}`,\n- {GRAFANA_IGNORE_STATUS_STR}: `{updated_ignore}`.",
-                    ephemeral=False
-                    )
-                except Exception as e:
-                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                    logger.error(f"Select and update query failed for id: {match_id}; Exception: {e}; traceback: {traceback.format_exc()}")
-                    return
+        if name:
+            if re.search(r"([`'\";]|--{2,})", name):
+                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {name}", ephemeral=True)
+                logger.warning(f"Catched SQL inject attempt: {name}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
+                return
+        try:
+            updated = await run_db(grafana_mysql.update_match, match_id, ignore, name)
+            if not updated:
+                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NO_ID_FOUND}: {match_id}", ephemeral=True)
+                return
+            updated_ignore = GRAFANA_IGNORE_IGNORED if updated['ignore'] == 1 else GRAFANA_IGNORE_UNIGNORED
+            await send_with_fallback(interaction, 
+            f"### {GRAFANA_UPDATE_MATCH_SUCCESS}:\n- {GRAFANA_INGORE_ID_STR}: `{updated['id']}`,\n- {GRAFANA_UPDATE_MATCH_NAME_STR}: `{updated['displayName']}`,\n- {GRAFANA_UPDATE_MATCH_MAP_STR}: `{updated['layerClassname']}`,\n- {GRAFANA_IGNORE_STATUS_STR}: `{updated_ignore}`.",
+            ephemeral=False
+            )
+        except Exception as e:
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+            logger.error(f"Select and update query failed for id: {match_id}; Exception: {e}; traceback: {traceback.format_exc()}")
+            return
     except Exception as e:
         await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
         logger.error(f"{ERROR_GENERIC}: {e}; args: {ignore}, {match_id}, {name}; traceback: {traceback.format_exc()}")
-    finally:
-        conn.close()
 
 @bot.tree.command(name="grafana_add_match", description=f"{GRAFANA_ADD_MATCH_DESCRIPTION}.")
 @discord.app_commands.describe(
@@ -1721,54 +2085,40 @@ async def grafana_update_match(interaction: discord.Interaction, ignore: int, ma
 async def grafana_add_match(interaction: discord.Interaction, name:str, map:str, date:str):
     logger.info(f"Received grafana_add_match: {[name, map, date]}, from user: {interaction.user.name} <@{interaction.user.id}>")
     try:
-        conn = get_db_connection()
-    except Exception as e:
-        await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-        logger.error(f"Connection failed to db; Exception: {e}; traceback: {traceback.format_exc()}")
-        return
-    try:
-        with conn.cursor() as cursor:
-            if re.search(r"([`'\";]|--{2,})", name):
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {name}", ephemeral=True)
-                logger.warning(f"Catched SQL inject attempt: {name}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
-                return
-            if re.search(r"([`'\";]|--{2,})", map):
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {map}", ephemeral=True)
-                logger.warning(f"Catched SQL inject attempt: {map}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
-                return
-            if re.search(r"([`'\";]|--{2,})", date):
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {map}", ephemeral=True)
-                logger.warning(f"Catched SQL inject attempt: {date}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
-                return
-            try:
-                parse_date_check = datetime.strptime(date, "%Y-%m-%d %H:%M")
-            except Exception as e:
-                await send_with_fallback(interaction, f"{GRAFANA_ADD_MATCH_INVALID_DATE_FORMAT}", ephemeral=True)
-                logger.warning(f"Invalid date format received for grafana_add_match: {date}; Exception: {e}; traceback: {traceback.format_exc()}")
-                return
-            try:
-                cursor.execute("call sp_newMatch(%s, %s, 'UFF', %s)", (map, date, name))
-                result = cursor.fetchone()
-                conn.commit()
-                new_id = list(result.values())[0]
-                cursor.execute("SELECT id, `displayName`, `layerClassname` FROM dblog_matches WHERE id = %s", (new_id))
-                updated = cursor.fetchone()
-                if not updated:
-                    await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NO_ID_FOUND}: {new_id}", ephemeral=True)
-                    return
-                await send_with_fallback(interaction, 
-                f"### {GRAFANA_ADD_MATCH_SUCCESS}:\n- {GRAFANA_INGORE_ID_STR}: `{updated['id']}`,\n- {GRAFANA_UPDATE_MATCH_NAME_STR}: `{updated['displayName']}`,\n- {GRAFANA_UPDATE_MATCH_MAP_STR}: `{updated['layerClassname']}`.",
-                ephemeral=False
-                )
-            except Exception as e:
-                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                logger.error(f"Select and update query failed for args: {[name, map, date]}; Exception: {e}; traceback: {traceback.format_exc()}")
+        if re.search(r"([`'\";]|--{2,})", name):
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {name}", ephemeral=True)
+            logger.warning(f"Catched SQL inject attempt: {name}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
+            return
+        if re.search(r"([`'\";]|--{2,})", map):
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {map}", ephemeral=True)
+            logger.warning(f"Catched SQL inject attempt: {map}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
+            return
+        if re.search(r"([`'\";]|--{2,})", date):
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {map}", ephemeral=True)
+            logger.warning(f"Catched SQL inject attempt: {date}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
+            return
+        try:
+            parse_date_check = datetime.strptime(date, "%Y-%m-%d %H:%M")
+        except Exception as e:
+            await send_with_fallback(interaction, f"{GRAFANA_ADD_MATCH_INVALID_DATE_FORMAT}", ephemeral=True)
+            logger.warning(f"Invalid date format received for grafana_add_match: {date}; Exception: {e}; traceback: {traceback.format_exc()}")
+            return
+        try:
+            new_id, updated = await run_db(grafana_mysql.add_match, map, date, name)
+            if not updated:
+                await send_with_fallback(interaction, f"{GRAFANA_IGNORE_NO_ID_FOUND}: {new_id}", ephemeral=True)
                 return
+            await send_with_fallback(interaction, 
+            f"### {GRAFANA_ADD_MATCH_SUCCESS}:\n- {GRAFANA_INGORE_ID_STR}: `{updated['id']}`,\n- {GRAFANA_UPDATE_MATCH_NAME_STR}: `{updated['displayName']}`,\n- {GRAFANA_UPDATE_MATCH_MAP_STR}: `{updated['layerClassname']}`.",
+            ephemeral=False
+            )
+        except Exception as e:
+            await send_with_fallback(interaction, f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+            logger.error(f"Select and update query failed for args: {[name, map, date]}; Exception: {e}; traceback: {traceback.format_exc()}")
+            return
     except Exception as e:
         await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
         logger.error(f"{ERROR_GENERIC}: {e}; args: {[name, map, date]}; traceback: {traceback.format_exc()}")
-    finally:
-        conn.close()
 
 @bot.tree.command(name="grafana_add_stats", description=f"{GRAFANA_ADD_STATS_DESCRIPTION}.")
 @discord.app_commands.describe(
@@ -1810,18 +2160,20 @@ async def grafana_add_stats(interaction: discord.Interaction, match_id:int, data
         # await interaction.response.send_message(f"{GRAFANA_ADD_STATS_ERROR_EMPTY_CSV}", ephemeral=True)
         logger.warning(f"Empty csv file.")
         return
-    query_list = []
+    stats_rows = []
     try:
         for line in csv_data:
+            if not any(cell.strip() for cell in line):
+                continue # skip blank lines
             if re.search(r"([`'\";]|--{2,})", line[0]):
                 await initial_message.delete()
                 await interaction.followup.send(f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {line[0]}", ephemeral=False)
                 # await interaction.response.send_message(f"{GRAFANA_IGNORE_SQL_INJECT_PROTECTION}: {line[0]}", ephemeral=True)
                 logger.warning(f"Catched SQL inject attempt: {line[0]}. Discord user ID: {interaction.user.id if interaction.user.id else None}")
                 return
-            query_list.append(
-                f"call sp_addKDWR({match_id}, fn_getsteamidfromname('{line[0]}'), {line[1]}, {line[2]}, {line[3]}, {line[4]}, {line[5]})"
-            )
+            stats_rows.append((line[0].strip(), *(int(value) for value in line[1:6])))
+            if len(stats_rows[-1]) != 6:
+                raise ValueError(f"Expected 6 columns, got: {line}")
     except Exception as e:
         try:
             await initial_message.delete()
@@ -1830,38 +2182,32 @@ async def grafana_add_stats(interaction: discord.Interaction, match_id:int, data
             await send_with_fallback(interaction, f"{GRAFANA_ADD_STATS_FAILED_TO_PARSE_CSV}", ephemeral=True)
         logger.error(f"Failed to parse csv: {e}; traceback: {traceback.format_exc()}")
         return
-    if not query_list:
+    if not stats_rows:
         await initial_message.delete()
         await interaction.followup.send(f"{GRAFANA_ADD_STATS_ERROR_GETTING_QUERIES}", ephemeral=False)
         # await interaction.response.send_message(f"{GRAFANA_ADD_STATS_ERROR_GETTING_QUERIES}", ephemeral=True)
         logger.warning(f"Empty query list from csv file.")
         return
     try:
-        conn = get_db_connection()
-    except Exception as e:
+        try:
+            steam_ids = await run_db(grafana_mysql.add_match_stats, match_id, stats_rows)
+        except PlayersNotFoundError as e:
+            await initial_message.delete()
+            await send_with_fallback(interaction, f"{GRAFANA_ADD_STATS_ERROR_UNKNOWN_PLAYERS}: {', '.join(f'`{name}`' for name in e.names)}", ephemeral=False)
+            logger.warning(f"grafana_add_stats rejected for match {match_id}, unknown players: {e.names}")
+            return
+        except Exception as e:
+            await initial_message.delete()
+            await interaction.followup.send(f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=False)
+            # await interaction.response.send_message(f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
+            logger.error(f"Stats import failed and was rolled back for args: {[match_id, stats_rows]}; Exception: {e}; traceback: {traceback.format_exc()}")
+            return
+        query_list = [
+            f"call sp_addKDWR({match_id}, '{steam_ids[name]}', {', '.join(str(value) for value in values)}) -- {name}"
+            for name, *values in stats_rows
+        ]
         await initial_message.delete()
-        await interaction.followup.send(f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=False)
-        # await interaction.response.send_message(f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-        logger.error(f"Connection failed to db; Exception: {e}; traceback: {traceback.format_exc()}")
-        return
-    try:
-        with conn.cursor() as cursor:
-            try:
-                for query in query_list:
-                    cursor.execute(query)
-                    conn.commit()
-                await initial_message.delete()
-                await interaction.followup.send(f"### {GRAFANA_ADD_STATS_SUCCESS}:\n -{GRAFANA_ADD_STATS_MATCH_ID_STR}: `{match_id}` \n -{GRAFANA_ADD_STATS_QUERIES_STR}:\n```{'\n'.join(query_list)}```", ephemeral=False)
-                # await interaction.response.send_message(
-                # f"### {GRAFANA_ADD_STATS_SUCCESS}:\n -{GRAFANA_ADD_STATS_MATCH_ID_STR}: `{match_id}` \n -{GRAFANA_ADD_STATS_QUERIES_STR}:\n```{'\n'.join(query_list)}```",
-                # ephemeral=False
-                # )
-            except Exception as e:
-                await initial_message.delete()
-                await interaction.followup.send(f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=False)
-                # await interaction.response.send_message(f"{GRAFANA_IGNORE_GENERIC_DB_FAIL}", ephemeral=True)
-                logger.error(f"Select and update query failed for args: {[match_id, query_list]}; Exception: {e}; traceback: {traceback.format_exc()}")
-                return
+        await send_with_fallback(interaction, f"### {GRAFANA_ADD_STATS_SUCCESS}:\n -{GRAFANA_ADD_STATS_MATCH_ID_STR}: `{match_id}` \n -{GRAFANA_ADD_STATS_QUERIES_STR}:\n```{'\n'.join(query_list)}```", ephemeral=False)
     except Exception as e:
         try:
             await initial_message.delete()
@@ -1869,8 +2215,6 @@ async def grafana_add_stats(interaction: discord.Interaction, match_id:int, data
         except Exception as ee:
             await interaction.response.send_message(f"{ERROR_GENERIC}: {e}", ephemeral=True)
         logger.error(f"{ERROR_GENERIC}: {e}; args: {match_id}; traceback: {traceback.format_exc()}")
-    finally:
-        conn.close()
 
 @bot.tree.command(name="count_attendance", description=f"{COUNT_ATTENDANCE_DESCRIPTION}.")
 @discord.app_commands.describe(
@@ -1907,34 +2251,14 @@ async def count_attendance(interaction: discord.Interaction, category: discord.C
         initial_message = await interaction.original_response()
         attendance = {}
         channel_count = 0
-        for channel in channels:
-            async for message in channel.history(limit=1, oldest_first=True):
-                if message.author.id == apollo_id:
-                    message_link = f"https://discord.com/channels/{interaction.guild.id}/{channel.id}/{message.id}"
-            message = await fetch_message_from_url(interaction, message_link)
-            if not message:
-                continue    # skip channel if no apollo message found
-            event_date_field = message.embeds[0].fields[0].value
-            match = re.search(r"<t:(\d+):", event_date_field)
-            if match:
-                event_date = datetime.fromtimestamp(int(match.group(1))).replace(tzinfo=timezone.utc)
-            else:
-                continue # can't find event date, so skipping it
-            if check_from > event_date:
+        for channel, event_time, labels in await collect_member_signups(channels, user.id):
+            if check_from > event_time:
                 continue # older event, skipping
             channel_count += 1 # only processable events are counted
-            for field in message.embeds[0].fields:
-                if field.name.startswith('<t:'):
-                    continue # skipping 'Time' field
-                if user.mention in field.value:
-                    field_name_clean_match = re.search(r"[^\s]+?\s+(.+?)\s*\(\d+\)", field.name)
-                    if field_name_clean_match:
-                        key = field_name_clean_match.group(1)
-                    else:
-                        key = field.name.strip()
-                    if key not in attendance:
-                        attendance[key] = []
-                    attendance[key].append(f"https://discord.com/channels/{interaction.guild.id}/{channel.id}")
+            for key in labels:
+                if key not in attendance:
+                    attendance[key] = []
+                attendance[key].append(f"https://discord.com/channels/{interaction.guild.id}/{channel.id}")
         if attendance:
             # output = f"Since <t:{int(check_from.timestamp())}:D>, were {channel_count} events. User {user.mention} was in:"
             output = COUNT_ATTENDANCE_OUTPUT_TEMPLATE.format(
@@ -2287,6 +2611,75 @@ async def reboot_server(interaction: discord.Interaction, server: str):
         logger.error(f"{ERROR_GENERIC}: {e}; args: {server}; traceback: {traceback.format_exc()}")
     return
 
+@bot.tree.command(name="db_stats", description=f"{DB_STATS_DESCRIPTION}.")
+@discord.app_commands.describe(
+    limit=f"{DB_STATS_LIMIT}.",
+    reset=f"{DB_STATS_RESET}."
+)
+@strict_has_any_role(*unpack_conf())
+@commands.guild_only()
+async def db_stats(interaction: discord.Interaction, limit: Optional[int] = 10, reset: Optional[bool] = False):
+    logger.info(f"Received db_stats: {limit}, {reset} from user: {interaction.user.name} <@{interaction.user.id}>")
+    try:
+        top = query_stats.top(max(1, min(limit, 50)))
+        acquire = query_stats.acquire_summary()
+        if not top and not acquire:
+            await send_with_fallback(interaction, f"{DB_STATS_EMPTY}", ephemeral=True)
+            return
+        lines = [f"{'total ms':>9} {'count':>6} {'p50':>6} {'p95':>6} {'max':>7} {'rows':>7} {'err':>4}  statement"]
+        for entry in top:
+            lines.append(
+                f"{entry['total_ms']:>9.0f} {entry['count']:>6} {entry['p50_ms']:>6.0f} {entry['p95_ms']:>6.0f} {entry['max_ms']:>7.0f} {entry['rows']:>7} {entry['errors']:>4}"
+                f"  {entry['label']}: {entry['statement']}"
+            )
+        acquire_lines = [
+            f"{entry['database']}: {entry['count']} acquires, p50 {entry['p50_ms']:.0f} ms, p95 {entry['p95_ms']:.0f} ms, max {entry['max_ms']:.0f} ms"
+            for entry in acquire
+        ]
+        msg = f"### {DB_STATS_TOP_STATEMENTS}:\n```{'\n'.join(lines)}```"
+        if acquire_lines:
+            msg += f"\n### {DB_STATS_POOL_ACQUIRE}:\n```{'\n'.join(acquire_lines)}```"
+        if reset:
+            query_stats.reset()
+            msg += f"\n{DB_STATS_RESET_DONE}"
+        await send_with_fallback(interaction, msg, ephemeral=True)
+    except Exception as e:
+        await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
+        logger.error(f"{ERROR_GENERIC}: {e}; args: {limit}, {reset}; traceback: {traceback.format_exc()}")
+
+@bot.tree.command(name="gemini_stats", description=f"{GEMINI_STATS_DESCRIPTION}.")
+@discord.app_commands.describe(
+    days=f"{GEMINI_STATS_DAYS}."
+)
+@strict_has_any_role(*unpack_conf())
+@commands.guild_only()
+async def gemini_stats(interaction: discord.Interaction, days: Optional[int] = 7):
+    logger.info(f"Received gemini_stats: {days} from user: {interaction.user.name} <@{interaction.user.id}>")
+    try:
+        days = max(1, min(days, 90))
+        await flush_call_metrics()
+        stats = await get_call_stats(days)
+        if not stats["daily"]:
+            await send_with_fallback(interaction, f"{GEMINI_STATS_EMPTY}", ephemeral=True)
+            return
+        latency_lines = [f"{'model':<28} {'calls':>6} {'p50 ms':>7} {'p95 ms':>7}"]
+        for model, entry in sorted(stats["latency"].items()):
+            latency_lines.append(f"{model:<28} {entry['calls']:>6} {entry['p50_ms']:>7} {entry['p95_ms']:>7}")
+        daily_lines = [f"{'day':<10} {'model':<28} {'calls':>6} {'prompt':>9} {'cached':>9} {'output':>8} {'total':>9}"]
+        for row in stats["daily"]:
+            daily_lines.append(
+                f"{str(row['day']):<10} {row['model']:<28} {row['calls']:>6} {int(row['prompt_tokens']):>9} {int(row['cached_tokens']):>9} {int(row['output_tokens']):>8} {int(row['total_tokens']):>9}"
+            )
+        msg = (
+            f"### {GEMINI_STATS_LATENCY} ({days} {GEMINI_STATS_DAYS_SUFFIX}):\n```{'\n'.join(latency_lines)}```\n"
+            f"### {GEMINI_STATS_TOKENS}:\n```{'\n'.join(daily_lines)}```\n"
+            f"### {GEMINI_STATS_REPLY_CHAIN_CACHE}:\n```messages: {len(fetched_messages)}/{fetched_messages.max_size}, hits: {fetched_messages.hits}, fetches: {fetched_messages.fetches}```"
+        )
+        await send_with_fallback(interaction, msg, ephemeral=True)
+    except Exception as e:
+        await send_with_fallback(interaction, f"{ERROR_GENERIC}: {e}", ephemeral=True)
+        logger.error(f"{ERROR_GENERIC}: {e}; args: {days}; traceback: {traceback.format_exc()}")
+
 @bot.tree.command(name="set_pz_server_mods", description=f"{PZ_SERVER_MODS_DESCRIPTION}.")
 @discord.app_commands.describe(
     server=f"{PZ_SERVER_MODS_SERVER}.",
@@ -2331,4 +2724,18 @@ async def reboot_server(interaction: discord.Interaction, server: str, workshop_
         logger.error(f"{ERROR_GENERIC}: {e}; args: {server}; traceback: {traceback.format_exc()}")
     return
 
-bot.run(DiscordToken, log_handler=handler, log_level=logging.INFO)
+# loaded before any event arrives: a lookup backfilled before the load would save over the persisted index
+event_index.load()
+logger.info(f"Loaded event index of {len(event_index)} channel(s)")
+try:
+    bot.run(DiscordToken, log_handler=handler, log_level=logging.INFO)
+finally:
+    try:
+        temp_context_buffer.flush() # loop is closed already, write whatever is still buffered synchronously
+    except Exception:
+        logger.exception(f"Failed to flush {len(temp_context_buffer)} buffered temporary instruction(s) on shutdown")
+    try:
+        call_metrics_buffer.flush()
+    except Exception:
+        logger.exception(f"Failed to flush {len(call_metrics_buffer)} buffered call metric(s) on shutdown")
+    close_pools()
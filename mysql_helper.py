@@ -1,7 +1,14 @@
 import pymysql
+from pymysql.constants import CLIENT
 from configs.tokens import MySQL
+import asyncio
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from configs.tokens import GeminiAPIInstruction
+from query_metrics import QueryStats, query_label
 
 GEMINI_DB_NAME = 'gemini_db'
 GEMINI_TABLES = [
@@ -16,22 +23,7 @@ GEMINI_TABLES = [
                 message TEXT,
                 response TEXT
             )
-        """,
-        "clean_sql": """
-            DELETE t
-            FROM `{name}` t
-            LEFT JOIN (
-                SELECT id
-                FROM (
-                    SELECT id
-                    FROM `{name}`
-                    ORDER BY timestamp DESC
-                    LIMIT {limit}
-                ) AS keep_ids
-            ) k ON t.id = k.id
-            WHERE k.id IS NULL;
-        """,
-        "clean_limit": 500
+        """
     },
     {
         "name": "persistent_context",
@@ -49,35 +41,598 @@ GEMINI_TABLES = [
         """,
         "init_data": GeminiAPIInstruction
     },
+    {
+        "name": "schema_version",
+        "type": "data",
+        "create_sql": """
+            CREATE TABLE IF NOT EXISTS `{name}` (
+                version INT PRIMARY KEY,
+                applied_at DATETIME
+            )
+        """
+    },
 ]
+# version 1 is GEMINI_TABLES, every later schema change gets the next version with the statements applying it
+GEMINI_MIGRATIONS: dict[int, list[str]] = {
+    2: [
+        """
+            CREATE TABLE IF NOT EXISTS `call_metrics` (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                timestamp DATETIME,
+                model VARCHAR(64),
+                latency_ms INT,
+                prompt_tokens INT,
+                cached_tokens INT,
+                output_tokens INT,
+                total_tokens INT,
+                instruction_tokens INT,
+                finish_reason VARCHAR(64),
+                streamed TINYINT(1),
+                INDEX idx_call_metrics_timestamp (timestamp)
+            )
+        """
+    ],
+    3: [
+        """
+            CREATE TABLE IF NOT EXISTS `context_summaries` (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                created DATETIME,
+                first_message_id INT,
+                last_message_id INT,
+                first_timestamp DATETIME,
+                last_timestamp DATETIME,
+                summary TEXT
+            )
+        """
+    ],
+    4: [
+        # conversation memory per channel (or thread). Rows from before keep channel_id NULL: they are left in place
+        # but not read or compacted anymore, the shared history of all channels belongs to none of them
+        """
+            ALTER TABLE `temporary_message_context`
+                ADD COLUMN channel_id BIGINT NULL AFTER timestamp,
+                ADD INDEX idx_temporary_context_channel (channel_id, id)
+        """,
+        """
+            ALTER TABLE `context_summaries`
+                ADD COLUMN channel_id BIGINT NULL AFTER created,
+                ADD INDEX idx_context_summaries_channel (channel_id, id)
+        """
+    ],
+    5: [
+        # Apollo event signup ledger, fed from embed edits
+        """
+            CREATE TABLE IF NOT EXISTS `signup_events` (
+                event_message_id BIGINT PRIMARY KEY,
+                channel_id BIGINT NOT NULL,
+                event_time DATETIME NULL,
+                synced_at DATETIME NOT NULL,
+                INDEX idx_signup_events_channel (channel_id)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS `event_signups` (
+                event_message_id BIGINT NOT NULL,
+                channel_id BIGINT NOT NULL,
+                event_time DATETIME NULL,
+                member_id BIGINT NOT NULL,
+                status VARCHAR(64) NOT NULL,
+                label VARCHAR(255),
+                updated_at DATETIME NOT NULL,
+                PRIMARY KEY (event_message_id, member_id, status),
+                INDEX idx_event_signups_member (member_id, event_time)
+            )
+        """
+    ],
+}
+GEMINI_SCHEMA_VERSION = max(GEMINI_MIGRATIONS, default=1)
 
-# legacy db
-def get_db_connection():
-    return pymysql.connect(
-        host=MySQL.get("host"),
-        port=MySQL.get("port", 3306),
-        user=MySQL.get("user"),
-        password=MySQL.get("password"),
-        database=MySQL.get("database"),
-        cursorclass=pymysql.cursors.DictCursor
+POOL_MAX_SIZE = MySQL.get("pool_max_size", 10)
+POOL_ACQUIRE_TIMEOUT = MySQL.get("pool_acquire_timeout", 5) # seconds to wait for a free connection
+POOL_MAX_IDLE = MySQL.get("pool_max_idle", 300) # idle connections older than this are closed instead of reused
+POOL_PING_INTERVAL = MySQL.get("pool_ping_interval", 30) # idle connections older than this are pinged before reuse
+QUERY_TIMEOUT = MySQL.get("query_timeout", 15) # seconds a single db call may take before the awaiting handler gives up
+STATS_BATCH_SIZE = 50 # sp_addKDWR calls sent per round trip
+WRITE_BUFFER_MAX_ROWS = 1000 # rows kept in memory while the db is unreachable, oldest are dropped beyond that
+WRITE_BUFFER_FLUSH_SIZE = 20 # rows after which a flush is requested without waiting for the timer
+SLOW_QUERY_MS = MySQL.get("slow_query_ms", 500) # statements slower than this go to the slow query log
+
+pool_logger = logging.getLogger("mysql")
+query_stats = QueryStats(SLOW_QUERY_MS)
+
+class InstrumentedCursor(pymysql.cursors.DictCursor):
+    """
+    DictCursor that records the latency and row count of every statement into query_stats.
+    For multi-statement queries the time covers the round trip up to the first result.
+    """
+    def _timed(self, query: str, call, *args):
+        started = time.perf_counter()
+        try:
+            result = call(*args)
+        except Exception:
+            query_stats.record(query, (time.perf_counter() - started) * 1000, 0, failed=True)
+            raise
+        query_stats.record(query, (time.perf_counter() - started) * 1000, self.rowcount)
+        return result
+
+    def execute(self, query, args=None):
+        if getattr(self, "_in_executemany", False): # executemany may fall back to execute per row, those are timed as one call
+            return super().execute(query, args)
+        return self._timed(query, super().execute, query, args)
+
+    def executemany(self, query, args):
+        self._in_executemany = True
+        try:
+            return self._timed(query, super().executemany, query, args)
+        finally:
+            self._in_executemany = False
+
+    def callproc(self, procname, args=()):
+        return self._timed(f"call {procname}", super().callproc, procname, args)
+
+class PoolTimeoutError(TimeoutError):
+    pass
+
+class PlayersNotFoundError(LookupError):
+    def __init__(self, names: list[str]):
+        super().__init__(f"Players not found: {names}")
+        self.names = names
+
+class PooledConnection:
+    """
+    Proxy for a pooled pymysql connection.
+    close() (or leaving the `with` block) returns the connection to the pool instead of closing the socket.
+    """
+    def __init__(self, pool: "MySqlConnectionPool", conn: pymysql.connections.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+class MySqlConnectionPool:
+    """
+    Thread-safe pool of pymysql connections to one database.
+    Limits the amount of open connections, recycles idle ones and health-checks them before reuse.
+    """
+    def __init__(
+        self,
+        database: str,
+        *,
+        max_size: int = POOL_MAX_SIZE,
+        acquire_timeout: float = POOL_ACQUIRE_TIMEOUT,
+        max_idle: float = POOL_MAX_IDLE,
+        ping_interval: float = POOL_PING_INTERVAL,
+        multi_statements: bool = False,
+        logger: logging.Logger = pool_logger
+    ):
+        self.database = database
+        self.multi_statements = multi_statements
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.ping_interval = ping_interval
+        self.logger = logger
+        self._idle = deque() # (connection, released_at), newest on the right
+        self._size = 0 # idle + in use
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _connect(self) -> pymysql.connections.Connection:
+        return pymysql.connect(
+            host=MySQL.get("host"),
+            port=MySQL.get("port", 3306),
+            user=MySQL.get("user"),
+            password=MySQL.get("password"),
+            database=self.database,
+            cursorclass=InstrumentedCursor,
+            client_flag=CLIENT.MULTI_STATEMENTS if self.multi_statements else 0, # batched statements share one round trip, all queries are parametrized
+            read_timeout=QUERY_TIMEOUT,
+            write_timeout=QUERY_TIMEOUT
+        )
+
+    def _discard(self, conn: pymysql.connections.Connection):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn: pymysql.connections.Connection, released_at: float) -> bool:
+        idle_for = time.monotonic() - released_at
+        if idle_for > self.max_idle:
+            return False
+        if idle_for > self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self.logger.info(f"Pooled connection to {self.database} failed health check, reconnecting")
+                return False
+        return True
+
+    def acquire(self, autocommit: bool = False, timeout: float | None = None) -> PooledConnection:
+        started = time.perf_counter()
+        conn = self._acquire(autocommit, timeout)
+        query_stats.record_acquire(self.database, (time.perf_counter() - started) * 1000)
+        return conn
+
+    def _acquire(self, autocommit: bool, timeout: float | None) -> PooledConnection:
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"Timed out waiting for a connection to {self.database} (pool size {self.max_size})")
+                    self._cond.wait(remaining)
+                if self._closed:
+                    raise pymysql.err.InterfaceError(f"Connection pool for {self.database} is closed")
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                else:
+                    self._size += 1 # reserve the slot before connecting outside of the lock
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, released_at):
+                self._discard(conn)
+                continue
+            try:
+                conn.autocommit(autocommit)
+            except Exception:
+                self._discard(conn)
+                continue
+            return PooledConnection(self, conn)
+
+    def release(self, conn: pymysql.connections.Connection):
+        if not conn.open:
+            self._discard(conn)
+            return
+        try:
+            if not conn.get_autocommit():
+                conn.rollback() # never hand out a connection with leftovers of an uncommitted transaction
+        except Exception:
+            self._discard(conn)
+            return
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            if self._closed:
+                expired.append(conn)
+            else:
+                self._idle.append((conn, now))
+            while self._idle and now - self._idle[0][1] > self.max_idle:
+                expired.append(self._idle.popleft()[0])
+            self._size -= len(expired)
+            self._cond.notify(len(expired) + 1)
+        for stale in expired:
+            try:
+                stale.close()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+class WriteBehindBuffer:
+    """
+    Bounded in-memory buffer of rows that are written to the db later in one multi-row insert.
+    append() never touches the db, flush() is blocking and should go through run_db().
+    """
+    def __init__(
+        self,
+        name: str,
+        write,
+        *,
+        max_rows: int = WRITE_BUFFER_MAX_ROWS,
+        flush_size: int = WRITE_BUFFER_FLUSH_SIZE,
+        logger: logging.Logger = pool_logger
+    ):
+        self.name = name
+        self.write = write # callable(list[tuple]) doing the actual insert
+        self.max_rows = max_rows
+        self.flush_size = flush_size
+        self.logger = logger
+        self._rows = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def read_with_pending(self, query, *args) -> tuple:
+        """
+        Runs the blocking db read query(*args) while no flush is in progress and returns (its result, buffered rows oldest first),
+        so every row is either committed and seen by the query or still buffered, never both.
+        """
+        with self._flush_lock:
+            result = query(*args)
+            with self._lock:
+                return result, list(self._rows)
+
+    def _push(self, rows, front: bool = False) -> int:
+        # caller holds self._lock. Returns how many of the oldest rows were dropped to stay within max_rows
+        if front:
+            self._rows.extendleft(reversed(rows))
+        else:
+            self._rows.extend(rows)
+        dropped = 0
+        while len(self._rows) > self.max_rows:
+            self._rows.popleft()
+            dropped += 1
+        return dropped
+
+    def append(self, row: tuple) -> bool:
+        """
+        Queue a row. Returns True when the buffer reached flush_size and a flush should be scheduled.
+        """
+        with self._lock:
+            dropped = self._push([row])
+            size = len(self._rows)
+        if dropped:
+            self.logger.warning(f"Write buffer {self.name} is full, dropped {dropped} oldest row(s)")
+        return size >= self.flush_size
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._rows)
+                self._rows.clear()
+            if not rows:
+                return 0
+            try:
+                self.write(rows)
+            except Exception:
+                with self._lock:
+                    dropped = self._push(rows, front=True) # keep them for the next attempt
+                if dropped:
+                    self.logger.warning(f"Write buffer {self.name} is full, dropped {dropped} oldest row(s)")
+                raise
+            return len(rows)
+
+_pools: dict[str, MySqlConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(database: str, multi_statements: bool = False) -> MySqlConnectionPool:
+    """
+    multi_statements applies when the pool is created, so every caller of one database has to pass the same value.
+    """
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = MySqlConnectionPool(database, multi_statements=multi_statements)
+            _pools[database] = pool
+            pool_logger.info(f"Created connection pool for {database} (max size {pool.max_size})")
+        return pool
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+# blocking pymysql calls run here, so they never stall the discord event loop. Sized to the pool, as every worker holds at most one connection
+_db_executor = ThreadPoolExecutor(max_workers=POOL_MAX_SIZE, thread_name_prefix="mysql")
+
+async def run_db(func, *args, timeout: float = QUERY_TIMEOUT, **kwargs):
+    """
+    Run a blocking db function in the db executor and await its result.
+    Raises asyncio.TimeoutError if it does not finish within `timeout` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    label = getattr(func, "__qualname__", None) or repr(func)
+    def labeled():
+        with query_label(label):
+            return func(*args, **kwargs)
+    return await asyncio.wait_for(
+        loop.run_in_executor(_db_executor, labeled),
+        timeout=timeout
+    )
+
+MATCH_HISTORY_INSERT_SQL = """
+    INSERT INTO `match_history` (
+        `date`, opponent, mercs, layer, match_status,
+        ticket_us_r1, ticket_op_r1, ticket_diff_r1,
+        ticket_us_r2, ticket_op_r2, ticket_diff_r2,
+        event_url, vods, tactics, `ignore`, event_name
+    ) VALUES (
+        %(date)s, %(opponent)s, %(mercs)s, %(layer)s, %(match_status)s,
+        %(ticket_us_r1)s, %(ticket_op_r1)s, %(ticket_diff_r1)s,
+        %(ticket_us_r2)s, %(ticket_op_r2)s, %(ticket_diff_r2)s,
+        %(event_url)s, %(vods)s, %(tactics)s, %(ignore)s, %(event_name)s
     )
+"""
+
+# legacy db
+def get_db_connection() -> PooledConnection:
+    # the grafana repository sends mutations together with their confirmation read in one multi-statement round trip
+    return get_pool(MySQL.get("database"), multi_statements=True).acquire()
+
+class GrafanaMySqlRepository:
+    """
+    Queries used by the grafana_* and match_history_* commands (legacy db).
+    Every mutation is sent together with its confirmation read (and COMMIT) as one multi-statement round trip.
+    Methods are blocking, call them through run_db().
+    """
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def get_players_after(self, min_id: int, limit: int) -> list[dict]:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, lastName, steamID FROM dblog_players WHERE id > %s ORDER BY id ASC LIMIT %s", (min_id, limit))
+                return cursor.fetchall()
+
+    @staticmethod
+    def _fetch_results(cursor) -> list[tuple]:
+        """
+        Read every result set of a multi-statement execute(), in statement order.
+        """
+        results = [cursor.fetchall()]
+        while cursor.nextset():
+            results.append(cursor.fetchall())
+        return results
+
+    def set_player_ignore(self, player_id: int, ignore: int) -> dict | None:
+        # mutation, read back and commit share one round trip, MySQL stops at the first failing statement
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE dblog_players SET `ignore` = %s WHERE id = %s;"
+                    "SELECT id, lastName, steamID, `ignore` FROM dblog_players WHERE id = %s;"
+                    "COMMIT",
+                    (ignore, player_id, player_id)
+                )
+                _, updated, _ = self._fetch_results(cursor)
+                return updated[0] if updated else None
+
+    def update_match(self, match_id: int, ignore: int, name: str | None = None) -> dict | None:
+        columns = {"ignore": ignore, "winner": 'UFF' if ignore == 0 else None}
+        if name:
+            columns["displayName"] = name
+        set_clause = ", ".join(f"`{column}` = %s" for column in columns)
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE dblog_matches SET {set_clause} WHERE id = %s;"
+                    "SELECT id, `displayName`, `layerClassname`, `ignore` FROM dblog_matches WHERE id = %s;"
+                    "COMMIT",
+                    (*columns.values(), match_id, match_id)
+                )
+                _, updated, _ = self._fetch_results(cursor)
+                return updated[0] if updated else None
+
+    def add_match(self, map: str, date: str, name: str) -> tuple[int, dict | None]:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # LAST_INSERT_ID() after a CALL is the last insert made inside the procedure
+                cursor.execute(
+                    "call sp_newMatch(%s, %s, 'UFF', %s);"
+                    "SELECT id, `displayName`, `layerClassname` FROM dblog_matches WHERE id = LAST_INSERT_ID();"
+                    "COMMIT",
+                    (map, date, name)
+                )
+                results = self._fetch_results(cursor)
+                new_id = list(results[0][0].values())[0]
+                updated = results[-2]
+                if updated and updated[0]["id"] == new_id:
+                    return new_id, updated[0]
+                # the procedure's last insert was not the match row, read it back separately
+                self.logger.warning(f"sp_newMatch returned id {new_id}, but LAST_INSERT_ID() pointed elsewhere, reading the match separately")
+                cursor.execute("SELECT id, `displayName`, `layerClassname` FROM dblog_matches WHERE id = %s", (new_id,))
+                return new_id, cursor.fetchone()
+
+    def add_match_stats(self, match_id: int, rows: list[tuple]) -> dict[str, str]:
+        """
+        Import stats rows (name, *values) for a match in one transaction.
+        Names are resolved to steamIDs with a single query, sp_addKDWR calls are sent in batches.
+        Raises PlayersNotFoundError (nothing is written) if any name is unknown.
+        Returns the resolved {name: steamID}.
+        """
+        names = list(dict.fromkeys(row[0] for row in rows))
+        # nothing is committed until every batch went through. On any error the pool rolls the transaction back when the connection is released
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                placeholders = ", ".join(["%s"] * len(names))
+                cursor.execute(f"SELECT lastName, steamID FROM dblog_players WHERE lastName IN ({placeholders}) ORDER BY id ASC", names)
+                found = {r["lastName"].lower(): r["steamID"] for r in cursor.fetchall()} # ordered by id, so the newest player with the name wins
+                missing = [name for name in names if name.lower() not in found]
+                if missing:
+                    raise PlayersNotFoundError(missing)
+                steam_ids = {name: found[name.lower()] for name in names}
+                for i in range(0, len(rows), STATS_BATCH_SIZE):
+                    batch = rows[i:i + STATS_BATCH_SIZE]
+                    sql = ";\n".join(["call sp_addKDWR(%s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+                    args = []
+                    for name, *values in batch:
+                        args.extend((match_id, steam_ids[name], *values))
+                    cursor.execute(sql, args)
+                    while cursor.nextset(): # errors of the later calls in the batch surface here
+                        pass
+            conn.commit()
+        return steam_ids
+
+    def add_match_history(self, data: dict) -> dict | None:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"{MATCH_HISTORY_INSERT_SQL};"
+                    "SELECT event_name, `date`, layer, opponent FROM match_history WHERE id = LAST_INSERT_ID();"
+                    "COMMIT",
+                    data
+                )
+                _, existing, _ = self._fetch_results(cursor)
+                return existing[0] if existing else None
+
+    def add_match_history_bulk(self, rows: list[tuple[int, dict]]) -> tuple[list[int], list[tuple[int, str]]]:
+        """
+        rows: (line number, match_history_add dict), inserted in one transaction.
+        Duplicates are rejected per row, any other error rolls the whole import back.
+        Returns (inserted line numbers, [(line number, reject reason)]).
+        """
+        inserted = []
+        rejects = []
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                for line, data in rows:
+                    try:
+                        cursor.execute(MATCH_HISTORY_INSERT_SQL, data)
+                    except pymysql.IntegrityError as e:
+                        if e.args[0] != 1062: # InnoDB only undoes the failed statement on a duplicate key
+                            raise
+                        rejects.append((line, e.args[1]))
+                        continue
+                    inserted.append(line)
+            conn.commit()
+        return inserted, rejects
 
 class GeminiMySqlConnectionManager:
     def __init__(self, logger: logging.Logger):
         self.logger = logger
 
     def conn_server(self, autocommit: bool = False, db_name: str = GEMINI_DB_NAME):
+        if db_name:
+            return get_pool(db_name).acquire(autocommit=autocommit)
+
+        # server level connection (no database selected) is only used for bootstrap, so it is not pooled
         conn_dict = {
             "host":MySQL.get("host"),
             "port":MySQL.get("port", 3306),
             "user":MySQL.get("user"),
             "password":MySQL.get("password"),
-            "cursorclass":pymysql.cursors.DictCursor,
+            "cursorclass":InstrumentedCursor,
             "autocommit": autocommit
         }
-
-        if db_name:
-            conn_dict["database"] = db_name
         
         return pymysql.connect(**conn_dict)
     
@@ -118,6 +673,103 @@ class GeminiMySqlConnectionManager:
                         formatted_data = [(key, *row) for key, row in table_data.items()]
                         cursor.executemany(table_data_init, formatted_data)
     
+    def get_schema_version(self) -> int | None:
+        """
+        Returns the applied schema version, 0 if the db has no version table yet, None if the db does not exist.
+        """
+        try:
+            with self.conn_server(autocommit=True) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT MAX(version) AS version FROM `schema_version`")
+                    return cursor.fetchone()["version"] or 0
+        except pymysql.err.OperationalError as e:
+            if e.args[0] == 1049: # unknown database
+                return None
+            raise
+        except pymysql.err.ProgrammingError as e:
+            if e.args[0] == 1146: # table doesn't exist, db created before the version table
+                return 0
+            raise
+
+    def set_schema_version(self, conn, version: int):
+        with conn.cursor() as cursor:
+            cursor.execute("INSERT INTO `schema_version` (version, applied_at) VALUES (%s, NOW())", (version,))
+
+    def migrate(self) -> bool:
+        """
+        Brings gemini_db up to GEMINI_SCHEMA_VERSION. When the schema is current this is a single query.
+        Returns True if anything was applied.
+        """
+        version = self.get_schema_version()
+        if version == GEMINI_SCHEMA_VERSION:
+            return False
+        if version is None:
+            self.init_db()
+            version = 0
+        if version > GEMINI_SCHEMA_VERSION:
+            self.logger.warning(f"Schema version of {GEMINI_DB_NAME} is {version}, newer than the known {GEMINI_SCHEMA_VERSION}")
+            return False
+        if version < 1:
+            self.init_tables()
+            with self.conn_server(autocommit=True) as conn:
+                self.set_schema_version(conn, 1)
+            version = 1
+        for target in sorted(GEMINI_MIGRATIONS):
+            if target <= version:
+                continue
+            with self.conn_server(autocommit=True) as conn:
+                with conn.cursor() as cursor:
+                    for statement in GEMINI_MIGRATIONS[target]:
+                        cursor.execute(statement)
+                self.set_schema_version(conn, target)
+            self.logger.info(f"Applied {GEMINI_DB_NAME} migration to version {target}")
+        self.logger.info(f"Schema of {GEMINI_DB_NAME} migrated to version {GEMINI_SCHEMA_VERSION}")
+        return True
+
+    def insert_call_metrics(self, rows: list[tuple]):
+        """
+        rows: (timestamp, model, latency_ms, prompt_tokens, cached_tokens, output_tokens, total_tokens, instruction_tokens, finish_reason, streamed)
+        """
+        with self.conn_server(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    """
+                        INSERT INTO `call_metrics` (
+                            timestamp, model, latency_ms, prompt_tokens, cached_tokens, output_tokens,
+                            total_tokens, instruction_tokens, finish_reason, streamed
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    rows
+                )
+
+    def get_call_metrics(self, days: int) -> tuple[list[dict], list[dict]]:
+        """
+        Returns (daily token spend per model, latencies per model) of the last `days` days.
+        """
+        with self.conn_server(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                        SELECT DATE(timestamp) AS day, model, COUNT(*) AS calls,
+                            COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                            COALESCE(SUM(cached_tokens), 0) AS cached_tokens,
+                            COALESCE(SUM(output_tokens), 0) AS output_tokens,
+                            COALESCE(SUM(total_tokens), 0) AS total_tokens
+                        FROM `call_metrics`
+                        WHERE timestamp >= CURDATE() - INTERVAL %s DAY
+                        GROUP BY day, model
+                        ORDER BY day DESC, model
+                    """,
+                    (days - 1,)
+                )
+                daily = cursor.fetchall()
+                cursor.execute(
+                    "SELECT model, latency_ms FROM `call_metrics` WHERE timestamp >= CURDATE() - INTERVAL %s DAY AND latency_ms IS NOT NULL",
+                    (days - 1,)
+                )
+                latencies = cursor.fetchall()
+                return daily, latencies
+
     def get_persistent_context(self):
         with self.conn_server(autocommit=False) as conn:
             with conn.cursor() as cursor:
@@ -126,29 +778,200 @@ class GeminiMySqlConnectionManager:
                 data = cursor.fetchall()
                 return [r["entry"] for r in data]
 
-    def get_temporary_context(self):
-        with self.conn_server(autocommit=False) as conn:
+    def get_temporary_context(self, channel_id: int, limit: int) -> list[tuple]:
+        """
+        Newest `limit` exchanges of a channel, oldest first.
+        """
+        with self.conn_server(autocommit=True) as conn:
             with conn.cursor() as cursor:
                 table_name = 'temporary_message_context'
-                cursor.execute(f'SELECT author, message, response FROM `{table_name}` ORDER BY id ASC')
+                cursor.execute(
+                    f'SELECT author, message, response FROM `{table_name}` WHERE channel_id = %s ORDER BY id DESC LIMIT %s',
+                    (channel_id, limit)
+                )
                 data = cursor.fetchall()
-                return [(r["author"], r["message"], r["response"]) for r in data]
+                return [(r["author"], r["message"], r["response"]) for r in reversed(data)]
     
-    def insert_temporary_context(self, author: str, message: str, response: str):
+    def get_compaction_batch(self, keep_raw: int, batch_size: int) -> list[dict]:
+        """
+        Oldest exchanges beyond the newest keep_raw ones of the channel with the most excess, at most batch_size.
+        """
         with self.conn_server(autocommit=True) as conn:
             with conn.cursor() as cursor:
-                table_name = 'temporary_message_context'
-                sql = 'INSERT INTO `{table}` (timestamp, author, message, response) VALUES (NOW(), %s, %s, %s)'.format(table=table_name)
-                cursor.execute(sql, (author, message, response))
-    
-    def clean_temporary_context(self):
+                cursor.execute(
+                    """
+                        SELECT channel_id, COUNT(*) AS total FROM `temporary_message_context`
+                        WHERE channel_id IS NOT NULL
+                        GROUP BY channel_id
+                        HAVING total > %s
+                        ORDER BY total DESC
+                        LIMIT 1
+                    """,
+                    (keep_raw,)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return []
+                cursor.execute(
+                    """
+                        SELECT id, timestamp, channel_id, author, message, response FROM `temporary_message_context`
+                        WHERE channel_id = %s ORDER BY id ASC LIMIT %s
+                    """,
+                    (row["channel_id"], min(row["total"] - keep_raw, batch_size))
+                )
+                return cursor.fetchall()
+
+    def save_summary(self, batch: list[dict], summary: str):
+        """
+        Stores the summary of a compaction batch and deletes the summarized exchanges, in one transaction.
+        """
+        first, last = batch[0], batch[-1]
+        with self.conn_server(autocommit=False) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                        INSERT INTO `context_summaries` (created, channel_id, first_message_id, last_message_id, first_timestamp, last_timestamp, summary)
+                        VALUES (NOW(), %s, %s, %s, %s, %s, %s)
+                    """,
+                    (first["channel_id"], first["id"], last["id"], first["timestamp"], last["timestamp"], summary)
+                )
+                cursor.execute(
+                    'DELETE FROM `temporary_message_context` WHERE channel_id = %s AND id BETWEEN %s AND %s',
+                    (first["channel_id"], first["id"], last["id"])
+                )
+            conn.commit()
+
+    def get_summaries(self, channel_id: int, limit: int) -> list[str]:
+        """
+        Newest `limit` summaries of a channel, oldest first.
+        """
+        with self.conn_server(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    'SELECT summary FROM `context_summaries` WHERE channel_id = %s ORDER BY id DESC LIMIT %s',
+                    (channel_id, limit)
+                )
+                return [r["summary"] for r in reversed(cursor.fetchall())]
+
+    def insert_temporary_context(self, rows: list[tuple]):
+        """
+        rows: (timestamp, channel_id, author, message, response), written with a single multi-row insert.
+        Nothing is pruned here, exchanges leave the table only once save_summary() folded them into a summary.
+        """
         table_name = 'temporary_message_context'
-        clear_sql = None
-        for table in GEMINI_TABLES:
-            if table.get("name") == table_name:
-                clear_sql = table.get("clean_sql").format(name=table_name, limit=table.get("clean_limit", 500))
-        if clear_sql:
-            with self.conn_server(autocommit=True) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(clear_sql)
-                
+        with self.conn_server(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                sql = 'INSERT INTO `{table}` (timestamp, channel_id, author, message, response) VALUES (%s, %s, %s, %s, %s)'.format(table=table_name)
+                cursor.executemany(sql, rows)
+
+class EventLedgerRepository:
+    """
+    Apollo event signups (gemini_db): signup_events has one row per event message, event_signups one row per member
+    and status field. Written on every parsed embed change, read by the attendance commands. Times are utc.
+    Methods are blocking, call them through run_db().
+    """
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def record_event(
+        self,
+        event_message_id: int,
+        channel_id: int,
+        event_time,
+        added: list[tuple[int, str, str]],
+        removed: list[tuple[int, str]],
+        replace: bool = False
+    ):
+        """
+        added: (member_id, status, label), removed: (member_id, status). replace drops every stored signup of the event first,
+        for events whose previous roster is not known. One transaction.
+        """
+        with get_pool(GEMINI_DB_NAME).acquire() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                        INSERT INTO `signup_events` (event_message_id, channel_id, event_time, synced_at) VALUES (%s, %s, %s, UTC_TIMESTAMP())
+                        ON DUPLICATE KEY UPDATE channel_id = VALUES(channel_id), event_time = VALUES(event_time), synced_at = UTC_TIMESTAMP()
+                    """,
+                    (event_message_id, channel_id, event_time)
+                )
+                if replace:
+                    cursor.execute('DELETE FROM `event_signups` WHERE event_message_id = %s', (event_message_id,))
+                elif removed:
+                    cursor.executemany(
+                        'DELETE FROM `event_signups` WHERE event_message_id = %s AND member_id = %s AND status = %s',
+                        [(event_message_id, member_id, status) for member_id, status in removed]
+                    )
+                if added:
+                    cursor.executemany(
+                        """
+                            INSERT INTO `event_signups` (event_message_id, channel_id, event_time, member_id, status, label, updated_at)
+                            VALUES (%s, %s, %s, %s, %s, %s, UTC_TIMESTAMP())
+                            ON DUPLICATE KEY UPDATE label = VALUES(label), updated_at = UTC_TIMESTAMP()
+                        """,
+                        [(event_message_id, channel_id, event_time, member_id, status, label) for member_id, status, label in added]
+                    )
+                # a moved event time applies to the signups that did not change as well
+                cursor.execute(
+                    'UPDATE `event_signups` SET event_time = %s WHERE event_message_id = %s AND NOT event_time <=> %s',
+                    (event_time, event_message_id, event_time)
+                )
+            conn.commit()
+
+    def delete_event(self, event_message_id: int):
+        with get_pool(GEMINI_DB_NAME).acquire() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM `event_signups` WHERE event_message_id = %s', (event_message_id,))
+                cursor.execute('DELETE FROM `signup_events` WHERE event_message_id = %s', (event_message_id,))
+            conn.commit()
+
+    def delete_channel_events(self, channel_id: int):
+        with get_pool(GEMINI_DB_NAME).acquire() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM `event_signups` WHERE channel_id = %s', (channel_id,))
+                cursor.execute('DELETE FROM `signup_events` WHERE channel_id = %s', (channel_id,))
+            conn.commit()
+
+    def get_event(self, event_message_id: int) -> tuple[dict, list[dict]] | None:
+        """
+        (signup_events row, signup rows) of an event, None if it is not in the ledger.
+        """
+        with get_pool(GEMINI_DB_NAME).acquire(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    'SELECT event_message_id, channel_id, event_time, synced_at FROM `signup_events` WHERE event_message_id = %s',
+                    (event_message_id,)
+                )
+                event = cursor.fetchone()
+                if event is None:
+                    return None
+                cursor.execute(
+                    'SELECT member_id, status, label FROM `event_signups` WHERE event_message_id = %s',
+                    (event_message_id,)
+                )
+                return event, cursor.fetchall()
+
+    def get_events(self, event_message_ids: list[int]) -> list[dict]:
+        if not event_message_ids:
+            return []
+        with get_pool(GEMINI_DB_NAME).acquire(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    'SELECT event_message_id, channel_id, event_time, synced_at FROM `signup_events` WHERE event_message_id IN %s',
+                    (event_message_ids,)
+                )
+                return cursor.fetchall()
+
+    def get_member_signups(self, member_id: int, event_message_ids: list[int]) -> list[dict]:
+        if not event_message_ids:
+            return []
+        with get_pool(GEMINI_DB_NAME).acquire(autocommit=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                        SELECT event_message_id, channel_id, status, label FROM `event_signups`
+                        WHERE member_id = %s AND event_message_id IN %s
+                    """,
+                    (member_id, event_message_ids)
+                )
+                return cursor.fetchall()
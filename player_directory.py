@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from mysql_helper import GrafanaMySqlRepository, run_db
+
+REFRESH_INTERVAL = 60 # seconds between incremental reloads of new players
+LOAD_PAGE_SIZE = 20000 # rows fetched per db call, keeps the first full load within the query timeout
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class PlayerDirectory:
+    """
+    In-memory copy of dblog_players (id, lastName, steamID) for name/steamID lookups and autocomplete.
+    New players are picked up incrementally by id. Names of already loaded players are not re-read.
+    Lookups are synchronous, call ensure_fresh() first to pick up new players.
+    """
+    def __init__(self, repository: GrafanaMySqlRepository, logger: logging.Logger, refresh_interval: float = REFRESH_INTERVAL):
+        self.repository = repository
+        self.logger = logger
+        self.refresh_interval = refresh_interval
+        self._players: dict[int, dict] = {}
+        self._names: dict[int, str] = {} # id -> casefolded lastName
+        self._by_steam_id: dict[str, set[int]] = defaultdict(set)
+        self._by_trigram: dict[str, set[int]] = defaultdict(set)
+        self._max_id = 0
+        self._last_refresh = None
+        self._refresh_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._players)
+
+    def _add(self, row: dict):
+        player_id = row["id"]
+        name = (row["lastName"] or "").casefold()
+        self._players[player_id] = row
+        self._names[player_id] = name
+        if row["steamID"]:
+            self._by_steam_id[row["steamID"]].add(player_id)
+        for trigram in _trigrams(name):
+            self._by_trigram[trigram].add(player_id)
+        self._max_id = max(self._max_id, player_id)
+
+    def is_stale(self) -> bool:
+        return self._last_refresh is None or time.monotonic() - self._last_refresh > self.refresh_interval
+
+    async def ensure_fresh(self, force: bool = False) -> int:
+        """
+        Load players newer than the newest loaded id, if the last refresh is older than refresh_interval (or force).
+        Returns the amount of players added.
+        """
+        if not force and not self.is_stale():
+            return 0
+        async with self._refresh_lock:
+            if not force and not self.is_stale(): # refreshed while waiting for the lock
+                return 0
+            added = 0
+            while True:
+                rows = await run_db(self.repository.get_players_after, self._max_id, LOAD_PAGE_SIZE)
+                for row in rows: # applied on the event loop, so lookups never see a half updated index
+                    self._add(row)
+                added += len(rows)
+                if len(rows) < LOAD_PAGE_SIZE:
+                    break
+            self._last_refresh = time.monotonic()
+            if added:
+                self.logger.info(f"Player directory loaded {added} new player(s), {len(self._players)} total")
+            return added
+
+    def get(self, player_id: int) -> dict | None:
+        return self._players.get(player_id)
+
+    def by_steam_id(self, steam_id: str) -> list[dict]:
+        return [self._players[player_id] for player_id in sorted(self._by_steam_id.get(steam_id, ()))]
+
+    def search(self, name: str, limit: int | None = None) -> list[dict]:
+        """
+        Case-insensitive substring match on lastName (same as LIKE '%name%'), ordered by id.
+        """
+        query = name.casefold()
+        trigrams = _trigrams(query)
+        if trigrams:
+            candidate_sets = sorted((self._by_trigram.get(trigram, set()) for trigram in trigrams), key=len)
+            candidates = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+        else: # shorter than a trigram, nothing to narrow down with
+            candidates = self._names.keys()
+        matches = sorted(player_id for player_id in candidates if query in self._names[player_id])
+        if limit is not None:
+            matches = matches[:limit]
+        return [self._players[player_id] for player_id in matches]
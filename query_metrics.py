@@ -0,0 +1,144 @@
+import bisect
+import logging
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000) # upper bounds, the last bucket is everything above
+FINGERPRINT_MAX_LEN = 80
+
+slow_query_logger = logging.getLogger("mysql.slow")
+slow_query_logger.propagate = False # written to its own file, see main.py
+
+_context = threading.local()
+
+@contextmanager
+def query_label(label: str):
+    """
+    Names the statements executed in this thread, run_db() labels every call with the qualified name of the db function.
+    """
+    previous = getattr(_context, "label", None)
+    _context.label = label
+    try:
+        yield
+    finally:
+        _context.label = previous
+
+def current_label() -> str:
+    return getattr(_context, "label", None) or "unlabeled"
+
+_literals = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+\b")
+_whitespace = re.compile(r"\s+")
+_value_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_repeated_lists = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+def fingerprint(query: str) -> str:
+    """
+    Statement shape without literals, so calls with different arguments share one entry:
+    "call sp_addKDWR(12, 'x', 1)" -> "call sp_addKDWR(?)"
+    """
+    text = _whitespace.sub(" ", _literals.sub("?", query)).strip()
+    text = _repeated_lists.sub("(?)", _value_lists.sub("(?)", text))
+    if len(text) > FINGERPRINT_MAX_LEN:
+        text = f"{text[:FINGERPRINT_MAX_LEN - 3]}..."
+    return text
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, p: float) -> float:
+        """
+        Upper bound of the bucket holding the p-th percentile (max_ms for the overflow bucket).
+        """
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index, amount in enumerate(self.buckets):
+            seen += amount
+            if seen >= rank and amount:
+                return min(LATENCY_BUCKETS_MS[index], self.max_ms) if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+class StatementStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+class QueryStats:
+    """
+    Per statement latency histograms and row counts, keyed by (label, fingerprint), plus pool acquire times per database.
+    Updated from the db executor threads.
+    """
+    def __init__(self, slow_threshold_ms: float):
+        self.slow_threshold_ms = slow_threshold_ms
+        self._lock = threading.Lock()
+        self._statements: dict[tuple[str, str], StatementStats] = defaultdict(StatementStats)
+        self._acquire: dict[str, Histogram] = defaultdict(Histogram)
+
+    def record(self, query: str, elapsed_ms: float, rows: int, failed: bool = False):
+        label = current_label()
+        key = (label, fingerprint(query))
+        with self._lock:
+            stats = self._statements[key]
+            stats.latency.add(elapsed_ms)
+            stats.rows += max(rows, 0)
+            stats.errors += failed
+        if elapsed_ms >= self.slow_threshold_ms:
+            slow_query_logger.warning(f"{elapsed_ms:.0f} ms, {rows} row(s){', failed' if failed else ''} [{label}]: {_whitespace.sub(' ', query).strip()}")
+
+    def record_acquire(self, database: str, elapsed_ms: float):
+        with self._lock:
+            self._acquire[database].add(elapsed_ms)
+
+    def top(self, limit: int = 10) -> list[dict]:
+        """
+        Statements with the highest total time first.
+        """
+        with self._lock:
+            entries = [
+                {
+                    "label": label,
+                    "statement": statement,
+                    "count": stats.latency.count,
+                    "total_ms": stats.latency.total_ms,
+                    "p50_ms": stats.latency.percentile(50),
+                    "p95_ms": stats.latency.percentile(95),
+                    "max_ms": stats.latency.max_ms,
+                    "rows": stats.rows,
+                    "errors": stats.errors
+                }
+                for (label, statement), stats in self._statements.items()
+            ]
+        entries.sort(key=lambda entry: entry["total_ms"], reverse=True)
+        return entries[:limit]
+
+    def acquire_summary(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "database": database,
+                    "count": histogram.count,
+                    "p50_ms": histogram.percentile(50),
+                    "p95_ms": histogram.percentile(95),
+                    "max_ms": histogram.max_ms
+                }
+                for database, histogram in sorted(self._acquire.items())
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._acquire.clear()
@@ -0,0 +1,104 @@
+import logging
+from collections import OrderedDict
+import discord
+from gemini_context import estimate_tokens
+
+FETCHED_CACHE_SIZE = 256 # messages fetched over REST kept for the next walks
+
+class MessageLRU:
+    """
+    Bounded cache of messages fetched over REST, for hops that are neither resolved nor in the client's message cache.
+    """
+    def __init__(self, max_size: int = FETCHED_CACHE_SIZE):
+        self.max_size = max_size
+        self._messages: OrderedDict[int, discord.Message] = OrderedDict()
+        self.hits = 0
+        self.fetches = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def get(self, message_id: int) -> discord.Message | None:
+        message = self._messages.get(message_id)
+        if message is not None:
+            self._messages.move_to_end(message_id)
+            self.hits += 1
+        return message
+
+    def put(self, message: discord.Message):
+        self._messages[message.id] = message
+        self._messages.move_to_end(message.id)
+        while len(self._messages) > self.max_size:
+            self._messages.popitem(last=False)
+
+    def refresh(self, message: discord.Message):
+        """
+        Replaces a cached message with its edited version, messages that are not cached stay uncached.
+        """
+        if message.id in self._messages:
+            self._messages[message.id] = message
+
+    def discard(self, message_id: int):
+        self._messages.pop(message_id, None)
+
+async def resolve_reference(message: discord.Message, fetched: MessageLRU, logger: logging.Logger) -> discord.Message | None:
+    """
+    Message that `message` replies to: the one resolved by discord, the client's cache, `fetched`, and only then a REST call.
+    None if it is not a reply or the message is gone.
+    """
+    reference = message.reference
+    if reference is None or reference.message_id is None:
+        return None
+    if isinstance(reference.resolved, discord.Message):
+        return reference.resolved
+    if isinstance(reference.resolved, discord.DeletedReferencedMessage):
+        return None
+    cached = reference.cached_message or fetched.get(reference.message_id)
+    if cached is not None:
+        return cached
+    channel = message.channel
+    if reference.channel_id != channel.id:
+        channel = message.guild.get_channel_or_thread(reference.channel_id) if message.guild else None
+        if channel is None:
+            return None
+    try:
+        replied = await channel.fetch_message(reference.message_id)
+    except discord.NotFound:
+        return None
+    except Exception as e:
+        logger.warning(f"Could not fetch replied message {reference.message_id}: {e}")
+        return None
+    fetched.fetches += 1
+    fetched.put(replied)
+    return replied
+
+async def build_reply_chain(
+    message: discord.Message,
+    fetched: MessageLRU,
+    logger: logging.Logger,
+    *,
+    max_depth: int,
+    token_budget: int,
+    first: discord.Message | None = None
+) -> list[discord.Message]:
+    """
+    Messages up the reply chain of `message`, oldest first, at most max_depth of them and as many as fit into token_budget
+    (estimated tokens, older hops are dropped beyond it). Both come from GeminiOptions through the caller.
+    first: the directly replied-to message when it was resolved already.
+    """
+    chain = []
+    seen = {message.id}
+    tokens = 0
+    current = first or await resolve_reference(message, fetched, logger)
+    while current is not None and current.id not in seen:
+        cost = estimate_tokens(current.content)
+        if chain and tokens + cost > token_budget: # the direct reply is always kept
+            break
+        chain.append(current)
+        seen.add(current.id)
+        tokens += cost
+        if len(chain) >= max_depth:
+            break
+        current = await resolve_reference(current, fetched, logger)
+    chain.reverse()
+    return chain
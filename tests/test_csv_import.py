@@ -0,0 +1,27 @@
+from csv_import import read_rows
+
+ROW = ["01.02.2025", "layer_v1", "{opponent}", "-", "100/20", "80/90", "https://discord.com/channels/1/2", "youtube", "{tactics}"]
+
+def make_csv(delimiter: str, opponent: str = "CSL", tactics: str = "rush") -> str:
+    return "\n".join(delimiter.join(ROW).format(opponent=opponent, tactics=tactics) for _ in range(3)) + "\n"
+
+def test_comma_separated():
+    rows = read_rows(make_csv(","), 9)
+    assert len(rows) == 3 and all(len(row) == 9 for row in rows)
+
+def test_tab_separated():
+    rows = read_rows(make_csv("\t"), 9)
+    assert rows[0][2] == "CSL" and all(len(row) == 9 for row in rows)
+
+def test_semicolon_with_commas_in_values():
+    text = make_csv(";", opponent="Foo, Bar", tactics="rush, then hold, then push")
+    rows = read_rows(text, 9)
+    assert all(len(row) == 9 for row in rows)
+    assert rows[0][2] == "Foo, Bar"
+    assert rows[0][8] == "rush, then hold, then push"
+
+def test_keeps_blank_and_broken_lines_for_the_caller():
+    text = make_csv(";") + "\n" + "01.02.2025;only;three\n"
+    rows = read_rows(text, 9)
+    filled = [row for row in rows if row]
+    assert [len(row) for row in filled] == [9, 9, 9, 3]
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import pytest
+from google.genai.errors import ClientError
+from gemini_cache import LocalCacheBackend, PrefixCache, is_stale_cache_error
+
+MODEL = "gemini-test"
+PREFIX = ["persistent one", "persistent two"]
+
+def make_cache(**kwargs) -> tuple[LocalCacheBackend, PrefixCache]:
+    backend = LocalCacheBackend()
+    return backend, PrefixCache(backend, logging.getLogger("test"), **kwargs)
+
+def stale_error(code: int = 404, message: str = "CachedContent not found") -> ClientError:
+    return ClientError(code, {"error": {"code": code, "message": message, "status": "NOT_FOUND"}})
+
+def test_creates_once_and_reuses():
+    backend, cache = make_cache(ttl=3600, refresh_margin=300)
+    async def run():
+        return await cache.get(MODEL, PREFIX, 100), await cache.get(MODEL, PREFIX, 100)
+    first, second = asyncio.run(run())
+    assert first == second
+    assert [operation for operation, _ in backend.calls] == ["create"]
+    assert backend.entries[first] == (MODEL, PREFIX)
+
+def test_refreshes_close_to_expiry():
+    backend, cache = make_cache(ttl=60, refresh_margin=120) # every lookup is within the margin
+    async def run():
+        return await cache.get(MODEL, PREFIX, 100), await cache.get(MODEL, PREFIX, 100)
+    first, second = asyncio.run(run())
+    assert first == second
+    assert backend.calls == [("create", first), ("refresh", first)]
+
+def test_changed_prefix_replaces_the_cached_one():
+    backend, cache = make_cache()
+    async def run():
+        return await cache.get(MODEL, PREFIX, 100), await cache.get(MODEL, [*PREFIX, "new entry"], 100)
+    old, new = asyncio.run(run())
+    assert old != new
+    assert ("delete", old) in backend.calls
+    assert list(backend.entries) == [new]
+
+def test_invalidate_creates_a_new_cache():
+    backend, cache = make_cache()
+    async def run():
+        old = await cache.get(MODEL, PREFIX, 100)
+        await cache.invalidate(old)
+        return old, await cache.get(MODEL, PREFIX, 100)
+    old, new = asyncio.run(run())
+    assert old != new
+    assert [operation for operation, _ in backend.calls] == ["create", "create"]
+
+def test_small_prefix_is_sent_inline():
+    backend, cache = make_cache(min_tokens=1024)
+    assert asyncio.run(cache.get(MODEL, PREFIX, 100)) is None
+    assert backend.calls == []
+
+def test_stale_cache_is_retried_inline():
+    _, cache = make_cache()
+    sent = []
+    async def request(cached_content):
+        sent.append(cached_content)
+        if cached_content:
+            raise stale_error()
+        return "response"
+    async def run():
+        name = await cache.get(MODEL, PREFIX, 100)
+        return name, await cache.run(name, request), await cache.get(MODEL, PREFIX, 100)
+    name, response, recreated = asyncio.run(run())
+    assert response == "response"
+    assert sent == [name, None]
+    assert recreated != name # the stale one was dropped
+
+def test_bad_request_is_not_retried():
+    _, cache = make_cache()
+    sent = []
+    async def request(cached_content):
+        sent.append(cached_content)
+        raise stale_error(400, "Invalid value at 'generation_config.temperature'")
+    with pytest.raises(ClientError):
+        asyncio.run(cache.run("cachedContents/local-1", request))
+    assert sent == ["cachedContents/local-1"]
+
+def test_stale_cache_errors():
+    assert is_stale_cache_error(stale_error(404), "cachedContents/1")
+    assert is_stale_cache_error(stale_error(403, "Permission denied on resource"), "cachedContents/1")
+    assert is_stale_cache_error(stale_error(400, "Cached content is expired"), "cachedContents/1")
+    assert not is_stale_cache_error(stale_error(400, "Request contains an invalid argument"), "cachedContents/1")
+    assert not is_stale_cache_error(stale_error(404), None)
+    assert not is_stale_cache_error(RuntimeError("boom"), "cachedContents/1")
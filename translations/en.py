@@ -84,6 +84,14 @@ MATCH_HISTORY_ADD_SUCCESS_EVENT_NAME = "Match name"
 MATCH_HISTORY_ADD_SUCCESS_DATE = "Match date"
 MATCH_HISTORY_ADD_SUCCESS_LAYER ="Layer"
 MATCH_HISTORY_ADD_SUCCESS_OPPONENT = "Opponent"
+MATCH_HISTORY_ADD_BULK_DESCRIPTION = "Adds match records into match history table of Grafana from a CSV file"
+MATCH_HISTORY_ADD_BULK_DATA_DESCRIPTION = "CSV file, every line in match_history_add format"
+MATCH_HISTORY_ADD_BULK_SUCCESS_TEXT = "Successfully added match records"
+MATCH_HISTORY_ADD_BULK_REJECTED = "Rejected lines"
+MATCH_HISTORY_ADD_BULK_LINE = "Line"
+MATCH_HISTORY_ADD_BULK_ERROR_NOT_CSV = f"{ERROR_GENERIC}: File is not CSV"
+MATCH_HISTORY_ADD_BULK_ERROR_PARSING_CSV = f"{ERROR_GENERIC}: Failed to parse CSV file, expected columns separated by comma, semicolon or tab"
+MATCH_HISTORY_ADD_BULK_ERROR_EMPTY_CSV = f"{ERROR_GENERIC}: CSV file doesn't have any match records"
 
 AUTOPOST_ENABLE_DESCRIPTION = "Turns on and off autoposting for seeding announcements"
 AUTOPOST_ENABLE_STATUS_DESCRIPTION = "On\Off"
@@ -136,6 +144,7 @@ GRAFANA_ADD_STATS_ERROR_GETTING_QUERIES = f"{ERROR_GENERIC}: Failed to create qu
 GRAFANA_ADD_STATS_SUCCESS = "Successfully added records from CSV file"
 GRAFANA_ADD_STATS_MATCH_ID_STR = "Match ID"
 GRAFANA_ADD_STATS_QUERIES_STR = "Database queries"
+GRAFANA_ADD_STATS_ERROR_UNKNOWN_PLAYERS = f"{ERROR_GENERIC}: players not found in the database, no records were added"
 
 COUNT_ATTENDANCE_DESCRIPTION = "Counts Apollo event responses for given user from given time in given category"
 COUNT_ATTENDANCE_CATEGORY_VARIABLE = "Category with events, which to count for attendance"
@@ -198,6 +207,20 @@ REBOOT_SERVER_ERROR_NOT_EMPTY = f"{ERROR_GENERIC}: Server is not empty, please t
 REBOOT_SERVER_ERROR_NOT_FOUND = f"{ERROR_GENERIC}: Server not found, please use the values from autocomplete"
 REBOOT_SERVER_ERROR_IN_PROGRESS = f"{ERROR_GENERIC}: Server is already restarting, please try again later"
 REBOOT_SERVER_SUCCESS = "Successfully sent reboot request to the server"
+DB_STATS_DESCRIPTION = "Shows the slowest database statements since the bot started"
+DB_STATS_LIMIT = "Amount of statements to list (up to 50)"
+DB_STATS_RESET = "Clear the statistics after showing them"
+DB_STATS_EMPTY = "No statement statistics yet"
+DB_STATS_TOP_STATEMENTS = "Statements by total time"
+DB_STATS_POOL_ACQUIRE = "Pool connection acquire time"
+DB_STATS_RESET_DONE = "Statistics were cleared"
+GEMINI_STATS_DESCRIPTION = "Shows latency and token spend of Gemini requests"
+GEMINI_STATS_DAYS = "Amount of days (up to 90)"
+GEMINI_STATS_EMPTY = "No Gemini requests recorded yet"
+GEMINI_STATS_LATENCY = "Response latency"
+GEMINI_STATS_DAYS_SUFFIX = "days"
+GEMINI_STATS_TOKENS = "Daily token spend"
+GEMINI_STATS_REPLY_CHAIN_CACHE = "Replied-to messages cache"
 
 HONEYPOT_AUTOBAN_BLACKLIST_DM = "Your message was deleted, but you weren't banned, because you have one of the protected roles ({reason})"
 HONEYPOT_AUTOBAN_REASON_CHANNEL_POST = "posted in autoban channel"
@@ -84,6 +84,14 @@ MATCH_HISTORY_ADD_SUCCESS_EVENT_NAME = "Ім'я матчу"
 MATCH_HISTORY_ADD_SUCCESS_DATE = "Дата матчу"
 MATCH_HISTORY_ADD_SUCCESS_LAYER ="Леєр"
 MATCH_HISTORY_ADD_SUCCESS_OPPONENT = "Противник"
+MATCH_HISTORY_ADD_BULK_DESCRIPTION = "Додає записи про проведені скріми в таблицю графани з CSV файлу"
+MATCH_HISTORY_ADD_BULK_DATA_DESCRIPTION = "CSV файл, кожен рядок у форматі match_history_add"
+MATCH_HISTORY_ADD_BULK_SUCCESS_TEXT = "Успішно додано записів про матчі"
+MATCH_HISTORY_ADD_BULK_REJECTED = "Відхилено рядків"
+MATCH_HISTORY_ADD_BULK_LINE = "Рядок"
+MATCH_HISTORY_ADD_BULK_ERROR_NOT_CSV = f"{ERROR_GENERIC}: Файл не є CSV"
+MATCH_HISTORY_ADD_BULK_ERROR_PARSING_CSV = f"{ERROR_GENERIC}: Не вдалося обробити CSV файл, очікуються колонки розділені комою, крапкою з комою або табуляцією"
+MATCH_HISTORY_ADD_BULK_ERROR_EMPTY_CSV = f"{ERROR_GENERIC}: Файл CSV не містить записів про матчі"
 
 AUTOPOST_ENABLE_DESCRIPTION = "Включає та виключає автоматичний постинг зазовів на сідінг"
 AUTOPOST_ENABLE_STATUS_DESCRIPTION = "Вкл\Викл"
@@ -136,6 +144,7 @@ GRAFANA_ADD_STATS_ERROR_GETTING_QUERIES = f"{ERROR_GENERIC}: Не вдалося
 GRAFANA_ADD_STATS_SUCCESS = "Успішно додано записи із CSV файлу"
 GRAFANA_ADD_STATS_MATCH_ID_STR = "Ідентифікатор матчу"
 GRAFANA_ADD_STATS_QUERIES_STR = "Запити до бази даних"
+GRAFANA_ADD_STATS_ERROR_UNKNOWN_PLAYERS = f"{ERROR_GENERIC}: гравців не знайдено в базі даних, жодного запису не додано"
 
 COUNT_ATTENDANCE_DESCRIPTION = "Рахує відмітки користувача на івенти Apollo в наданій категорії починаючи з наданої дати"
 COUNT_ATTENDANCE_CATEGORY_VARIABLE = "Категорія з івентами, які рахувати для відміткок"
@@ -198,6 +207,20 @@ REBOOT_SERVER_ERROR_NOT_EMPTY = f"{ERROR_GENERIC}: Сервер не порож
 REBOOT_SERVER_ERROR_NOT_FOUND = f"{ERROR_GENERIC}: Сервер не знайдено, будь-ласка використовуйте значення із запропонованих"
 REBOOT_SERVER_ERROR_IN_PROGRESS = f"{ERROR_GENERIC}: Сервер в процесі перезапуску, будь-ласка спробуйте пізніше"
 REBOOT_SERVER_SUCCESS = "Успішно відправлено запит на перезавантаження сервера"
+DB_STATS_DESCRIPTION = "Показує найповільніші запити до бази даних з моменту запуску бота"
+DB_STATS_LIMIT = "Кількість запитів у списку (до 50)"
+DB_STATS_RESET = "Очистити статистику після показу"
+DB_STATS_EMPTY = "Статистики запитів ще немає"
+DB_STATS_TOP_STATEMENTS = "Запити за сумарним часом"
+DB_STATS_POOL_ACQUIRE = "Очікування з'єднання з пулу"
+DB_STATS_RESET_DONE = "Статистику очищено"
+GEMINI_STATS_DESCRIPTION = "Показує затримку та витрату токенів запитів до Gemini"
+GEMINI_STATS_DAYS = "Кількість днів (до 90)"
+GEMINI_STATS_EMPTY = "Ще немає записаних запитів до Gemini"
+GEMINI_STATS_LATENCY = "Затримка відповіді"
+GEMINI_STATS_DAYS_SUFFIX = "днів"
+GEMINI_STATS_TOKENS = "Витрата токенів по днях"
+GEMINI_STATS_REPLY_CHAIN_CACHE = "Кеш повідомлень, на які відповідали"
 
 HONEYPOT_AUTOBAN_BLACKLIST_DM = "Твоє повідомлення було видалено, але тебе не забанило, оскільки ти маєш одну із захищених ролей ({reason})"
 HONEYPOT_AUTOBAN_REASON_CHANNEL_POST = "повідомлення в каналі автобану"